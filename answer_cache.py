@@ -0,0 +1,75 @@
+from query_cache import normalize_query
+import hashlib, json, sqlite3, threading, time
+
+ANSWER_CACHE_PATH = "./answer_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+def answer_key(model, system_message, context, question):
+    context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+    payload = json.dumps([model, system_message, context_hash, normalize_query(question)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """Persistent cache of LLM answers keyed on (model, system message, context hash, normalised question).
+
+    A hit means the same model would receive exactly the same prompt, so the
+    stored answer is returned instead of running another generation. Entries
+    expire after `ttl_seconds`, and beyond `max_entries` the least recently
+    used are removed.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, generation_seconds REAL, created_at REAL, last_used REAL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+
+    def get(self, model, system_message, context, question):
+        """Return the cached answer as a dict with `response` and `generation_seconds`, or None."""
+        key = answer_key(model, system_message, context, question)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, generation_seconds, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            with self._connection:
+                self._connection.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return {"response": row[0], "generation_seconds": row[1]}
+
+    def put(self, model, system_message, context, question, response, generation_seconds=None):
+        key = answer_key(model, system_message, context, question)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO answers (key, model, response, generation_seconds, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, generation_seconds, now, now)
+            )
+            self._connection.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._connection.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM answers")
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {"entries": entries, "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
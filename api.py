@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+HTTP query API for Scraper2Notebook
+
+Lets other services query the knowledge base without going through the
+Streamlit app. Endpoints:
+
+    GET  /health          - status, index generation, queue depths and embedding batches
+    GET  /filters         - source types, repos and subreddits that requests can filter on
+    GET  /metrics         - per-stage latency histograms in the Prometheus text format
+    GET  /models          - installed models, models loaded in Ollama and background preloads
+    POST /retrieve        - retrieved chunks for a question
+    POST /answer          - retrieve, pack and answer in one response
+    POST /answer/stream   - the same, streamed as newline-delimited JSON
+
+Every model gets a fixed number of concurrent generations. Requests beyond
+that wait in a bounded queue for up to QUEUE_TIMEOUT_SECONDS; when the queue
+is full or the wait times out the API answers 503 with a Retry-After header
+instead of piling more work onto Ollama. Retrieval is limited the same way.
+
+Usage: uvicorn api:app --host 0.0.0.0 --port 8000
+       python api.py [--host HOST] [--port PORT]
+Set OLLAMA_HOST to point at another Ollama server (e.g. fake_ollama.py).
+"""
+
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from answer_cache import AnswerCache
+from config_snapshot import get_agent_table
+from converse import Converse, WEB_SEARCH_ENABLED, warm_up_in_background
+from model_manager import get_model_manager
+from model_router import get_model_router
+from search_filters import SearchFilters
+from tracing import configure_query_log, get_tracer, span, use_trace
+from web_search import get_web_search
+import argparse, asyncio, json, logging, time
+
+# Generations run at once per model; Ollama serialises beyond its own OLLAMA_NUM_PARALLEL anyway
+MAX_CONCURRENT_PER_MODEL = 2
+# Requests allowed to wait for a model slot before new ones are turned away
+MAX_QUEUED_PER_MODEL = 16
+QUEUE_TIMEOUT_SECONDS = 30
+# Retrievals (embedding + Chroma + BM25) run in worker threads
+MAX_CONCURRENT_RETRIEVALS = 4
+MAX_QUEUED_RETRIEVALS = 32
+# Upper bound on one answer, queueing excluded
+REQUEST_TIMEOUT_SECONDS = 120
+RETRY_AFTER_SECONDS = 5
+
+configure_query_log('query_log.txt')
+
+class ConcurrencyLimiter:
+    """Per-key semaphores with a bounded, time-limited wait queue in front of each."""
+
+    def __init__(self, name, max_concurrent, max_queued, queue_timeout=QUEUE_TIMEOUT_SECONDS):
+        # the wait is traced as the "queue.<name>" span
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphores = {}
+        self._waiting = {}
+        self._running = {}
+
+    async def acquire(self, key):
+        """Wait for a slot for `key`; raises 503 if the queue is full or the wait times out."""
+        semaphore = self._semaphores.setdefault(key, asyncio.Semaphore(self.max_concurrent))
+        if semaphore.locked() and self._waiting.get(key, 0) >= self.max_queued:
+            raise overloaded(f"Too many queued requests for '{key}'")
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            with span(f"queue.{self.name}"):
+                await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise overloaded(f"Timed out after {self.queue_timeout}s waiting for '{key}'")
+        finally:
+            self._waiting[key] -= 1
+        self._running[key] = self._running.get(key, 0) + 1
+
+    def release(self, key):
+        self._running[key] -= 1
+        self._semaphores[key].release()
+
+    @asynccontextmanager
+    async def slot(self, key):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def waiting(self, key):
+        return self._waiting.get(key, 0)
+
+    def stats(self):
+        return {key: {"running": self._running.get(key, 0), "waiting": self._waiting.get(key, 0)} for key in self._semaphores}
+
+class ClosingStreamingResponse(StreamingResponse):
+    """A `StreamingResponse` that calls `on_close` once it stops sending, however it stops.
+
+    Starlette calls the response even when the client is already gone, but the
+    body generator only runs once the headers are sent, so cleanup that must
+    happen belongs here rather than in the generator's `finally`.
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+def overloaded(detail):
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+class Filters(BaseModel):
+    # see search_filters.SearchFilters; empty lists and None mean no restriction
+    sources: List[str] = []
+    repos: List[str] = []
+    subreddits: List[str] = []
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    min_score: Optional[int] = None
+
+class RetrieveRequest(BaseModel):
+    question: str
+    filters: Optional[Filters] = None
+    # merge web results into the documents; defaults to converse.WEB_SEARCH_ENABLED
+    web_search: Optional[bool] = None
+
+class AnswerRequest(BaseModel):
+    question: str
+    filters: Optional[Filters] = None
+    web_search: Optional[bool] = None
+    # defaults to the model selected in the Streamlit sidebar (db.json), routed between it and the fast model
+    model: Optional[str] = None
+    use_cache: bool = True
+
+model_limiter = ConcurrencyLimiter("model", MAX_CONCURRENT_PER_MODEL, MAX_QUEUED_PER_MODEL)
+retrieval_limiter = ConcurrencyLimiter("retrieval", MAX_CONCURRENT_RETRIEVALS, MAX_QUEUED_RETRIEVALS)
+state = {}
+
+@asynccontextmanager
+async def lifespan(app):
+    # load the embedders, stores and Ollama client before accepting traffic
+    agent_row = get_agent_table().first()
+    state["retrieval_service"] = await asyncio.wrap_future(warm_up_in_background(agent_row["model"] if agent_row else None))
+    state["answer_cache"] = AnswerCache()
+    # requests queued here count towards the router's fast-model saturation check
+    get_model_router().queue_depth = model_limiter.waiting
+    yield
+
+app = FastAPI(title="Scraper2Notebook API", lifespan=lifespan)
+
+def agent_config(model=None):
+    rows = get_agent_table().rows()
+    if not rows:
+        raise HTTPException(status_code=500, detail="No agent configuration in db.json. Run the Streamlit app or setup.py first.")
+    config = dict(rows[0])
+    if model:
+        config["model"] = model
+    return config
+
+def new_conversation(web_search=None):
+    service = state["retrieval_service"]
+    use_web_search = WEB_SEARCH_ENABLED if web_search is None else web_search
+    # one Converse per request: `last_cache_hit` is per answer
+    return Converse(
+        embedding_function=service.embedding_function,
+        vectorstore=service.vectorstore,
+        retriever=service.retriever,
+        answer_cache=state["answer_cache"],
+        retrieval_service=service,
+        web_search=get_web_search() if use_web_search else False
+    )
+
+def serialize(docs):
+    return [{"content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+def search_filters(filters):
+    return SearchFilters.from_dict(filters.model_dump()) if filters is not None else None
+
+async def retrieve_and_pack(conversation, question, config, filters=None, route=True):
+    """Retrieve, pick the answering model unless the caller chose one, and pack; returns (config, packed)."""
+    async with retrieval_limiter.slot("retrieval"):
+        docs = await asyncio.to_thread(conversation.retrieve, question, search_filters(filters))
+        if route:
+            config = conversation.route(question, config, docs)
+        return config, await asyncio.to_thread(conversation.pack_context, question, docs or [], config)
+
+def route_info(conversation):
+    route = conversation.last_route
+    return {"tier": route.tier, "reason": route.reason} if route is not None else None
+
+@app.get("/health")
+async def health():
+    service = state["retrieval_service"]
+    return {
+        "status": "ok",
+        "generation": service.generation,
+        "limits": {**model_limiter.stats(), **retrieval_limiter.stats()},
+        "query_embedding": service.embedding_stats()
+    }
+
+@app.get("/filters")
+async def filters():
+    return await asyncio.to_thread(state["retrieval_service"].filter_options)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(get_tracer().render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/models")
+async def models():
+    manager = get_model_manager()
+    try:
+        installed = await asyncio.to_thread(manager.list_models)
+        resident = await asyncio.to_thread(manager.resident)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Could not reach Ollama: {e}")
+    return {"models": installed, "resident": resident, "preload": manager.stats()}
+
+@app.post("/retrieve")
+async def retrieve(request: RetrieveRequest):
+    start_time = time.perf_counter()
+    with get_tracer().trace("api.retrieve", question=request.question):
+        async with retrieval_limiter.slot("retrieval"):
+            docs = await asyncio.to_thread(new_conversation(request.web_search).retrieve, request.question, search_filters(request.filters))
+    return {"documents": serialize(docs or []), "retrieval_seconds": time.perf_counter() - start_time}
+
+@app.post("/answer")
+async def answer(request: AnswerRequest):
+    with get_tracer().trace("api.answer", question=request.question) as trace:
+        start_time = time.perf_counter()
+        config = agent_config(request.model)
+        conversation = new_conversation(request.web_search)
+        config, packed = await retrieve_and_pack(conversation, request.question, config, request.filters, route=request.model is None)
+        retrieval_seconds = time.perf_counter() - start_time
+        async with model_limiter.slot(config["model"]):
+            try:
+                response = await asyncio.wait_for(
+                    conversation.achat(request.question, config, context=packed.text, use_cache=request.use_cache),
+                    REQUEST_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                trace.annotate(error="timeout")
+                raise HTTPException(status_code=504, detail=f"Model '{config['model']}' did not answer within {REQUEST_TIMEOUT_SECONDS}s")
+        total_seconds = time.perf_counter() - start_time
+        cached = conversation.last_cache_hit is not None
+    logging.info(f"API Query: {request.question} | Response: {len(response)} chars | Time: {total_seconds:.2f}s | Model: {config['model']}{' | Cached' if cached else ''}")
+    return {
+        "answer": response,
+        "model": config["model"],
+        "route": route_info(conversation),
+        "cached": cached,
+        "documents": serialize(packed.docs),
+        "retrieval_seconds": retrieval_seconds,
+        "total_seconds": total_seconds
+    }
+
+@app.post("/answer/stream")
+async def answer_stream(request: AnswerRequest):
+    """Newline-delimited JSON: a `documents` line, `token` lines, then a `done` line."""
+    start_time = time.perf_counter()
+    tracer = get_tracer()
+    # finished when the stream ends, not when this handler returns
+    trace = tracer.start("api.answer_stream", question=request.question)
+    try:
+        with use_trace(trace):
+            config = agent_config(request.model)
+            conversation = new_conversation(request.web_search)
+            config, packed = await retrieve_and_pack(conversation, request.question, config, request.filters, route=request.model is None)
+            # take the model slot before responding, so an overloaded model still gets a 503
+            await model_limiter.acquire(config["model"])
+    except BaseException:
+        tracer.finish(trace)
+        raise
+
+    # called by the response once it is done, also when the client left before the body started
+    def close():
+        model_limiter.release(config["model"])
+        tracer.finish(trace)
+
+    async def events():
+        deadline = time.perf_counter() + REQUEST_TIMEOUT_SECONDS
+        first_token_time = None
+        chunks = []
+        with use_trace(trace):
+            yield json.dumps({"documents": serialize(packed.docs)}) + "\n"
+            stream = conversation.astream(request.question, config, context=packed.text, use_cache=request.use_cache)
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), max(0.0, deadline - time.perf_counter()))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    trace.annotate(error="timeout")
+                    yield json.dumps({"error": f"Model '{config['model']}' did not finish within {REQUEST_TIMEOUT_SECONDS}s"}) + "\n"
+                    return
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                chunks.append(chunk)
+                yield json.dumps({"token": chunk}) + "\n"
+        total_seconds = time.perf_counter() - start_time
+        first_token_latency = (first_token_time or time.perf_counter()) - start_time
+        cached = conversation.last_cache_hit is not None
+        logging.info(f"API Query: {request.question} | Response: {len(''.join(chunks))} chars | Time: {total_seconds:.2f}s | TTFT: {first_token_latency:.2f}s | Model: {config['model']}{' | Cached' if cached else ''}")
+        yield json.dumps({"done": True, "model": config["model"], "route": route_info(conversation), "cached": cached, "first_token_seconds": first_token_latency, "total_seconds": total_seconds}) + "\n"
+
+    try:
+        return ClosingStreamingResponse(events(), close, media_type="application/x-ndjson")
+    except BaseException:
+        close()
+        raise
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Serve the Scraper2Notebook query API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 import streamlit as st
 from streamlit_chat import message # Assuming this is still the chat component
-from converse import Converse
-from tinydb import TinyDB
+from converse import Converse, WEB_SEARCH_ENABLED, warm_up_in_background
+from config_snapshot import get_agent_table
+from model_manager import get_model_manager
+from answer_cache import AnswerCache
+from model_router import get_model_router
+from search_filters import SearchFilters
+from web_search import get_web_search
+from tracing import configure_query_log, get_tracer
 import time
-import ollama
 import logging
 
 # --- Page Configuration (Dark Theme & Layout) ---
@@ -126,26 +131,48 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# Set up logging
-logging.basicConfig(filename='query_log.txt', level=logging.INFO, format='%(asctime)s - %(message)s')
+# Set up logging; records are written by a background thread
+configure_query_log('query_log.txt')
 
-# Cache retrieval results for faster repeated queries
-@st.cache_data
-def cached_similarity_search(query):
-    conversation = Converse()
-    docs = conversation.retriever.invoke(query)
-    return docs
+# --- Database Initialization ---
+# Read from memory on reruns; db.json is only re-read after it changes on disk
+agent_table = get_agent_table()
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful assistant with access to a knowledge base of scraped data from r/RooCode and related GitHub repositories."
+
+# Ensure agent_table has at least one entry
+agent_table.insert_default({
+    "model": "llama3:8b",
+    "system_message": DEFAULT_SYSTEM_MESSAGE,
+    "user_name": "User",
+    "agent_name": "RooCode Assistant"
+})
+
+# Load the embedders, vector stores and Ollama client once per server process, on a
+# background thread: the page renders meanwhile, and the first question waits if it has to
+@st.cache_resource
+def start_warm_up():
+    return warm_up_in_background(agent_table.first()["model"])
+
+warm_up = start_warm_up()
+if warm_up.done() and warm_up.exception() is not None:
+    # not kept, so the next rerun tries again (e.g. after running ingest.py)
+    start_warm_up.clear()
+    st.error(f"Failed to load the knowledge base: {warm_up.exception()}")
+    st.stop()
+retrieval_service = warm_up.result() if warm_up.done() else None
 
-# Cache the model list to avoid repeated calls to ollama.list()
-@st.cache_data(show_spinner=False) # Hide spinner for this cache
-def get_available_models():
+# Persistent cache of generated answers, shared by all sessions
+@st.cache_resource
+def load_answer_cache():
+    return AnswerCache()
+
+answer_cache = load_answer_cache()
+
+# The model list comes from ollama.list() at most once a minute (MODEL_LIST_TTL_SECONDS), shared by all sessions
+def get_available_models(refresh=False):
     try:
-        ollama_response = ollama.list()
-        print("Debug: Ollama list response:", ollama_response)
-        # Access the 'model' attribute instead of 'name'
-        available_models = [model.model for model in ollama_response.get('models', [])]
-        # Filter out embedding models (e.g., mxbai-embed-large)
-        model_options = [model for model in available_models if not model.startswith('mxbai-embed')]
+        # Embedding models (e.g., mxbai-embed-large) are left out
+        model_options = get_model_manager().list_models(refresh=refresh)
         if not model_options:
             raise ValueError("No valid models found in Ollama response")
     except Exception as e:
@@ -156,20 +183,6 @@ def get_available_models():
         model_options = ["llama3:8b", "llama3:8b-q4_0", "qwen2.5:1.5b"]  # Fallback list
     return model_options
 
-# --- Database Initialization ---
-db = TinyDB('db.json')
-agent_table = db.table('agent')
-
-# Ensure agent_table has at least one entry
-if not agent_table.all():
-    print("Debug: Inserting default entry.")
-    agent_table.insert({
-        "model": "llama3:8b",
-        "system_message": "You are a helpful assistant with access to a knowledge base of scraped data from r/RooCode and related GitHub repositories.",
-        "user_name": "User",
-        "agent_name": "RooCode Assistant"
-    })
-
 # --- Sidebar Controls ---
 with st.sidebar:
     st.header("Controls")
@@ -178,18 +191,106 @@ with st.sidebar:
 
     # Add a refresh button for the model list
     if st.button("Refresh Models"):
-        st.cache_data.clear()  # Clear all cached data, including get_available_models
+        get_available_models(refresh=True)
         st.rerun()
 
     # Model selection dropdown
-    selected_model = st.selectbox("Select model:", model_options, index=model_options.index(agent_table.all()[0]['model']) if agent_table.all() and agent_table.all()[0]['model'] in model_options else 0)
-    st.write(f"Using model: `{selected_model}`") # Using markdown for slight emphasis
+    current_db_model = agent_table.first()['model']
+    selected_model = st.selectbox("Select model:", model_options, index=model_options.index(current_db_model) if current_db_model in model_options else 0)
+    st.write(f"Using model: `{selected_model}` ({get_model_manager().status(selected_model)})") # Using markdown for slight emphasis
 
     # Add a clear chat button
     if st.button("Clear Chat"):
         st.session_state["messages"] = []
         st.rerun()
 
+    # Turn off to force a fresh generation; the new answer replaces the cached one
+    use_answer_cache = st.checkbox("Use answer cache", value=True)
+
+    # Send lookups and confidently-retrieved questions to config.json's fast_model
+    model_router = get_model_router()
+    use_routing = False
+    if model_router.enabled:
+        use_routing = st.checkbox(f"Route simple questions to `{model_router.fast_model}`", value=True)
+        with st.expander("Model routing"):
+            routing_stats = model_router.stats()
+            for tier in ("fast", "main"):
+                average = routing_stats[tier]["average_seconds"]
+                st.write(f"{tier.capitalize()}: {routing_stats[tier]['questions']} questions" + (f", {average:.2f}s average" if average is not None else ""))
+            st.write(f"Fell back to main model (fast model busy): {routing_stats['fallbacks']}")
+
+    # Web results are merged into the context if they arrive within the search deadline
+    use_web_search = st.checkbox("Include web search", value=WEB_SEARCH_ENABLED)
+    if use_web_search:
+        with st.expander("Web search"):
+            web_stats = get_web_search().stats()
+            st.write(f"Cache hit rate: {web_stats['hit_rate']:.0%} ({web_stats['hits']} hits, {web_stats['misses']} misses)")
+            st.write(f"Missed the {web_stats['deadline_seconds']:g}s deadline: {web_stats['timeouts']} · errors: {web_stats['errors']}")
+
+    # Narrow retrieval to some sources; Chroma applies these before the similarity search
+    with st.expander("Search filters"):
+        if retrieval_service is not None:
+            filter_options = retrieval_service.filter_options()
+        else:
+            st.caption("Sources, repos and subreddits are listed once the knowledge base has loaded.")
+            filter_options = {"sources": [], "repos": [], "subreddits": []}
+        selected_sources = st.multiselect("Sources", filter_options["sources"] + (["web"] if use_web_search else []))
+        selected_repos = st.multiselect("GitHub repos", filter_options["repos"])
+        selected_subreddits = st.multiselect("Subreddits", filter_options["subreddits"])
+        # 0-2 dates; undated chunks (GitHub docs, PDFs) are excluded once a date is set
+        date_range = st.date_input("Date range (UTC)", value=())
+        min_score = st.number_input("Minimum Reddit score (0 = any)", min_value=0, value=0, step=1)
+    search_filters = SearchFilters(
+        sources=selected_sources,
+        repos=selected_repos,
+        subreddits=selected_subreddits,
+        start_date=date_range[0] if len(date_range) > 0 else None,
+        end_date=date_range[1] if len(date_range) > 1 else None,
+        min_score=min_score or None
+    )
+
+    # Retrieval cache effectiveness
+    with st.expander("Retrieval cache"):
+        if retrieval_service is None:
+            st.write("Loading knowledge base...")
+        else:
+            cache_stats = retrieval_service.query_cache.stats()
+            st.write(f"Hit rate: {cache_stats['hit_rate']:.0%} ({cache_stats['exact_hits']} exact, {cache_stats['semantic_hits']} similar, {cache_stats['misses']} misses)")
+            st.write(f"Entries: {cache_stats['entries']} · Memory: {cache_stats['memory_bytes'] / 1024:.0f} KB · Index generation: {cache_stats['generation']}")
+
+    # Query-embedding batching under concurrent use
+    with st.expander("Query embedding"):
+        if retrieval_service is None:
+            st.write("Loading knowledge base...")
+        else:
+            for name, batch_stats in retrieval_service.embedding_stats().items():
+                st.write(f"{name}: {batch_stats['requests']} queries in {batch_stats['batches']} batches (avg {batch_stats['average_batch_size']:.1f}, max {batch_stats['largest_batch']} of {batch_stats['max_batch_size']})")
+                st.write(f"Queue wait {batch_stats['average_queue_ms']:.1f} ms · batch time {batch_stats['average_batch_ms']:.1f} ms · window {batch_stats['max_wait_ms']:g} ms")
+
+    # Models Ollama has in memory, and the background preloads
+    with st.expander("Models in memory"):
+        model_manager = get_model_manager()
+        try:
+            resident_models = model_manager.resident()
+        except Exception as e:
+            resident_models = {}
+            st.write(f"Could not reach Ollama: {e}")
+        for name, info in resident_models.items():
+            st.write(f"`{name}`: {info['size_mb']:.0f} MB ({info['vram_mb']:.0f} MB on GPU), until {info['expires_at']}")
+        preload_stats = model_manager.stats()
+        if preload_stats["loading"]:
+            st.write(f"Loading `{preload_stats['loading']}`" + (f", then {', '.join(preload_stats['queued'])}" if preload_stats["queued"] else ""))
+        st.caption(f"Selected models are preloaded and kept for {preload_stats['keep_alive']} after their last use.")
+
+    # Where query time goes, from the per-stage traces (also in metrics.prom)
+    with st.expander("Latency by stage"):
+        stage_stats = get_tracer().stats()
+        if not stage_stats:
+            st.write("No queries traced yet.")
+        for name, span_stats in stage_stats.items():
+            p95 = f"{span_stats['p95_ms']:.0f} ms" if span_stats["p95_ms"] is not None else "> 120 s"
+            st.write(f"{name}: mean {span_stats['mean_ms']:.1f} ms · p95 ≤ {p95} · {span_stats['count']} calls")
+
     st.markdown("---") # Separator
     st.markdown("Built by RooCode")
 
@@ -198,20 +299,20 @@ with st.sidebar:
 st.title("RooCode Data Query")
 
 # Update agent_table with the selected model if it has changed
-current_db_model = agent_table.all()[0]['model'] if agent_table.all() else None
 if selected_model != current_db_model:
-    agent_table.truncate() # Clear existing entries
-    agent_table.insert({
+    agent_table.replace({
         "model": selected_model,
-        "system_message": "You are a helpful assistant with access to a knowledge base of scraped data from r/RooCode and related GitHub repositories.",
+        "system_message": DEFAULT_SYSTEM_MESSAGE,
         "user_name": "User", # These could also be made configurable if needed
         "agent_name": "RooCode Assistant"
     })
     # Clear chat history if model changes, as context might not be relevant
     st.session_state["messages"] = []
+    # Load it in Ollama now rather than with the first question; loads are queued one at a time
+    get_model_manager().preload(selected_model)
 
 
-agent_table_rows = agent_table.all()
+agent_table_rows = agent_table.rows()
 if not agent_table_rows:
     st.error("Failed to initialize the agent table. Please check the database setup.")
     st.stop()
@@ -229,6 +330,8 @@ if "messages" not in st.session_state:
 # The key is important for Streamlit to correctly track elements.
 for i, msg_data in enumerate(st.session_state.messages):
     message(msg_data["message"], is_user=msg_data["is_user"], key=f"msg_{i}")
+    if msg_data.get("timing"):
+        st.text(msg_data["timing"])
 
 
 # Chat input
@@ -239,38 +342,71 @@ if query:
     # Display the user's message immediately
     message(query, is_user=True, key=f"msg_{len(st.session_state.messages)}_user")
 
-    with st.spinner("Generating response..."):
-        start_time = time.time()
+    # Tokens are appended to this placeholder as Ollama streams them
+    response_placeholder = st.empty()
+    response = ""
+    start_time = time.time()
+    first_token_time = None
+    conversation = None
+    with get_tracer().trace("app.query", question=query) as trace:
         try:
-            conversation = Converse()
+            if retrieval_service is None:
+                with st.spinner("Loading knowledge base..."):
+                    retrieval_service = warm_up.result()
+            conversation = Converse(
+                embedding_function=retrieval_service.embedding_function,
+                vectorstore=retrieval_service.vectorstore,
+                retriever=retrieval_service.retriever,
+                answer_cache=answer_cache,
+                retrieval_service=retrieval_service,
+                web_search=get_web_search() if use_web_search else False
+            )
             # Use the selected model for the conversation
-            current_agent_config = agent_table.all()[0] # Get the latest config
-            
-            docs = cached_similarity_search(query) # RAG retrieval
-            context = ""
-            if docs: # Check if docs is not None and not empty
-                # Concatenate content from multiple relevant documents if available
-                context_parts = [doc.page_content for doc in docs[:2]] # Use top 2 docs for context
-                context = "\n---\n".join(context_parts)
-                context = context[:3000] # Limit context size
-            else:
-                context = "No relevant context found."
-
-            response = conversation.chat(f"Context: {context}\nQuestion: {query}", current_agent_config)
+            current_agent_config = agent_table.first() # Get the latest config
+
+            with st.spinner("Retrieving context..."):
+                # RAG retrieval, cached by the service (normalised text or similar query embedding, per filter
+                # set) and dropped automatically when ingestion adds new data
+                docs = conversation.retrieve(query, search_filters)
+                if use_routing:
+                    current_agent_config = conversation.route(query, current_agent_config, docs)
+                # Fit as many distinct chunks as the selected model's context window allows
+                packed = conversation.pack_context(query, docs or [], current_agent_config)
+
+            for chunk in conversation.stream(query, current_agent_config, context=packed.text, use_cache=use_answer_cache):
+                if first_token_time is None:
+                    first_token_time = time.time()
+                response += chunk
+                response_placeholder.markdown(response + "▌")
         except Exception as e:
             response = f"Error processing query: {str(e)}"
+            trace.annotate(error=str(e))
             logging.error(f"Error processing query '{query}': {e}")
-        end_time = time.time()
-
-        # Log the query and response
-        logging.info(f"Query: {query} | Response: {response} | Time: {end_time - start_time:.2f}s | Model: {selected_model}")
-        
-        st.session_state.messages.append({"message": response, "is_user": False})
-        # Display AI's message
-        message(response, is_user=False, key=f"msg_{len(st.session_state.messages)}_ai")
-        
-        # Display response time (styled via CSS)
-        st.text(f"Response time: {end_time - start_time:.2f} seconds")
-        
-        # Rerun to clear the input box and update message display smoothly
-        st.rerun()
\ No newline at end of file
+    end_time = time.time()
+    response_placeholder.empty()
+
+    total_time = end_time - start_time
+    first_token_latency = (first_token_time or end_time) - start_time
+    cache_hit = conversation.last_cache_hit if conversation is not None else None
+    answer_model = conversation.last_route.model if conversation is not None and conversation.last_route is not None else selected_model
+
+    # Log the query and response
+    logging.info(f"Query: {query} | Response: {len(response)} chars | Time: {total_time:.2f}s | TTFT: {first_token_latency:.2f}s | Model: {answer_model}{' | Cached' if cache_hit is not None else ''}")
+
+    # Keep the timing with the message so it survives the rerun below
+    timing = f"Response time: {total_time:.2f} seconds (first token: {first_token_latency:.2f} seconds)"
+    if cache_hit is not None:
+        generation_seconds = cache_hit.get("generation_seconds")
+        original = f", generation originally took {generation_seconds:.2f} seconds" if generation_seconds else ""
+        timing = f"Response time: {total_time:.2f} seconds (cached answer{original})"
+    if answer_model != selected_model:
+        timing += f" · answered by {answer_model}"
+    st.session_state.messages.append({"message": response, "is_user": False, "timing": timing})
+    # Display AI's message
+    message(response, is_user=False, key=f"msg_{len(st.session_state.messages)}_ai")
+
+    # Display response time (styled via CSS)
+    st.text(timing)
+
+    # Rerun to clear the input box and update message display smoothly
+    st.rerun()
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for Scraper2Notebook
+
+Generates synthetic Reddit, GitHub and PDF corpora at several scales. For
+each scale it then measures:
+
+    startup      - time to import converse.py and api.py in a fresh interpreter, with the slowest
+                   imports (python -X importtime); time to load and warm the retrieval service
+    ingest       - ingest.py on reddit_data.jsonl + github_data.jsonl: chunks/s, wall time, peak RSS
+    ingest_pdf   - ingest-pdf.py on the generated PDFs: chunks/s, wall time, peak RSS
+    retrieval    - Converse.retriever.search latency p50/p95/p99, sequential and concurrent
+    vector_search - primary-collection vector search from precomputed embeddings: Chroma against
+                   mmap_index.py exports (float16, int8), with their top-k agreement with Chroma
+                   and batched throughput
+    query_embedding - query embedding with the PyTorch model and its ONNX float32 and int8 exports
+                   (onnx_embeddings.py), each in its own process: load time, latency p50/p95/p99,
+                   peak RSS, and cosine agreement with the vectors stored at ingest
+    answer       - end-to-end retrieve + pack + streamed answer against fake_ollama.py:
+                   time to first token and total latency p50/p95/p99
+
+Every scale runs in its own work directory. The ingestion scripts run as
+child processes, so each peak RSS is their own. Embedding models are loaded
+and caches start empty, so ingest numbers are cold-start throughput. Results
+are written as JSON to benchmark_results/. `--compare` diffs two result files
+and exits with status 1 if any metric regressed by more than the threshold.
+
+Usage: python benchmark.py [--scales small medium] [--queries 200] [--answers 20]
+       python benchmark.py --startup    (print the startup import profile only)
+       python benchmark.py --compare benchmark_results/OLD.json benchmark_results/NEW.json [--threshold 0.1]
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse, json, os, platform, random, re, resource, shutil, subprocess, sys, tempfile, time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmark_results")
+# Corpus sizes per scale; "large" is meant for occasional runs
+SCALES = {
+    "small": {"posts": 200, "comments": 10, "repos": 2, "docs": 20, "issues": 50, "pdfs": 10, "pages": 4},
+    "medium": {"posts": 1000, "comments": 20, "repos": 5, "docs": 50, "issues": 200, "pdfs": 50, "pages": 8},
+    "large": {"posts": 5000, "comments": 30, "repos": 10, "docs": 100, "issues": 500, "pdfs": 200, "pages": 12}
+}
+DEFAULT_SCALES = ["small", "medium"]
+DEFAULT_QUERIES = 200
+DEFAULT_ANSWERS = 20
+# Threads issuing queries at once in the concurrent retrieval run
+CONCURRENT_CLIENTS = 8
+# Modules imported at startup by the Streamlit app and the API, profiled by bench_startup
+STARTUP_MODULES = ["converse", "api"]
+SLOWEST_IMPORTS = 10
+WARM_UP_QUERIES = 5
+# Relative change beyond which `--compare` reports a regression
+DEFAULT_THRESHOLD = 0.10
+BENCHMARK_MODEL = "llama3:8b"
+# Query embedders compared on the primary collection, as overrides of its retrieval.COLLECTIONS entry
+EMBEDDER_BACKENDS = {
+    "huggingface": {"embedding": "huggingface"},
+    "onnx_float32": {"embedding": "onnx", "onnx_quantized": False},
+    "onnx_int8": {"embedding": "onnx", "onnx_quantized": True}
+}
+
+TOPICS = [
+    "custom modes", "mcp servers", "boomerang tasks", "orchestrator mode", "api provider", "context window",
+    "diff editing", "terminal integration", "checkpoints", "prompt caching", "rate limits", "openrouter",
+    "architect mode", "code actions", "auto approve", "memory bank", "system prompt", "token usage"
+]
+WORDS = (
+    "the mode config file setting model agent task prompt token error fix update version release workflow "
+    "project editor extension command server request response cache limit context window tool change issue "
+    "feature support option default value path folder workspace json yaml key provider api local remote"
+).split()
+
+def sentence(rng, topic=None, words=12):
+    text = [rng.choice(WORDS) for _ in range(words)]
+    if topic:
+        text.insert(rng.randrange(len(text)), topic)
+    return " ".join(text).capitalize() + "."
+
+def paragraph(rng, topic, sentences):
+    return " ".join(sentence(rng, topic if i % 3 == 0 else None) for i in range(sentences))
+
+def generate_corpus(directory, scale, seed=0):
+    """Write reddit_data.jsonl, github_data.jsonl, pdfs/*.pdf and pdf-files.txt into `directory`."""
+    rng = random.Random(seed)
+    sizes = SCALES[scale]
+    now = time.time()
+    with open(os.path.join(directory, "reddit_data.jsonl"), "w") as f:
+        comment_number = 0
+        for p in range(sizes["posts"]):
+            topic = rng.choice(TOPICS)
+            post_id = format(36 ** 5 + p * 1000, "x")
+            f.write(json.dumps({
+                "type": "post", "id": post_id, "subreddit": "RooCode", "title": f"Question about {topic}",
+                "text": paragraph(rng, topic, rng.randint(2, 12)), "author": f"user{rng.randint(1, 500)}",
+                "score": rng.randint(0, 300), "num_comments": sizes["comments"], "created_utc": now - rng.randint(0, 365 * 86400),
+                "url": "", "permalink": f"/r/RooCode/comments/{post_id}/"
+            }) + "\n")
+            for _ in range(sizes["comments"]):
+                comment_number += 1
+                f.write(json.dumps({
+                    "type": "comment", "id": format(36 ** 6 + comment_number, "x"), "subreddit": "RooCode", "post_id": post_id,
+                    "parent_id": "t3_" + post_id, "text": paragraph(rng, topic, rng.randint(1, 5)), "author": f"user{rng.randint(1, 500)}",
+                    "score": rng.randint(-5, 100), "created_utc": now - rng.randint(0, 365 * 86400), "permalink": ""
+                }) + "\n")
+    with open(os.path.join(directory, "github_data.jsonl"), "w") as f:
+        for r in range(sizes["repos"]):
+            repo = f"example/repo-{r}"
+            for d in range(sizes["docs"]):
+                topic = rng.choice(TOPICS)
+                text = "\n\n".join(f"## {topic} {s}\n\n" + paragraph(rng, topic, rng.randint(3, 10)) for s in range(rng.randint(2, 8)))
+                f.write(json.dumps({"type": "doc", "id": f"github:{repo}:doc:docs/{d}.md", "repo": repo, "title": f"{repo}: docs/{d}.md", "text": text, "url": ""}) + "\n")
+            for i in range(sizes["issues"]):
+                topic = rng.choice(TOPICS)
+                f.write(json.dumps({
+                    "type": "issue", "id": f"github:{repo}:issue:{i + 1}", "repo": repo, "title": f"{repo}#{i + 1}: {topic} broken",
+                    "text": paragraph(rng, topic, rng.randint(2, 8)), "url": "", "updated_at": "2025-01-01T00:00:00Z"
+                }) + "\n")
+    pdf_dir = os.path.join(directory, "pdfs")
+    os.makedirs(pdf_dir, exist_ok=True)
+    with open(os.path.join(directory, "pdf-files.txt"), "w") as listing:
+        for n in range(sizes["pdfs"]):
+            topic = rng.choice(TOPICS)
+            pages = [[sentence(rng, topic, 10) for _ in range(40)] for _ in range(sizes["pages"])]
+            path = os.path.join(pdf_dir, f"manual-{n}.pdf")
+            write_pdf(path, pages)
+            listing.write(path + "\n")
+    return {
+        "reddit_records": sizes["posts"] * (1 + sizes["comments"]),
+        "github_records": sizes["repos"] * (sizes["docs"] + sizes["issues"]),
+        "pdfs": sizes["pdfs"],
+        "bytes": sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+    }
+
+def write_pdf(path, pages):
+    """A minimal PDF with one Helvetica text page per entry of `pages` (each a list of lines)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({line}) '" for line in escaped) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(data)
+
+def run_measured(command, directory, log_name):
+    """Run `command` in `directory`; returns (seconds, peak RSS in MB, output). Output is also kept in `log_name`."""
+    log_path = os.path.join(directory, log_name)
+    start_time = time.perf_counter()
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(command, cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 reports the child's own peak RSS (and that of processes it waited for)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - start_time
+    with open(log_path) as log:
+        output = log.read()
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed with status {process.returncode}; see {log_path}")
+    return seconds, rss_mb(usage.ru_maxrss), output
+
+def rss_mb(maxrss):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+def bench_startup(directory):
+    """Import time of each of STARTUP_MODULES in a fresh interpreter, with its slowest imports."""
+    results = {}
+    env = {**os.environ, "PYTHONPATH": REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    for module in STARTUP_MODULES:
+        start_time = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=directory, env=env, capture_output=True, text=True)
+        seconds = time.perf_counter() - start_time
+        if process.returncode != 0:
+            raise RuntimeError(f"import {module} failed: {process.stderr.strip().splitlines()[-1]}")
+        # "import time: self [us] | cumulative | imported package", nested imports indented
+        imports = []
+        for line in process.stderr.splitlines():
+            match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+            if match:
+                imports.append((int(match.group(2)), len(match.group(3)), match.group(4)))
+        # the heaviest imports made by the module or by the repo modules it imports (interpreter start-up excluded)
+        local = {os.path.splitext(name)[0] for name in os.listdir(REPO_DIR) if name.endswith(".py")}
+        slowest = sorted((imp for imp in imports if imp[2] != module and imp[2] not in local and 0 < imp[1] <= 4), reverse=True)
+        seen = []
+        for cumulative, _, name in slowest:
+            if not any(name.startswith(parent + ".") for parent in seen):
+                seen.append(name)
+            if len(seen) == SLOWEST_IMPORTS:
+                break
+        by_name = {name: cumulative for cumulative, _, name in imports}
+        results[module] = {
+            "seconds": seconds,
+            "import_ms": by_name.get(module, 0) / 1000.0,
+            "slowest_imports": {name: by_name[name] / 1000.0 for name in seen}
+        }
+    return results
+
+def print_startup(startup):
+    for module, profile in startup.items():
+        print(f"import {module}: {profile['import_ms']:.0f} ms ({profile['seconds']:.2f}s including interpreter start)")
+        for name, milliseconds in profile["slowest_imports"].items():
+            print(f"    {name:40} {milliseconds:8.0f} ms")
+
+def bench_ingest(directory):
+    seconds, peak_rss, output = run_measured([sys.executable, os.path.join(REPO_DIR, "ingest.py")], directory, "ingest.log")
+    match = re.search(r"Ingest complete: (\d+) added", output)
+    chunks = int(match.group(1)) if match else 0
+    return {"chunks": chunks, "seconds": seconds, "chunks_per_second": chunks / seconds, "peak_rss_mb": peak_rss}
+
+def bench_ingest_pdf(directory):
+    seconds, peak_rss, output = run_measured([sys.executable, os.path.join(REPO_DIR, "ingest-pdf.py")], directory, "ingest-pdf.log")
+    chunks = sum(int(count) for count in re.findall(r"\(num chunks: (\d+)\)", output))
+    return {"chunks": chunks, "seconds": seconds, "chunks_per_second": chunks / seconds, "peak_rss_mb": peak_rss}
+
+def bench_queries(directory, queries, answers):
+    """Run the retrieval and answer benchmarks in a worker process inside `directory`."""
+    _, _, output = run_measured(
+        [sys.executable, os.path.abspath(__file__), "--worker", "--queries", str(queries), "--answers", str(answers)],
+        directory, "queries.log"
+    )
+    # the worker's result is its last line
+    return json.loads(output.strip().splitlines()[-1])
+
+def percentiles(seconds):
+    ordered = sorted(seconds)
+    def at(fraction):
+        return 1000.0 * ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+    return {"count": len(ordered), "p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99), "mean_ms": 1000.0 * sum(ordered) / len(ordered)}
+
+def benchmark_questions(count, seed=1):
+    rng = random.Random(seed)
+    templates = ["how do I configure {}", "why does {} fail", "what is {}", "{} not working after update", "best settings for {}"]
+    return [rng.choice(templates).format(rng.choice(TOPICS)) + f" {rng.choice(WORDS)}" for _ in range(count)]
+
+def worker(queries, answers):
+    """Retrieval and end-to-end answer latency, run with the current directory holding an ingested corpus."""
+    from fake_ollama import FakeOllama
+    # deterministic generation: 50 ms to the first token, then 10 ms per token
+    fake = FakeOllama(port=0, models=[BENCHMARK_MODEL], token_delay=0.01, first_token_delay=0.05, answer_tokens=24).start()
+    os.environ["OLLAMA_HOST"] = fake.url
+    from converse import Converse
+    from retrieval import get_retrieval_service
+
+    start_time = time.perf_counter()
+    service = get_retrieval_service(warm_up=True)
+    service_seconds = time.perf_counter() - start_time
+    conversation = Converse(retrieval_service=service, web_search=False)
+    questions = benchmark_questions(queries)
+    for question in questions[:WARM_UP_QUERIES]:
+        conversation.retriever.search(question)
+
+    def timed_search(question):
+        start_time = time.perf_counter()
+        conversation.retriever.search(question)
+        return time.perf_counter() - start_time
+
+    sequential = [timed_search(question) for question in questions]
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENT_CLIENTS) as executor:
+        concurrent = list(executor.map(timed_search, questions))
+    concurrent_seconds = time.perf_counter() - start_time
+
+    agent_row = {"model": BENCHMARK_MODEL, "system_message": "You are a helpful assistant."}
+    first_token = []
+    total = []
+    for question in benchmark_questions(answers, seed=2):
+        start_time = time.perf_counter()
+        docs = conversation.retrieve(question)
+        packed = conversation.pack_context(question, docs or [], agent_row)
+        first_token_time = None
+        for _ in conversation.stream(question, agent_row, context=packed.text, use_cache=False):
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+        end_time = time.perf_counter()
+        first_token.append((first_token_time or end_time) - start_time)
+        total.append(end_time - start_time)
+    fake.stop()
+    vector_search = bench_vector_backends(service, questions)
+
+    print(json.dumps({
+        "retrieval": {
+            "sequential": percentiles(sequential),
+            "concurrent": {**percentiles(concurrent), "clients": CONCURRENT_CLIENTS, "queries_per_second": len(concurrent) / concurrent_seconds}
+        },
+        "answer": {"first_token": percentiles(first_token), "total": percentiles(total)},
+        "vector_search": vector_search,
+        "retrieval_service_seconds": service_seconds,
+        "peak_rss_mb": rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    }))
+
+def bench_vector_backends(service, questions):
+    """Vector search on the primary collection through Chroma and through each memory-mapped export."""
+    from mmap_index import DTYPES, MmapVectorIndex, export_collection
+    from retrieval import RETRIEVER_K
+    shard = service.shards[0]
+    embeddings = [shard.embedding_function.embed_query(question) for question in questions]
+
+    def measure(search):
+        seconds = []
+        found = []
+        for embedding in embeddings:
+            start_time = time.perf_counter()
+            results = search(embedding)
+            seconds.append(time.perf_counter() - start_time)
+            found.append({doc.page_content for doc, _ in results})
+        return seconds, found
+
+    seconds, expected = measure(lambda embedding: shard.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=RETRIEVER_K))
+    results = {"chroma": percentiles(seconds)}
+    for dtype in DTYPES:
+        path = os.path.join("mmap_index", f"benchmark-{dtype}")
+        export_collection(shard.vectorstore._collection, path, shard.name, dtype)
+        index = MmapVectorIndex(path)
+        seconds, found = measure(lambda embedding: index.search(embedding, RETRIEVER_K))
+        start_time = time.perf_counter()
+        index.search_batch(embeddings, RETRIEVER_K)
+        batch_seconds = time.perf_counter() - start_time
+        agreement = [len(got & want) / len(want) for got, want in zip(found, expected) if want]
+        results[f"mmap_{dtype}"] = {
+            **percentiles(seconds),
+            "recall_at_k": sum(agreement) / len(agreement) if agreement else 1.0,
+            "batch_queries_per_second": len(embeddings) / batch_seconds
+        }
+    return results
+
+def bench_query_embedders(directory, queries):
+    """Export the primary collection's model to ONNX, validate it, and time each of EMBEDDER_BACKENDS in its own process."""
+    from onnx_embeddings import model_file, model_path, read_validation
+    from retrieval import COLLECTIONS
+    config = COLLECTIONS[0]
+    script = os.path.join(REPO_DIR, "onnx_embeddings.py")
+    backends = dict(EMBEDDER_BACKENDS)
+    try:
+        run_measured([sys.executable, script, "export", config["name"]], directory, "onnx_export.log")
+    except RuntimeError as e:
+        # onnxruntime, onnx or the model may be missing; still measure PyTorch
+        print(f"Skipping the ONNX embedders: {e}")
+        backends = {name: overrides for name, overrides in backends.items() if overrides["embedding"] != "onnx"}
+    results = {}
+    for name, overrides in backends.items():
+        if overrides["embedding"] == "onnx":
+            # exits with status 1 when the vectors disagree; the agreement is recorded either way
+            subprocess.run([sys.executable, script, "validate", config["name"]] + ([] if overrides["onnx_quantized"] else ["--float32"]), cwd=directory, capture_output=True)
+        _, peak_rss, output = run_measured(
+            [sys.executable, os.path.abspath(__file__), "--embedder-worker", name, "--queries", str(queries)],
+            directory, f"embedder-{name}.log"
+        )
+        results[name] = {**json.loads(output.strip().splitlines()[-1]), "peak_rss_mb": peak_rss}
+        if overrides["embedding"] == "onnx":
+            validation = read_validation(os.path.join(directory, model_path(config))).get(config["name"], {}).get(model_file(overrides["onnx_quantized"]))
+            if validation:
+                results[name].update({key: validation[key] for key in ("mean_cosine", "min_cosine")})
+    return results
+
+def embedder_worker(backend, queries):
+    """Load one query embedder and time it, run with the current directory holding an ingested corpus."""
+    from retrieval import COLLECTIONS, create_embeddings, query_batch_function
+    config = {**COLLECTIONS[0], **EMBEDDER_BACKENDS[backend]}
+    start_time = time.perf_counter()
+    embeddings = create_embeddings(config)
+    load_seconds = time.perf_counter() - start_time
+    questions = benchmark_questions(queries)
+    for question in questions[:WARM_UP_QUERIES]:
+        embeddings.embed_query(question)
+    seconds = []
+    for question in questions:
+        start_time = time.perf_counter()
+        embeddings.embed_query(question)
+        seconds.append(time.perf_counter() - start_time)
+    # a full batch, as BatchingEmbeddings sends under load
+    embed_batch = query_batch_function(config, embeddings)
+    batch = questions[:CONCURRENT_CLIENTS * 4]
+    start_time = time.perf_counter()
+    embed_batch(batch)
+    batch_seconds = time.perf_counter() - start_time
+    print(json.dumps({
+        **percentiles(seconds),
+        "load_seconds": load_seconds,
+        "batch_queries_per_second": len(batch) / batch_seconds
+    }))
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(scales, queries, answers, keep=False):
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scales": {}
+    }
+    with tempfile.TemporaryDirectory(prefix="benchmark-startup-") as directory:
+        print("startup")
+        results["startup"] = bench_startup(directory)
+        print_startup(results["startup"])
+    for scale in scales:
+        directory = tempfile.mkdtemp(prefix=f"benchmark-{scale}-")
+        print(f"[{scale}] generating corpus in {directory}")
+        scale_results = {"corpus": generate_corpus(directory, scale)}
+        for name, bench in (("ingest", bench_ingest), ("ingest_pdf", bench_ingest_pdf)):
+            print(f"[{scale}] {name}")
+            scale_results[name] = bench(directory)
+            print(f"[{scale}] {name}: {scale_results[name]['chunks']} chunks at {scale_results[name]['chunks_per_second']:.1f}/s, peak RSS {scale_results[name]['peak_rss_mb']:.0f} MB")
+        print(f"[{scale}] retrieval and answers")
+        scale_results.update(bench_queries(directory, queries, answers))
+        retrieval = scale_results["retrieval"]["sequential"]
+        print(f"[{scale}] retrieval p50 {retrieval['p50_ms']:.1f} ms, p95 {retrieval['p95_ms']:.1f} ms, p99 {retrieval['p99_ms']:.1f} ms")
+        for backend, timings in scale_results["vector_search"].items():
+            agreement = f", top-k agreement with Chroma {timings['recall_at_k']:.0%}" if "recall_at_k" in timings else ""
+            print(f"[{scale}] vector search ({backend}) p50 {timings['p50_ms']:.2f} ms, p95 {timings['p95_ms']:.2f} ms{agreement}")
+        print(f"[{scale}] query embedding")
+        scale_results["query_embedding"] = bench_query_embedders(directory, queries)
+        for backend, timings in scale_results["query_embedding"].items():
+            agreement = f", min cosine with stored vectors {timings['min_cosine']:.4f}" if "min_cosine" in timings else ""
+            print(f"[{scale}] query embedding ({backend}) p50 {timings['p50_ms']:.2f} ms, p95 {timings['p95_ms']:.2f} ms, peak RSS {timings['peak_rss_mb']:.0f} MB{agreement}")
+        print(f"[{scale}] answer p50 {scale_results['answer']['total']['p50_ms']:.0f} ms (first token {scale_results['answer']['first_token']['p50_ms']:.0f} ms)")
+        results["scales"][scale] = scale_results
+        if keep:
+            print(f"[{scale}] kept {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+    return path
+
+def flatten(data, prefix=""):
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(old_path, new_path, threshold=DEFAULT_THRESHOLD):
+    """Print the relative change of every shared metric; returns the names of metrics that regressed."""
+    def load(path):
+        with open(path) as f:
+            data = json.load(f)
+        # only the module's own import time is compared, not the breakdown
+        startup = {module: {"import_ms": profile["import_ms"]} for module, profile in data.get("startup", {}).items()}
+        return flatten({"startup": startup, **data["scales"]})
+
+    old = load(old_path)
+    new = load(new_path)
+    regressions = []
+    for name in sorted(set(old) & set(new)):
+        if name.startswith(tuple(f"{scale}.corpus" for scale in SCALES)) or name.endswith((".count", ".chunks", ".clients")) or not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        # throughput and agreement should go up, everything else (time, memory) down
+        worse = -change if name.endswith(("per_second", "recall_at_k", "_cosine")) else change
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif worse < -threshold:
+            flag = "  improved"
+        print(f"{name:50} {old[name]:12.2f} -> {new[name]:12.2f} ({change:+.1%}){flag}")
+    print(f"{len(regressions)} regressions beyond {threshold:.0%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and answer latency on synthetic corpora.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=DEFAULT_SCALES)
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Retrieval queries per scale")
+    parser.add_argument("--answers", type=int, default=DEFAULT_ANSWERS, help="End-to-end answers per scale")
+    parser.add_argument("--keep", action="store_true", help="Keep each scale's work directory")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--startup", action="store_true", help="Only profile the startup imports")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--embedder-worker", choices=list(EMBEDDER_BACKENDS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.queries, args.answers)
+    elif args.embedder_worker:
+        embedder_worker(args.embedder_worker, args.queries)
+    elif args.startup:
+        with tempfile.TemporaryDirectory(prefix="benchmark-startup-") as directory:
+            print_startup(bench_startup(directory))
+    elif args.compare:
+        sys.exit(1 if compare(*args.compare, threshold=args.threshold) else 0)
+    else:
+        run(args.scales, args.queries, args.answers, args.keep)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from tinydb import TinyDB
+import os, threading
+
+AGENT_DB_PATH = "db.json"
+
+class TableSnapshot:
+    """The rows of one TinyDB table, re-read only when its file changes on disk.
+
+    TinyDB's JSON storage parses the whole file on every read, and the app
+    reads the agent row several times per Streamlit rerun (the API once per
+    request). The rows are kept in memory keyed on the file's modification
+    time and size, so a write from this process or any other is picked up on
+    the next read. Callers get copies and write through `replace()`.
+    """
+
+    def __init__(self, path=AGENT_DB_PATH, table="agent"):
+        self.path = path
+        self.table = table
+        self._key = None
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def rows(self):
+        with self._lock:
+            key = self._file_key()
+            if key != self._key:
+                if key is None:
+                    self._rows = []
+                else:
+                    with TinyDB(self.path) as db:
+                        self._rows = [dict(row) for row in db.table(self.table).all()]
+                self._key = key
+            return [dict(row) for row in self._rows]
+
+    def first(self):
+        """The first row (the app keeps a single agent row), or None."""
+        rows = self.rows()
+        return rows[0] if rows else None
+
+    def replace(self, row):
+        """Make `row` the table's only row."""
+        with self._lock:
+            with TinyDB(self.path) as db:
+                table = db.table(self.table)
+                table.truncate()
+                table.insert(row)
+            self._key = None
+
+    def insert_default(self, row):
+        """Insert `row` if the table is empty; returns the first row."""
+        if not self.rows():
+            self.replace(row)
+        return self.first()
+
+    def _file_key(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+_agent_table = None
+_agent_table_lock = threading.Lock()
+
+def get_agent_table():
+    """Return the process-wide snapshot of db.json's agent table."""
+    global _agent_table
+    if _agent_table is None:
+        with _agent_table_lock:
+            if _agent_table is None:
+                _agent_table = TableSnapshot()
+    return _agent_table
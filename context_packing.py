@@ -0,0 +1,208 @@
+from model_manager import OLLAMA_KEEP_ALIVE
+import numpy as np
+import logging, math, re, threading
+
+# Ollama's context size is capped here so large-window models don't allocate huge KV caches
+MAX_NUM_CTX = 8192
+# Used when `ollama.show` doesn't report a context length
+DEFAULT_NUM_CTX = 2048
+# Tokens kept free for the answer
+RESERVED_ANSWER_TOKENS = 512
+# Chat template, separators and instructions around the context
+PROMPT_OVERHEAD_TOKENS = 64
+# Fallback when calibration against the model's tokenizer fails
+DEFAULT_CHARS_PER_TOKEN = 4.0
+# MMR trade-off between relevance to the question (1.0) and diversity (0.0)
+MMR_LAMBDA = 0.7
+# A partially fitting chunk is cut to the budget only if at least this many tokens are left
+MIN_PARTIAL_TOKENS = 64
+# Shortest shared prefix/suffix treated as splitter overlap between two chunks
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+CONTEXT_SEPARATOR = "\n---\n"
+
+CALIBRATION_TEXT = (
+    "RooCode lets you define custom modes in .roomodes or the global custom_modes.json file. "
+    "Each mode has a slug, a name, roleDefinition and groups such as [\"read\", \"edit\", \"command\"]. "
+    "If the extension logs `Error: ECONNREFUSED 127.0.0.1:11434`, check that `ollama serve` is running. "
+    "def load_config(path):\n    with open(path) as fp:\n        return json.load(fp)\n"
+)
+
+class ModelLimits:
+    """Context window of an Ollama model and a token counter calibrated against its tokenizer.
+
+    Ollama has no tokenize endpoint, so the model's own tokenizer is measured
+    once: `prompt_eval_count` for a fixed sample gives characters per token,
+    which is then used to estimate token counts.
+    """
+
+    def __init__(self, num_ctx, chars_per_token):
+        self.num_ctx = num_ctx
+        self.chars_per_token = chars_per_token
+
+    def count_tokens(self, text):
+        return int(math.ceil(len(text) / self.chars_per_token))
+
+    @classmethod
+    def for_model(cls, model, client=None):
+        import ollama
+        client = client or ollama
+        num_ctx = DEFAULT_NUM_CTX
+        try:
+            info = client.show(model)
+            parameters = getattr(info, "parameters", None) or ""
+            match = re.search(r"num_ctx\s+(\d+)", parameters)
+            model_info = getattr(info, "modelinfo", None) or {}
+            context_length = next((value for key, value in model_info.items() if key.endswith(".context_length")), None)
+            if match:
+                num_ctx = int(match.group(1))
+            elif context_length:
+                num_ctx = int(context_length)
+        except Exception as e:
+            print(f"Could not read context length for '{model}': {e}")
+        num_ctx = min(num_ctx, MAX_NUM_CTX)
+        chars_per_token = DEFAULT_CHARS_PER_TOKEN
+        try:
+            # the same context window and keep-alive as converse.get_llm, so Ollama keeps the model
+            # loaded by this request for the answers instead of reloading it
+            result = client.generate(model=model, prompt=CALIBRATION_TEXT, raw=True, options={"num_predict": 1, "num_ctx": num_ctx}, keep_alive=OLLAMA_KEEP_ALIVE)
+            tokens = getattr(result, "prompt_eval_count", None)
+            if tokens:
+                chars_per_token = len(CALIBRATION_TEXT) / tokens
+        except Exception as e:
+            print(f"Could not calibrate tokenizer for '{model}': {e}")
+        return cls(num_ctx, chars_per_token)
+
+_model_limits = {}
+_model_limits_lock = threading.Lock()
+
+def get_model_limits(model):
+    """Cached `ModelLimits` for `model`; measured on first use."""
+    if model not in _model_limits:
+        with _model_limits_lock:
+            if model not in _model_limits:
+                _model_limits[model] = ModelLimits.for_model(model)
+    return _model_limits[model]
+
+class PackedContext:
+    def __init__(self, text, docs, tokens, budget):
+        self.text = text
+        self.docs = docs
+        self.tokens = tokens
+        self.budget = budget
+
+def context_budget(limits, system_message, question, max_context_tokens=None):
+    budget = limits.num_ctx - RESERVED_ANSWER_TOKENS - PROMPT_OVERHEAD_TOKENS
+    budget -= limits.count_tokens(system_message) + limits.count_tokens(question)
+    if max_context_tokens is not None:
+        budget = min(budget, max_context_tokens)
+    return max(0, budget)
+
+def pack_context(question, docs, limits, budget, embedding_function=None, query_embedding=None, doc_vectors=None):
+    """Choose and order chunks for the prompt within `budget` tokens.
+
+    Exact and contained duplicates are dropped and text shared with an already
+    chosen neighbouring chunk (the splitter's overlap) is trimmed. Chunks are
+    picked by maximal marginal relevance when an embedder is available, else in
+    retrieval order. The last chunk is cut at a word boundary if it only partly fits.
+    If not even `MIN_PARTIAL_TOKENS` of the top chunk fit (a long question or
+    system message), that much of it is kept anyway, with a warning, so the
+    answer is never generated without context.
+    `query_embedding` and `doc_vectors` ({chunk text: vector}, from the same
+    embedder) are used instead of embedding the question and those chunks again.
+    """
+    texts = _dedupe([doc.page_content for doc in docs])
+    text_docs = {}
+    for doc in docs:
+        text_docs.setdefault(doc.page_content, doc)
+    if embedding_function is not None and len(texts) > 1:
+        order = _mmr_order(question, texts, embedding_function, query_embedding, doc_vectors or {})
+    else:
+        order = list(range(len(texts)))
+
+    chosen = []
+    chosen_docs = []
+    used = 0
+    for i in order:
+        text = _trim_overlap(texts[i], chosen)
+        if not text.strip():
+            continue
+        separator = limits.count_tokens(CONTEXT_SEPARATOR) if chosen else 0
+        tokens = limits.count_tokens(text) + separator
+        if used + tokens > budget:
+            remaining = budget - used - separator
+            if remaining >= MIN_PARTIAL_TOKENS:
+                text = _cut(text, int(remaining * limits.chars_per_token))
+                chosen.append(text)
+                chosen_docs.append(text_docs.get(texts[i]))
+                used += limits.count_tokens(text) + separator
+            break
+        chosen.append(text)
+        chosen_docs.append(text_docs.get(texts[i]))
+        used += tokens
+    if texts and not chosen:
+        logging.warning(f"Context budget of {budget} tokens leaves no room for the retrieved chunks; keeping the top chunk cut to {MIN_PARTIAL_TOKENS} tokens")
+        text = _cut(texts[order[0]], int(MIN_PARTIAL_TOKENS * limits.chars_per_token))
+        chosen.append(text)
+        chosen_docs.append(text_docs.get(texts[order[0]]))
+        used = limits.count_tokens(text)
+    return PackedContext(CONTEXT_SEPARATOR.join(chosen), [doc for doc in chosen_docs if doc is not None], used, budget)
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def _dedupe(texts):
+    """Drop empty chunks, exact duplicates and chunks contained in another, keeping the first occurrence."""
+    normalized = [_normalize(text) for text in texts]
+    kept = []
+    for i, text in enumerate(texts):
+        if not normalized[i]:
+            continue
+        contained = any(
+            j != i and normalized[i] in normalized[j] and (len(normalized[j]) > len(normalized[i]) or j < i)
+            for j in range(len(texts))
+        )
+        if not contained:
+            kept.append(text)
+    return kept
+
+def _trim_overlap(text, chosen):
+    """Remove a prefix of `text` that repeats the end of a chosen chunk, or a suffix that repeats its start."""
+    for other in chosen:
+        limit = min(MAX_OVERLAP_CHARS, len(text) - 1, len(other))
+        for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+            if other.endswith(text[:size]):
+                text = text[size:]
+                break
+            if other.startswith(text[-size:]):
+                text = text[:-size]
+                break
+    return text
+
+def _mmr_order(question, texts, embedding_function, query_embedding=None, doc_vectors=None):
+    missing = [text for text in texts if text not in doc_vectors]
+    embedded = dict(zip(missing, embedding_function.embed_documents(missing))) if missing else {}
+    vectors = np.asarray([doc_vectors[text] if text in doc_vectors else embedded[text] for text in texts], dtype=np.float32)
+    if query_embedding is None:
+        query_embedding = embedding_function.embed_query(question)
+    query = np.array(query_embedding, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+    query /= np.linalg.norm(query) + 1e-9
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    order = [int(np.argmax(relevance))]
+    remaining = [i for i in range(len(texts)) if i != order[0]]
+    while remaining:
+        redundancy = similarity[np.ix_(remaining, order)].max(axis=1)
+        scores = MMR_LAMBDA * relevance[remaining] - (1 - MMR_LAMBDA) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        order.append(best)
+        remaining.remove(best)
+    return order
+
+def _cut(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > max_chars // 2 else cut).rstrip() + " …"
@@ -1,46 +1,300 @@
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.documents import Document
-from tinydb import TinyDB
-import json
-
-# Set to True to enable web search
+from concurrent.futures import Future
+from retrieval import get_retrieval_service
+from context_packing import context_budget, get_model_limits, pack_context
+from model_manager import OLLAMA_KEEP_ALIVE, get_model_manager
+from model_router import Route, get_model_router
+from web_search import get_web_search
+from tracing import annotate, current_trace, span
+import asyncio, importlib, logging, os, threading, time
+
+# Set to True to search the web (web_search.py) alongside the knowledge base by default
 WEB_SEARCH_ENABLED = False
 # Set to True to enable speech output on Mac
 SPEAK_ALOUD_MAC_ENABLED = False
 # Set to True to enable debug logging
 DEBUG_ENABLED = False
 
-db = TinyDB('db.json') # Corrected filename
-agent_table = db.table('agent') # Corrected table name
+# Ollama server; None lets the ollama client read OLLAMA_HOST (default http://localhost:11434)
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_HOST")
+# Keep-alive connections held open to Ollama by each model's client
+OLLAMA_MAX_CONNECTIONS = 8
+OLLAMA_TIMEOUT_SECONDS = 300
+
+# LangChain's Ollama integration (and through it langsmith) takes about a second to import, so it
+# is imported by the first `get_llm` call or by `warm_up_in_background`, not with this module
+_llms = {}
+_llms_lock = threading.Lock()
+
+def get_llm(model):
+    """Shared `OllamaLLM` for `model`, so its HTTP connection pool is reused across questions.
+
+    The async client binds to the event loop that first uses it, which is the API server's loop.
+    """
+    if model not in _llms:
+        import httpx
+        from langchain_ollama import OllamaLLM
+        with _llms_lock:
+            if model not in _llms:
+                # run the model with the same context window the packer budgets for
+                _llms[model] = OllamaLLM(
+                    model=model,
+                    num_ctx=get_model_limits(model).num_ctx,
+                    keep_alive=OLLAMA_KEEP_ALIVE,
+                    base_url=OLLAMA_BASE_URL,
+                    client_kwargs={
+                        "timeout": OLLAMA_TIMEOUT_SECONDS,
+                        "limits": httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=OLLAMA_MAX_CONNECTIONS)
+                    }
+                )
+    return _llms[model]
+
+def warm_up_in_background(model=None):
+    """Load the retrieval service and the Ollama client on a background thread, and queue `model` to be preloaded.
+
+    Returns a `Future` for the `RetrievalService`, so a UI can render while
+    the embedding models load and block only when the first question needs them.
+    The model itself loads in Ollama independently (see `model_manager.py`).
+    """
+    future = Future()
+
+    def run():
+        try:
+            if model:
+                get_model_manager().preload(model)
+                router = get_model_router()
+                if router.enabled and router.fast_model != model:
+                    get_model_manager().preload(router.fast_model)
+            service = get_retrieval_service(warm_up=True)
+            if model:
+                get_llm(model)
+            # imported for their import time only
+            modules = ["langchain_core.prompts", "langchain_core.output_parsers", "langchain_core.runnables"]
+            for module in modules if model else ["langchain_ollama"] + modules:
+                importlib.import_module(module)
+            future.set_result(service)
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
+    return future
+
+class StreamTimer:
+    """Splits a streamed answer into the current trace's `llm.first_token` and `llm.generate` spans.
+
+    Time to the first chunk covers Ollama queueing, model loading and prompt
+    evaluation; the rest is token generation.
+    """
 
-class Converse:
     def __init__(self):
-        self.embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        self.vectorstore = Chroma(persist_directory="./chroma_db", embedding_function=self.embedding_function) # Corrected persist_directory
-        self.retriever = self.vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 6})
+        self.trace = current_trace()
+        self.start = time.perf_counter()
+        self.first = None
+        self.chunks = 0
+
+    def chunk(self):
+        self.chunks += 1
+        if self.first is None:
+            self.first = time.perf_counter()
+            if self.trace is not None:
+                self.trace.add_span("llm.first_token", self.start, self.first)
+
+    def done(self):
+        if self.trace is None:
+            return
+        end = time.perf_counter()
+        self.trace.add_span("llm.generate", self.first or end, end)
+        self.trace.annotate(chunks=self.chunks)
+
+class Converse:
+    def __init__(self, embedding_function=None, vectorstore=None, retriever=None, answer_cache=None, router=None, retrieval_service=None, web_search=None):
+        # Reuse the process-wide handles unless the caller injects its own
+        if embedding_function is None or vectorstore is None or retriever is None:
+            service = retrieval_service or get_retrieval_service()
+            retrieval_service = service
+            if embedding_function is None:
+                embedding_function = service.embedding_function
+            if vectorstore is None:
+                vectorstore = service.vectorstore
+            if retriever is None:
+                retriever = service.retriever
+        self.embedding_function = embedding_function
+        self.vectorstore = vectorstore
+        self.retriever = retriever
+        # `retrieval.RetrievalService` whose query cache `retrieve` goes through, if any
+        self.retrieval_service = retrieval_service if retrieval_service is not None and retrieval_service.retriever is retriever else None
+        # optional `web_search.WebSearch` run alongside retrieval; defaults to the shared one if
+        # WEB_SEARCH_ENABLED, and False turns it off either way
+        if web_search is None and WEB_SEARCH_ENABLED:
+            web_search = get_web_search()
+        self.web_search = web_search or None
+        # optional `answer_cache.AnswerCache`; `last_cache_hit` holds the cached entry when the last answer came from it
+        self.answer_cache = answer_cache
+        self.last_cache_hit = None
+        # `model_router.ModelRouter`; `last_route` is the decision for the current question
+        self.router = router or get_model_router()
+        self.last_route = None
+        # (question, embedding) from the last `retrieve`, reused by `pack_context`
+        self._query_embedding = None
 
-    def chat(self, query, agent_table_row):
-        llm = OllamaLLM(model=agent_table_row["model"])
+    def retrieve(self, question, filters=None):
+        """Documents for `question`, restricted by `filters` (a `search_filters.SearchFilters`).
+
+        The filters become Chroma `where` clauses applied before the similarity search.
+        With `web_search`, the web search is started first and runs while the
+        knowledge base is searched; its results (if back within its deadline)
+        follow the retrieved chunks, and `pack_context` picks from both.
+        """
+        search = None
+        if self.web_search is not None and (filters is None or filters.allows_source("web")):
+            search = self.web_search.submit(question)
+        try:
+            if self.retrieval_service is not None:
+                docs, embedding = self.retrieval_service.retrieve_with_embedding(question, filters)
+                self._query_embedding = (question, embedding)
+            else:
+                docs, _ = self.retriever.search(question, filters=filters)
+        except Exception:
+            if search is not None:
+                search.cancel()
+            raise
+        if search is not None:
+            with span("web_search.wait"):
+                docs = list(docs or []) + self.web_search.documents(search)
+        return docs
+
+    def route(self, question, agent_table_row, docs=None):
+        """Pick the fast or main model for `question`; returns a copy of `agent_table_row` with that model.
+
+        The selected model is the main model. Call before `pack_context` so the
+        context is packed for the model that will answer.
+        """
+        self.last_route = self.router.route(question, agent_table_row["model"], docs)
+        return {**agent_table_row, "model": self.last_route.model}
+
+    def pack_context(self, question, docs, agent_table_row, max_context_tokens=None):
+        """Fit retrieved `docs` into the selected model's context window; returns a `PackedContext`."""
+        limits = get_model_limits(agent_table_row["model"])
+        budget = context_budget(limits, agent_table_row["system_message"], question, max_context_tokens)
+        with span("pack_context"):
+            query_embedding = None
+            doc_vectors = None
+            # the stored vectors and the query embedding are only comparable when they come from our embedder
+            if self.retrieval_service is not None and self.embedding_function is self.retrieval_service.embedding_function:
+                if self._query_embedding is not None and self._query_embedding[0] == question:
+                    query_embedding = self._query_embedding[1]
+                try:
+                    doc_vectors = self.retrieval_service.document_vectors(docs)
+                except Exception as e:
+                    logging.error(f"Could not read stored chunk vectors, embedding them instead: {e}")
+            return pack_context(question, docs, limits, budget, self.embedding_function, query_embedding, doc_vectors)
+
+    def chat(self, question, agent_table_row, context=None, use_cache=True):
+        """Answer `question`. `context` is packed context text; "" means retrieval found nothing, None means no RAG."""
+        cached = self._cached_answer(question, context, agent_table_row, use_cache)
+        if cached is not None:
+            return cached["response"]
+        start_time = time.perf_counter()
+        chain, message = self._build_prompt(question, context, agent_table_row)
+        with self.router.track(self._current_route(agent_table_row)), span("llm.generate"):
+            response = chain.invoke(message)
+        self._store_answer(question, context, agent_table_row, response, time.perf_counter() - start_time)
+        return response
+
+    def stream(self, question, agent_table_row, context=None, use_cache=True):
+        """Same prompt and chain as `chat`, but yields text chunks as Ollama produces them.
+
+        A cached answer is yielded as a single chunk.
+        """
+        cached = self._cached_answer(question, context, agent_table_row, use_cache)
+        if cached is not None:
+            yield cached["response"]
+            return
+        start_time = time.perf_counter()
+        chain, message = self._build_prompt(question, context, agent_table_row)
+        chunks = []
+        timer = StreamTimer()
+        with self.router.track(self._current_route(agent_table_row)):
+            for chunk in chain.stream(message):
+                timer.chunk()
+                chunks.append(chunk)
+                yield chunk
+        timer.done()
+        self._store_answer(question, context, agent_table_row, "".join(chunks), time.perf_counter() - start_time)
+
+    async def achat(self, question, agent_table_row, context=None, use_cache=True):
+        """Async `chat`, for callers running an event loop (the HTTP API)."""
+        cached = await asyncio.to_thread(self._cached_answer, question, context, agent_table_row, use_cache)
+        if cached is not None:
+            return cached["response"]
+        start_time = time.perf_counter()
+        chain, message = self._build_prompt(question, context, agent_table_row)
+        with self.router.track(self._current_route(agent_table_row)), span("llm.generate"):
+            response = await chain.ainvoke(message)
+        await asyncio.to_thread(self._store_answer, question, context, agent_table_row, response, time.perf_counter() - start_time)
+        return response
+
+    async def astream(self, question, agent_table_row, context=None, use_cache=True):
+        """Async `stream`; the answer is only cached if the stream is read to the end."""
+        cached = await asyncio.to_thread(self._cached_answer, question, context, agent_table_row, use_cache)
+        if cached is not None:
+            yield cached["response"]
+            return
+        start_time = time.perf_counter()
+        chain, message = self._build_prompt(question, context, agent_table_row)
+        chunks = []
+        timer = StreamTimer()
+        with self.router.track(self._current_route(agent_table_row)):
+            async for chunk in chain.astream(message):
+                timer.chunk()
+                chunks.append(chunk)
+                yield chunk
+        timer.done()
+        await asyncio.to_thread(self._store_answer, question, context, agent_table_row, "".join(chunks), time.perf_counter() - start_time)
+
+    def _current_route(self, agent_table_row):
+        if self.last_route is not None and self.last_route.model == agent_table_row["model"]:
+            return self.last_route
+        return Route("main", agent_table_row["model"], "not routed")
+
+    def _cached_answer(self, question, context, agent_table_row, use_cache):
+        """Look the answer up unless caching is off or bypassed; a bypassed answer still refreshes the cache."""
+        self.last_cache_hit = None
+        if self.answer_cache is None or not use_cache:
+            return None
+        with span("answer_cache.lookup"):
+            self.last_cache_hit = self.answer_cache.get(agent_table_row["model"], agent_table_row["system_message"], context or "", question)
+        annotate(answer_cache_hit=self.last_cache_hit is not None)
+        return self.last_cache_hit
+
+    def _store_answer(self, question, context, agent_table_row, response, generation_seconds):
+        if self.answer_cache is None:
+            return
+        self.answer_cache.put(agent_table_row["model"], agent_table_row["system_message"], context or "", question, response, generation_seconds)
+
+    def _build_prompt(self, question, context, agent_table_row):
+        with span("prompt.build"):
+            annotate(model=agent_table_row["model"], context_chars=len(context or ""))
+            return self._build_chain(agent_table_row), self._build_human_message(question, context)
+
+    def _build_chain(self, agent_table_row):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.runnables import RunnablePassthrough
+        llm = get_llm(agent_table_row["model"])
         prompt_template = ChatPromptTemplate.from_messages([
             ("system", agent_table_row["system_message"]),
             ("human", "{query}")
         ])
-        chain = (
+        return (
             {"query": RunnablePassthrough()}
             | prompt_template
             | llm
             | StrOutputParser()
         )
-        # Handle context and question separately
-        if "Context:" in query:
-            context, question = query.split("\nQuestion: ", 1)
-            context = context.replace("Context: ", "")
-            if context == "No relevant context found.":
-                return chain.invoke("I couldn't find relevant context. Here's my best answer: " + question)
-            return chain.invoke(f"Here's some context to help you answer my question: {context}\n\nHere's my question: {question}")
-        return chain.invoke(query)
+
+    def _build_human_message(self, question, context):
+        if context is None:
+            return question
+        if not context:
+            return "I couldn't find relevant context. Here's my best answer: " + question
+        return f"Here's some context to help you answer my question: {context}\n\nHere's my question: {question}"
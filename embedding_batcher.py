@@ -0,0 +1,118 @@
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+import queue, threading, time
+
+# Most queries embedded in one forward pass
+DEFAULT_MAX_BATCH_SIZE = 32
+# How long the worker holds a batch open for more queries while under load
+DEFAULT_MAX_WAIT_MS = 5.0
+# Batch sizes counted in the `stats()` histogram: 1, 2-3, 4-7, 8-15, ...
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+class BatchingEmbeddings(Embeddings):
+    """Wraps an `Embeddings` so concurrent `embed_query` calls share one forward pass.
+
+    Queries go onto a queue and a dedicated worker thread embeds them in
+    batches of up to `max_batch_size`, resolving one `Future` per query. The
+    worker always takes every query that queued while the previous batch was
+    running. It only holds a batch open for up to `max_wait_ms` for more
+    queries when the previous batch had more than one, so a single user never
+    pays the wait.
+
+    `embed_queries` embeds a list of queries exactly as `embed_query` embeds
+    one; without it, queries are embedded one by one on the worker thread.
+    `embed_documents` is not batched and calls the wrapped embedder directly.
+    """
+
+    def __init__(self, embeddings, embed_queries=None, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.embeddings = embeddings
+        self.embed_queries = embed_queries or (lambda texts: [embeddings.embed_query(text) for text in texts])
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.model_name = getattr(embeddings, "model_name", None)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._last_batch_size = 0
+        self._requests = 0
+        self._batches = 0
+        self._largest_batch = 0
+        self._queue_seconds = 0.0
+        self._compute_seconds = 0.0
+        self._histogram = [0] * len(HISTOGRAM_BUCKETS)
+        self._worker = threading.Thread(target=self._run, name="query-embedding", daemon=True)
+        self._worker.start()
+
+    def submit(self, text):
+        """Queue `text` for embedding; returns a `Future` for its vector."""
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def embed_query(self, text):
+        return self.submit(text).result()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.perf_counter()
+                if self._last_batch_size <= 1 or remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._embed(batch)
+
+    def _embed(self, batch):
+        # skip queries whose caller already gave up on them
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        start_time = time.perf_counter()
+        try:
+            vectors = self.embed_queries([text for text, _, _ in batch])
+            if len(vectors) != len(batch):
+                # zip() would leave the callers past the end waiting forever
+                raise ValueError(f"embedding model returned {len(vectors)} vectors for a batch of {len(batch)}")
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            vectors = None
+        compute_seconds = time.perf_counter() - start_time
+        if vectors is not None:
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(list(vector))
+        self._last_batch_size = len(batch)
+        with self._lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._largest_batch = max(self._largest_batch, len(batch))
+            self._queue_seconds += sum(start_time - queued_at for _, _, queued_at in batch)
+            self._compute_seconds += compute_seconds
+            bucket = max(i for i, size in enumerate(HISTOGRAM_BUCKETS) if len(batch) >= size)
+            self._histogram[bucket] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "requests": self._requests,
+                "batches": self._batches,
+                "average_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "average_queue_ms": 1000.0 * self._queue_seconds / self._requests if self._requests else 0.0,
+                "average_batch_ms": 1000.0 * self._compute_seconds / self._batches if self._batches else 0.0,
+                "pending": self._queue.qsize(),
+                "batch_size_histogram": {str(size): count for size, count in zip(HISTOGRAM_BUCKETS, self._histogram)}
+            }
@@ -0,0 +1,164 @@
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import hashlib, os, re, sqlite3, threading, time, unicodedata
+
+EMBEDDING_CACHE_DIR = "./embedding_cache"
+# Default cap on cached vectors per model; 384-dim float32 vectors make this ~1.5 GB
+DEFAULT_MAX_ENTRIES = 1_000_000
+INITIAL_CAPACITY = 4096
+# SQLite's default limit on bound parameters is 999
+LOOKUP_BATCH_SIZE = 900
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+def text_key(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+class CachedEmbeddings(Embeddings):
+    """Wraps any LangChain `Embeddings` with a persistent per-model vector cache.
+
+    Vectors live in a memory-mapped float32 matrix (`vectors.f32`) and an SQLite
+    index maps the hash of each normalized chunk to its row and last use. Only
+    texts missing from the cache reach the wrapped model. Once `max_entries` (or
+    `max_bytes`) is reached, the least recently used rows are overwritten.
+    Query embeddings pass straight through, since some models embed queries and
+    documents differently. The cache assumes a single writing process.
+    """
+
+    def __init__(self, embeddings, model_name=None, cache_dir=EMBEDDING_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model_name", None) or type(embeddings).__name__
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", self.model_name))
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._connection = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        meta = dict(self._connection.execute("SELECT key, value FROM meta").fetchall())
+        self.dim = meta.get("dim")
+        self.capacity = meta.get("capacity", 0)
+        self._used = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if self.dim:
+            self._open_vectors()
+
+    def embed_documents(self, texts):
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            slots = self._lookup(set(keys))
+            if slots:
+                found = np.asarray(self._vectors[sorted(set(slots.values()))])
+                rows = {slot: row for slot, row in zip(sorted(set(slots.values())), found)}
+                cached = {key: rows[slot] for key, slot in slots.items()}
+            else:
+                cached = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - sum(1 for key in keys if key in missing)
+        self.misses += sum(1 for key in keys if key in missing)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), np.asarray(vectors, dtype=np.float32)))
+            with self._lock:
+                self._store(computed)
+            cached.update(computed)
+        return [cached[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "entries": self._used,
+            "capacity": self.capacity,
+            "bytes": self.capacity * (self.dim or 0) * 4,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _lookup(self, keys):
+        """Return {key: slot} for cached keys and mark them as recently used."""
+        if not keys or not self.dim:
+            return {}
+        keys = list(keys)
+        slots = {}
+        for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[i:i + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            slots.update(self._connection.execute(f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", batch).fetchall())
+        if slots:
+            now = time.time()
+            with self._connection:
+                self._connection.executemany("UPDATE entries SET last_used = ? WHERE key = ?", ((now, key) for key in slots))
+        return slots
+
+    def _store(self, computed):
+        if not computed:
+            return
+        if not self.dim:
+            self.dim = len(next(iter(computed.values())))
+            with self._connection:
+                self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (self.dim,))
+        # another thread may have stored some of these while the model was running
+        computed = {key: vector for key, vector in computed.items() if key not in self._lookup(computed.keys())}
+        if not computed:
+            return
+        limit = self._max_rows()
+        # a single batch bigger than the whole cache only keeps its tail
+        items = list(computed.items())[-limit:]
+        if self._used + len(items) > self.capacity and self.capacity < limit:
+            self._grow(min(limit, max(self._used + len(items), self.capacity * 2, INITIAL_CAPACITY)))
+        # rows are filled in order, so slots below `_used` are all taken
+        fresh = min(len(items), self.capacity - self._used)
+        slots = list(range(self._used, self._used + fresh))
+        with self._connection:
+            if fresh < len(items):
+                # overwrite the least recently used rows
+                evicted = self._connection.execute(
+                    "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (len(items) - fresh,)
+                ).fetchall()
+                self._connection.executemany("DELETE FROM entries WHERE key = ?", ((key,) for key, _ in evicted))
+                slots.extend(slot for _, slot in evicted)
+            for slot, (_, vector) in zip(slots, items):
+                self._vectors[slot] = vector
+            self._vectors.flush()
+            now = time.time()
+            self._connection.executemany(
+                "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                ((key, slot, now) for slot, (key, _) in zip(slots, items))
+            )
+        self._used += fresh
+
+    def _max_rows(self):
+        if self.max_bytes is not None:
+            return max(1, min(self.max_entries, self.max_bytes // (self.dim * 4)))
+        return self.max_entries
+
+    def _grow(self, capacity):
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self._vectors_path(), "ab") as fp:
+            fp.truncate(capacity * self.dim * 4)
+        self.capacity = capacity
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('capacity', ?)", (capacity,))
+        self._open_vectors()
+
+    def _open_vectors(self):
+        if self.capacity:
+            self._vectors = np.memmap(self._vectors_path(), dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _vectors_path(self):
+        return os.path.join(self.directory, "vectors.f32")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Fake GitHub API for Scraper2Notebook
+
+Serves the REST endpoints scrape_github.py uses (repo, git tree, git blob,
+releases, issues and issue comments) from generated content. It answers
+If-None-Match with 304 the way GitHub does, paginates with Link headers, and
+counts requests, so caching and concurrency can be checked locally. Repos named
+in `failing_repos` answer every request with a 502.
+
+Usage: python fake_github.py [--port 8765] [--repos 3] [--docs 20] [--issues 150]
+Then:  GITHUB_API_URL=http://127.0.0.1:8765 python scrape_github.py
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+import argparse, hashlib, json, random, re, threading, time
+
+DEFAULT_PORT = 8765
+RATE_LIMIT = 5000
+
+class FakeGitHub:
+    """A threaded fake GitHub API; `start()` runs it in the background, `url` is its base URL."""
+
+    def __init__(self, repos=None, host="127.0.0.1", port=DEFAULT_PORT, latency=0.0):
+        # {"owner/name": {"description", "docs": {path: text}, "releases": [...], "issues": [...]}}
+        self.repos = repos or {}
+        self.latency = latency
+        self.requests = 0
+        self.not_modified = 0
+        self.failing_repos = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @classmethod
+    def generate(cls, repos=3, docs=20, releases=5, issues=150, seed=0, **kwargs):
+        rng = random.Random(seed)
+        content = {}
+        for r in range(repos):
+            name = f"example/repo-{r}"
+            content[name] = {
+                "description": f"Example repository {r}",
+                "docs": {f"docs/page-{d}.md": f"# Page {d}\n\n" + "Documentation text. " * rng.randint(20, 200) for d in range(docs)},
+                "releases": [{"id": r * 1000 + i, "tag_name": f"v1.{i}.0", "name": f"Release 1.{i}", "body": f"Changes in 1.{i}"} for i in range(releases)],
+                "issues": [
+                    {"number": i + 1, "title": f"Issue {i + 1}", "body": "Steps to reproduce. " * rng.randint(1, 20), "state": "open" if i % 3 else "closed", "comments": ["A reply."] * (i % 4)}
+                    for i in range(issues)
+                ]
+            }
+            content[name]["docs"]["README.md"] = f"# repo-{r}\n\nRead me."
+        return cls(content, **kwargs)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-github", daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def set_doc(self, repo, path, text):
+        self.repos[repo]["docs"][path] = text
+
+    def _resolve(self, path, query):
+        """Return (JSON-able body or raw bytes, next page query or None) for an API path, or None."""
+        match = re.fullmatch(r"/repos/([^/]+/[^/]+)(/.*)?", path)
+        if not match or match.group(1) not in self.repos:
+            return None
+        name, rest = match.group(1), match.group(2) or ""
+        repo = self.repos[name]
+        if rest == "":
+            return {"full_name": name, "description": repo["description"], "default_branch": "main", "topics": [], "html_url": f"https://github.com/{name}"}, None
+        if rest.startswith("/git/trees/"):
+            tree = [{"path": path, "type": "blob", "sha": blob_sha(text)} for path, text in sorted(repo["docs"].items())]
+            return {"sha": "tree", "tree": tree, "truncated": False}, None
+        if rest.startswith("/git/blobs/"):
+            sha = rest.rsplit("/", 1)[-1]
+            text = next((text for text in repo["docs"].values() if blob_sha(text) == sha), None)
+            return (text.encode("utf-8"), None) if text is not None else None
+        if rest == "/releases":
+            return self._page(repo["releases"], query)
+        if rest == "/issues":
+            issues = [
+                {"number": issue["number"], "title": issue["title"], "body": issue["body"], "state": issue["state"], "comments": len(issue["comments"]), "labels": [], "html_url": f"https://github.com/{name}/issues/{issue['number']}"}
+                for issue in repo["issues"]
+            ]
+            return self._page(issues, query)
+        match = re.fullmatch(r"/issues/(\d+)/comments", rest)
+        if match:
+            issue = next((issue for issue in repo["issues"] if issue["number"] == int(match.group(1))), None)
+            return self._page([{"body": body} for body in issue["comments"]], query) if issue else None
+        return None
+
+    def _page(self, items, query):
+        per_page = int(query.get("per_page", ["30"])[0])
+        page = int(query.get("page", ["1"])[0])
+        next_query = None
+        if page * per_page < len(items):
+            next_query = {key: values[0] for key, values in query.items()}
+            next_query["page"] = str(page + 1)
+        return items[(page - 1) * per_page:page * per_page], next_query
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                if any(parsed.path.startswith(f"/repos/{repo}") for repo in fake.failing_repos):
+                    self._send(502, json.dumps({"message": "Bad Gateway"}).encode("utf-8"))
+                    return
+                result = fake._resolve(parsed.path, query)
+                if result is None:
+                    self._send(404, json.dumps({"message": "Not Found"}).encode("utf-8"))
+                    return
+                body, next_query = result
+                data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    with fake._lock:
+                        fake.not_modified += 1
+                    self._send(304, b"", {"ETag": etag})
+                    return
+                headers = {"ETag": etag, "X-RateLimit-Remaining": str(max(0, RATE_LIMIT - fake.requests + fake.not_modified))}
+                if next_query:
+                    headers["Link"] = f'<http://{self.headers["Host"]}{parsed.path}?{urlencode(next_query)}>; rel="next"'
+                self._send(200, data, headers, "application/octet-stream" if isinstance(body, bytes) else "application/json")
+
+            def _send(self, status, data, headers=None, content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+def blob_sha(text):
+    """Git's blob SHA-1 for `text`."""
+    data = text.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake GitHub API for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--repos", type=int, default=3)
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--issues", type=int, default=150)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    args = parser.parse_args()
+    fake = FakeGitHub.generate(args.repos, args.docs, issues=args.issues, host=args.host, port=args.port, latency=args.latency)
+    print(f"Fake GitHub API listening on {fake.url} with repos: {', '.join(fake.repos)}")
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
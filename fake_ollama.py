@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Fake Ollama server for Scraper2Notebook
+
+Speaks enough of the Ollama HTTP API (/api/tags, /api/show, /api/ps,
+/api/generate, /api/chat) for converse.py, context_packing.py and api.py to run
+without a GPU or a real model. Answers are deterministic and streamed token by
+token with configurable delays, and the server counts how many generations ran
+at once so concurrency limits can be checked. Like Ollama, a model not in
+memory is loaded first (taking `load_delay`, one load at a time) and stays for
+the request's keep_alive; /api/ps lists the loaded models. A request with a
+different options.num_ctx than the loaded model reloads it, as Ollama does.
+
+Usage: python fake_ollama.py [--port 11435] [--token-delay 0.01] [--first-token-delay 0.05] [--load-delay 0]
+Then:  OLLAMA_HOST=http://127.0.0.1:11435 uvicorn api:app
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse, json, re, threading, time
+
+DEFAULT_PORT = 11435
+DEFAULT_MODELS = ["llama3:8b", "qwen2.5:1.5b"]
+DEFAULT_NUM_CTX = 8192
+# Characters per prompt token reported in prompt_eval_count
+CHARS_PER_TOKEN = 4
+# Ollama's keep-alive when a request doesn't set one, in seconds
+DEFAULT_KEEP_ALIVE_SECONDS = 300
+# Memory reported by /api/ps for each loaded model
+MODEL_SIZE_BYTES = 512 * 1024 * 1024
+
+class FakeOllama:
+    """A threaded fake Ollama server; `start()` runs it in the background, `url` is its base URL."""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, models=DEFAULT_MODELS, token_delay=0.01, first_token_delay=0.05, answer_tokens=24, load_delay=0.0):
+        self.models = list(models)
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.answer_tokens = answer_tokens
+        self.load_delay = load_delay
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.loads = 0
+        # model -> time.time() it is unloaded at
+        self.loaded = {}
+        # model -> num_ctx it was loaded with
+        self.loaded_num_ctx = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def answer(self, model, prompt):
+        """The tokens generated for `prompt`: the model name followed by the prompt's last words."""
+        words = prompt.split()[-self.answer_tokens:] or ["nothing"]
+        return [f"[{model}]"] + [" " + word for word in words]
+
+    def load(self, model, keep_alive=None, num_ctx=None):
+        """Load `model` unless it is in memory with the same `num_ctx`, then keep it for `keep_alive` (Ollama's duration string or seconds; 0 unloads)."""
+        num_ctx = num_ctx or DEFAULT_NUM_CTX
+        with self._load_lock:
+            if self.loaded.get(model, 0) <= time.time() or self.loaded_num_ctx.get(model) != num_ctx:
+                time.sleep(self.load_delay)
+                with self._lock:
+                    self.loads += 1
+                self.loaded_num_ctx[model] = num_ctx
+            seconds = parse_duration(keep_alive)
+            if seconds == 0:
+                self.loaded.pop(model, None)
+            else:
+                self.loaded[model] = time.time() + seconds if seconds > 0 else float("inf")
+
+    def _enter(self):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": [fake._model_entry(name) for name in fake.models]})
+                elif self.path == "/api/ps":
+                    now = time.time()
+                    self._send_json({"models": [
+                        {
+                            **fake._model_entry(name),
+                            "size": MODEL_SIZE_BYTES,
+                            "size_vram": 0,
+                            "expires_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(min(expires, now + 10 ** 9)))
+                        }
+                        for name, expires in list(fake.loaded.items()) if expires > now
+                    ]})
+                elif self.path == "/api/version":
+                    self._send_json({"version": "0.0.0-fake"})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                body = self._read_json()
+                model = body.get("model")
+                if self.path in ("/api/show", "/api/generate", "/api/chat") and model not in fake.models:
+                    self._send_json({"error": f"model '{model}' not found"}, 404)
+                elif self.path == "/api/show":
+                    self._send_json({
+                        "modelfile": "",
+                        "parameters": f"num_ctx {DEFAULT_NUM_CTX}",
+                        "template": "{{ .Prompt }}",
+                        "details": {"format": "gguf", "family": "fake", "parameter_size": "0B", "quantization_level": "Q4_0"},
+                        "model_info": {"fake.context_length": DEFAULT_NUM_CTX}
+                    })
+                elif self.path == "/api/generate" and not body.get("prompt"):
+                    # an empty prompt only loads (or with keep_alive 0, unloads) the model
+                    fake.load(model, body.get("keep_alive"), (body.get("options") or {}).get("num_ctx"))
+                    self._send_json({**self._part(model, "", chat=False), "done": True, "done_reason": "load"})
+                elif self.path == "/api/generate":
+                    self._generate(model, body.get("prompt", ""), body, chat=False)
+                elif self.path == "/api/chat":
+                    prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+                    self._generate(model, prompt, body, chat=True)
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def _generate(self, model, prompt, body, chat):
+                fake._enter()
+                try:
+                    fake.load(model, body.get("keep_alive"), (body.get("options") or {}).get("num_ctx"))
+                    num_predict = (body.get("options") or {}).get("num_predict")
+                    tokens = fake.answer(model, prompt)
+                    if num_predict is not None and num_predict >= 0:
+                        tokens = tokens[:num_predict]
+                    final = {
+                        "done": True,
+                        "done_reason": "stop",
+                        "total_duration": 0,
+                        "load_duration": 0,
+                        "prompt_eval_count": max(1, len(prompt) // CHARS_PER_TOKEN),
+                        "eval_count": len(tokens)
+                    }
+                    time.sleep(fake.first_token_delay)
+                    if body.get("stream", True) is False:
+                        time.sleep(fake.token_delay * len(tokens))
+                        self._send_json({**self._part(model, "".join(tokens), chat), **final})
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for i, token in enumerate(tokens):
+                        if i:
+                            time.sleep(fake.token_delay)
+                        self._write_chunk({**self._part(model, token, chat), "done": False})
+                    self._write_chunk({**self._part(model, "", chat), **final})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client stopped reading, as a cancelled stream does
+                    pass
+                finally:
+                    fake._exit()
+
+            def _part(self, model, text, chat):
+                part = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+                if chat:
+                    part["message"] = {"role": "assistant", "content": text}
+                else:
+                    part["response"] = text
+                return part
+
+            def _read_json(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if not length:
+                    return {}
+                try:
+                    return json.loads(self.rfile.read(length))
+                except json.JSONDecodeError:
+                    return {}
+
+            def _write_chunk(self, payload):
+                data = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def _model_entry(self, name):
+        return {
+            "name": name,
+            "model": name,
+            "modified_at": "2024-01-01T00:00:00Z",
+            "size": 0,
+            "digest": "0" * 64,
+            "details": {"format": "gguf", "family": "fake", "parameter_size": "0B", "quantization_level": "Q4_0"}
+        }
+
+def parse_duration(value):
+    """Seconds for an Ollama keep_alive: a number of seconds or a duration like "30m"; negative means forever."""
+    if value is None:
+        return DEFAULT_KEEP_ALIVE_SECONDS
+    if isinstance(value, (int, float)):
+        return value
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"(-?[\d.]+)(ms|h|m|s)", value)
+    if not parts:
+        return float(value)
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between streamed tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="Seconds to load a model that isn't in memory")
+    args = parser.parse_args()
+    fake = FakeOllama(args.host, args.port, args.models, args.token_delay, args.first_token_delay, load_delay=args.load_delay)
+    print(f"Fake Ollama listening on {fake.url} with models: {', '.join(fake.models)}")
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Fake Reddit API for Scraper2Notebook
+
+An in-memory stand-in for the part of PRAW that scrape_reddit.py uses
+(subreddit listings, submissions and comment forests), so the scraper can be
+run without credentials or network access. Content is either generated or
+loaded from a recorded JSON file; every call that would be an HTTP request is
+counted and can be slowed down with `latency`. Post IDs added to `failing_posts`
+raise on their comment fetch, as a Reddit 5xx would.
+
+Usage: python fake_reddit.py [--posts 50] [--comments 20] [--output reddit_data.jsonl]
+       (scrapes a generated subreddit with RedditScraper and prints the request count)
+
+Recorded file format: {"posts": [{"id", "title", "selftext", "created_utc", ...,
+"comments": [{"id", "body", "parent_id", "created_utc", ...}]}]}
+"""
+
+import argparse, json, random, threading, time
+
+class FakeAuthor:
+    def __init__(self, name):
+        self.name = name
+
+class FakeComment:
+    def __init__(self, data, post_id, subreddit):
+        self.id = data["id"]
+        self.body = data.get("body", "")
+        self.author = FakeAuthor(data["author"]) if data.get("author") else None
+        self.score = data.get("score", 1)
+        self.created_utc = data.get("created_utc", 0.0)
+        self.parent_id = data.get("parent_id", "t3_" + post_id)
+        self.link_id = "t3_" + post_id
+        self.permalink = data.get("permalink", f"/r/{subreddit}/comments/{post_id}/_/{self.id}/")
+
+class FakeMoreComments:
+    """A "load more comments" stub; replacing it costs one request."""
+
+    def __init__(self, comments):
+        self.comments = comments
+
+class FakeCommentForest:
+    def __init__(self, reddit, comments, more_every):
+        self._reddit = reddit
+        # like Reddit, only part of a large tree comes with the first response
+        self._items = list(comments[:more_every])
+        rest = comments[more_every:]
+        while rest:
+            self._items.append(FakeMoreComments(rest[:more_every]))
+            rest = rest[more_every:]
+
+    def replace_more(self, limit=32):
+        """Replace up to `limit` stubs (None = all); returns the stubs left unreplaced."""
+        replaced = 0
+        items = []
+        skipped = []
+        for item in self._items:
+            if isinstance(item, FakeMoreComments):
+                if limit is None or replaced < limit:
+                    self._reddit._request()
+                    items.extend(item.comments)
+                    replaced += 1
+                    continue
+                if limit == 0:
+                    # limit=0 drops the stubs, as PRAW does
+                    continue
+                skipped.append(item)
+            items.append(item)
+        self._items = items
+        return skipped
+
+    def list(self):
+        return list(self._items)
+
+class FakeSubmission:
+    def __init__(self, reddit, data, subreddit):
+        self._reddit = reddit
+        self._data = data
+        self.id = data["id"]
+        self.title = data.get("title", "")
+        self.selftext = data.get("selftext", "")
+        self.author = FakeAuthor(data["author"]) if data.get("author") else None
+        self.score = data.get("score", 1)
+        self.num_comments = len(data.get("comments", []))
+        self.created_utc = data.get("created_utc", 0.0)
+        self.url = data.get("url", f"https://www.reddit.com/r/{subreddit}/comments/{self.id}/")
+        self.permalink = data.get("permalink", f"/r/{subreddit}/comments/{self.id}/")
+        self.subreddit_name = subreddit
+        self._comments = None
+
+    @property
+    def comments(self):
+        if self._comments is None:
+            self._reddit._request()
+            if self.id in self._reddit.failing_posts:
+                raise RuntimeError(f"received 503 HTTP response fetching post {self.id}")
+            comments = [FakeComment(comment, self.id, self.subreddit_name) for comment in self._data.get("comments", [])]
+            self._comments = FakeCommentForest(self._reddit, comments, self._reddit.more_every)
+        return self._comments
+
+class FakeSubreddit:
+    def __init__(self, reddit, name):
+        self._reddit = reddit
+        self.display_name = name
+
+    def top(self, time_filter="all", limit=100):
+        posts = sorted(self._reddit.posts, key=lambda post: post.get("score", 0), reverse=True)
+        return self._listing([FakeSubmission(self._reddit, post, self.display_name) for post in posts], limit)
+
+    def new(self, limit=100):
+        posts = sorted(self._reddit.posts, key=lambda post: int(post["id"], 36), reverse=True)
+        return self._listing([FakeSubmission(self._reddit, post, self.display_name) for post in posts], limit)
+
+    def comments(self, limit=100):
+        comments = [
+            FakeComment(comment, post["id"], self.display_name)
+            for post in self._reddit.posts for comment in post.get("comments", [])
+        ]
+        comments.sort(key=lambda comment: int(comment.id, 36), reverse=True)
+        return self._listing(comments, limit)
+
+    def _listing(self, items, limit):
+        # pages of 100, one request each, loaded lazily like PRAW's ListingGenerator
+        items = items[:limit]
+        for start in range(0, len(items), 100):
+            self._reddit._request()
+            yield from items[start:start + 100]
+
+class FakeReddit:
+    """Shared fake Reddit content; pass `reddit.client` as the scraper's `reddit_factory`."""
+
+    def __init__(self, posts=None, latency=0.0, more_every=20, subreddit="fake"):
+        self.posts = posts or []
+        self.subreddit = subreddit
+        self.latency = latency
+        self.more_every = more_every
+        self.requests = 0
+        self.failing_posts = set()
+        self._lock = threading.Lock()
+        self._next_id = max([int(item["id"], 36) for post in self.posts for item in [post] + post.get("comments", [])] + [36 ** 5])
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, 'r') as f:
+            return cls(json.load(f)["posts"], **kwargs)
+
+    @classmethod
+    def generate(cls, posts=50, comments=20, seed=0, **kwargs):
+        reddit = cls(**kwargs)
+        rng = random.Random(seed)
+        for _ in range(posts):
+            post_id = reddit.add_post(f"Post about feature {rng.randint(1, 500)}", "Body text " * rng.randint(5, 50))
+            for _ in range(comments):
+                reddit.add_comment(post_id, "Reply text " * rng.randint(2, 30))
+        return reddit
+
+    def client(self):
+        """A PRAW-like handle; all handles share the content and the request counter."""
+        return FakeRedditClient(self)
+
+    def add_post(self, title, selftext="", score=None):
+        post = {"id": self._new_id(), "title": title, "selftext": selftext, "score": score if score is not None else len(self.posts), "created_utc": time.time(), "comments": []}
+        self.posts.append(post)
+        return post["id"]
+
+    def add_comment(self, post_id, body):
+        post = next(post for post in self.posts if post["id"] == post_id)
+        comment = {"id": self._new_id(), "body": body, "created_utc": time.time()}
+        post["comments"].append(comment)
+        return comment["id"]
+
+    def _new_id(self):
+        with self._lock:
+            self._next_id += 1
+            value = self._next_id
+        digits = ""
+        while value:
+            value, digit = divmod(value, 36)
+            digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+        return digits
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+class FakeRedditClient:
+    def __init__(self, reddit):
+        self._reddit = reddit
+
+    def subreddit(self, name):
+        return FakeSubreddit(self._reddit, name)
+
+    def submission(self, id):
+        data = next(post for post in self._reddit.posts if post["id"] == id)
+        return FakeSubmission(self._reddit, data, self._reddit.subreddit)
+
+def main():
+    from scrape_reddit import RedditScraper
+    parser = argparse.ArgumentParser(description="Run scrape_reddit.py against a generated fake subreddit.")
+    parser.add_argument("--posts", type=int, default=50)
+    parser.add_argument("--comments", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake request")
+    parser.add_argument("--output", default="fake_reddit_data.jsonl")
+    args = parser.parse_args()
+    reddit = FakeReddit.generate(args.posts, args.comments, latency=args.latency)
+    start_time = time.perf_counter()
+    RedditScraper(reddit.client, {
+        "subreddit": reddit.subreddit,
+        "post_limit": args.posts,
+        "output_file": args.output,
+        "requests_per_minute": 6000,
+        "checkpoint_file": args.output + ".checkpoint.json"
+    }).run()
+    print(f"{reddit.requests} fake requests in {time.perf_counter() - start_time:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Fake web search backend for Scraper2Notebook
+
+Stands in for ddgr in `web_search.WebSearch`, so caching, the deadline and
+the merge into the packed context can be checked without network access.
+Results are canned or generated from the query. Every backend call is
+counted, and calls can be slowed down or made to fail.
+
+Usage: python fake_web_search.py [--latency 2.0] [--deadline 1.5] <search query>
+       (searches twice and prints what each search returned and how long it took)
+"""
+
+from web_search import WebSearch, WebSearchCache, format_search_results
+import argparse, asyncio, os, tempfile, time
+
+class FakeSearchBackend:
+    available = True
+
+    def __init__(self, results=None, latency=0.0, fail=False):
+        # {query: [result dicts]}; other queries get generated results
+        self.results = results or {}
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    async def search(self, query, num_results):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("fake search backend failure")
+        if query in self.results:
+            return self.results[query][:num_results]
+        return [
+            {"title": f"Result {i + 1} for {query}", "url": f"https://example.com/{i + 1}", "abstract": f"Web text about {query}."}
+            for i in range(num_results)
+        ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Run web_search.WebSearch against a fake backend.")
+    parser.add_argument("query", nargs="+")
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds per fake backend call")
+    parser.add_argument("--deadline", type=float, default=1.5)
+    args = parser.parse_args()
+    query = " ".join(args.query)
+    backend = FakeSearchBackend(latency=args.latency)
+    with tempfile.TemporaryDirectory() as directory:
+        search = WebSearch(backend, WebSearchCache(os.path.join(directory, "cache.sqlite3")), deadline_seconds=args.deadline)
+        for attempt in ("first", "second"):
+            start_time = time.perf_counter()
+            results = search.search(query)
+            print(f"{attempt} search: {len(results)} results in {time.perf_counter() - start_time:.2f}s")
+            print(format_search_results(results))
+            # give a search that missed the deadline time to land in the cache
+            time.sleep(args.latency)
+        print(f"backend calls: {backend.calls}, stats: {search.stats()}")
+
+if __name__ == "__main__":
+    main()
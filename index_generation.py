@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+import json, os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+GENERATION_FILE = "./index_generation.json"
+
+# ((path, mtime_ns, size), {"generation": N, "collections": {name: N}}) of the last read
+_cached = (None, {"generation": 0, "collections": {}})
+
+def read_generation(path=GENERATION_FILE, collection=None):
+    """Current index generation; 0 if nothing has been ingested since this file was introduced.
+
+    Without `collection` this is the overall generation, which every ingest
+    and export bumps. With it, it is the generation of that collection (its
+    name in retrieval.COLLECTIONS), which only ingests of that collection
+    bump, so a snapshot of one collection stays current while others change.
+
+    Only re-reads the file when its path, modification time or size changes,
+    so it is cheap enough to call on every query.
+    """
+    state = _read(path)
+    if collection is None:
+        return state["generation"]
+    return state["collections"].get(collection, 0)
+
+def bump_generation(path=GENERATION_FILE, collection=None):
+    """Mark the indexes as changed. Called by the ingestion scripts, with the collection they wrote, after writing new data.
+
+    Holds a lock on `path`.lock from reading to replacing the file, so
+    concurrent ingests (ingest.py and ingest-pdf.py) each get their bump.
+    """
+    with _locked(path + ".lock"):
+        try:
+            state = _parse(path)
+        except FileNotFoundError:
+            state = {"generation": 0, "collections": {}}
+        if collection is not None:
+            state["collections"][collection] = state["collections"].get(collection, 0) + 1
+        state["generation"] += 1
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(state, fp)
+        os.replace(tmp_path, path)
+    return state["generation"]
+
+@contextmanager
+def _locked(lock_path):
+    with open(lock_path, "a+") as fp:
+        if fcntl is not None:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        else:
+            fp.seek(0)
+            msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            else:
+                fp.seek(0)
+                msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _parse(path):
+    with open(path) as fp:
+        data = json.load(fp)
+    return {"generation": int(data["generation"]), "collections": {name: int(value) for name, value in data["collections"].items()}}
+
+def _read(path):
+    global _cached
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return {"generation": 0, "collections": {}}
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if _cached[0] != key:
+        try:
+            _cached = (key, _parse(path))
+        except (OSError, ValueError, KeyError, AttributeError):
+            return _cached[1]
+    return _cached[1]
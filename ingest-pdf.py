@@ -3,13 +3,35 @@ from langchain_community.embeddings import FastEmbedEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores.utils import filter_complex_metadata
 from langchain_community.document_loaders import PyPDFLoader
-from tinydb import TinyDB, where
-import re, math
+from ingest_ledger import IngestLedger
+from embedding_cache import CachedEmbeddings
+from lexical_index import LexicalIndex
+from index_generation import bump_generation
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import hashlib, os, re, math, queue, threading
+
+# Parsing and splitting is CPU bound, so it runs in a process pool
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Parsed PDFs waiting to be handed to the embedding stage
+MAX_PENDING_PARSES = PARSE_WORKERS * 2
+# Number of chunks embedded per call to the embedding model
+EMBED_BATCH_SIZE = 256
+# Number of chunks committed to Chroma per write
+WRITE_BATCH_SIZE = 2048
+# Bound on the queues between stages, in batches
+STAGE_QUEUE_SIZE = 4
+# The BM25 index is rewritten after this many Chroma write batches, and at the end of the run
+LEXICAL_SAVE_EVERY = 50
+# How often a stage blocked on a full queue checks that the next stage is still running
+STAGE_POLL_SECONDS = 1.0
+LEXICAL_INDEX_PATH = "./lexical_index/pdfs.npz"
+# The collection's name in retrieval.COLLECTIONS
+COLLECTION = "pdfs"
 
-<<<<<<< HEAD
 def usage():
     """Usage: python ingest-pdf.py
-    
+
     This script reads a list of PDF files from pdf-files.txt and ingests them into ChromaDB.
     Make sure to run scrape-pdf-list.sh first to populate pdf-files.txt with PDF paths.
     """
@@ -17,30 +39,98 @@ def usage():
     print("This script reads a list of PDF files from pdf-files.txt and ingests them into ChromaDB.")
     print("Make sure to run scrape-pdf-list.sh first to populate pdf-files.txt with PDF paths.")
 
-=======
->>>>>>> 4884a93c4df5a4baa10dac7648dce6b71f4a93c8
-records_db = TinyDB('./records-pdf.json')
-pdf_ingest_table = records_db.table('pdf_ingest')
-
 text_splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=60)
 
-chroma_db = Chroma(
-    embedding_function=FastEmbedEmbeddings(),
-    persist_directory="./chroma_db_pdfs",
-    collection_name="pdfs"
-)
+# Opened lazily so parse worker processes never touch the Chroma store or the ledger
+chroma_db = None
+ledger = None
+lexical_index = None
+
+def getLedger():
+    global ledger
+    if ledger is None:
+        # migrates an existing records-pdf.json on first use
+        ledger = IngestLedger("./records-pdf.sqlite3", legacy_path="./records-pdf.json")
+    return ledger
+
+def getChromaDb():
+    global chroma_db
+    if chroma_db is None:
+        chroma_db = Chroma(
+            embedding_function=CachedEmbeddings(FastEmbedEmbeddings()),
+            persist_directory="./chroma_db_pdfs",
+            collection_name="pdfs"
+        )
+    return chroma_db
+
+def getLexicalIndex():
+    global lexical_index
+    if lexical_index is None:
+        lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+    return lexical_index
 
 def start():
     getFileList("./pdf-files.txt")
 
 def getFileList(filename: str):
-<<<<<<< HEAD
+    """Run the ingestion pipeline over every PDF listed in `filename`.
+
+    Stages: a process pool parses and splits PDFs, one thread embeds chunks in
+    batches, and one writer thread commits to Chroma and records finished files.
+    Stages are connected by bounded queues so a slow stage applies backpressure.
+    A stage that fails records its error and stops; the stages before it stop
+    feeding it, the stages after it commit what they already have, and the
+    error is raised here.
+    """
     try:
         with open(filename) as fp:
             list_size = sum(1 for _ in fp)
             print("Number of PDFs: " + str(list_size))
             fp.close()
-        with open(filename) as fp:
+    except FileNotFoundError:
+        print(f"Error: File '{filename}' not found.")
+        print("Run ./scrape-pdf-list.sh to create the PDF list first.")
+        usage()
+        return
+    embed_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    write_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    errors = []
+    writer = threading.Thread(target=writeStage, args=(write_queue, errors), daemon=True)
+    embedder = threading.Thread(target=embedStage, args=(embed_queue, write_queue, writer, errors), daemon=True)
+    # the writer first: the embedder gives up on a writer that isn't running
+    writer.start()
+    embedder.start()
+    queued_titles = set()
+    try:
+        parseFiles(filename, list_size, embed_queue, embedder, queued_titles)
+    except StageStopped:
+        pass
+    finally:
+        # let the stages finish what they have, so every batch already embedded is committed
+        try:
+            putStage(embed_queue, None, embedder)
+        except StageStopped:
+            pass
+        embedder.join()
+        writer.join()
+        try:
+            getLedger().commit()
+            getLexicalIndex().save()
+        except Exception as e:
+            errors.append(e)
+        if queued_titles:
+            # invalidates cached retrieval results in running apps
+            bump_generation(collection=COLLECTION)
+    if errors:
+        raise errors[0]
+    print("\n*** 100.00% ***\n")
+
+def parseFiles(filename: str, list_size: int, embed_queue: queue.Queue, embedder: threading.Thread, queued_titles: set):
+    """Parse the listed PDFs not processed yet in a process pool and hand them to the embedding stage."""
+    with open(filename) as fp, ProcessPoolExecutor(max_workers=PARSE_WORKERS) as pool:
+        try:
+            pending = deque()
+            queued_hashes = set()
             skip_count = 0
             count = 0
             last_pc = 0.0
@@ -52,11 +142,14 @@ def getFileList(filename: str):
                     print("\n*** {:.2f}% ***\n".format(percentage))
                     skip_count = 0
                 last_pc = percentage
-                if not isAlreadyProcessed(cleaned_pdf_filename, pre_title):
+                # a title queued earlier in this run counts as processed, as it did when files were handled one by one
+                if not isAlreadyProcessed(cleaned_pdf_filename, pre_title) and (pre_title == "" or pre_title not in queued_titles):
                     skip_count = 0
-                    percentage = (float(count) / float(list_size) * 100)
                     print("\n{:.2f}% : ".format(percentage) + cleaned_pdf_filename)
-                    processPdf(cleaned_pdf_filename)
+                    queued_titles.add(pre_title)
+                    pending.append(pool.submit(parsePdf, cleaned_pdf_filename))
+                    if len(pending) >= MAX_PENDING_PARSES:
+                        queueParsedPdf(pending.popleft().result(), embed_queue, embedder, queued_hashes)
                 else:
                     if skip_count > 0:
                         print(".", end="", flush=True)
@@ -64,69 +157,152 @@ def getFileList(filename: str):
                         print("skipping already processed.", end="", flush=True)
                     skip_count += 1
                 count += 1
-    except FileNotFoundError:
-        print(f"Error: File '{filename}' not found.")
-        print("Run ./scrape-pdf-list.sh to create the PDF list first.")
-        usage()
-=======
-    with open(filename) as fp:
-        list_size = sum(1 for _ in fp)
-        print("Number of PDFs: " + str(list_size))
-        fp.close()
-    with open(filename) as fp:
-        skip_count = 0
-        count = 0
-        last_pc = 0.0
-        for pdf_filename in fp:
-            cleaned_pdf_filename = pdf_filename.replace("\n", "")
-            pre_title = getPdfTitle(cleaned_pdf_filename)
-            percentage = (float(count) / float(list_size) * 100)
-            if math.floor(last_pc) < math.floor(percentage):
-                print("\n*** {:.2f}% ***\n".format(percentage))
-                skip_count = 0
-            last_pc = percentage
-            if not isAlreadyProcessed(cleaned_pdf_filename, pre_title):
-                skip_count = 0
-                percentage = (float(count) / float(list_size) * 100)
-                print("\n{:.2f}% : ".format(percentage) + cleaned_pdf_filename)
-                processPdf(cleaned_pdf_filename)
-            else:
-                if skip_count > 0:
-                    print(".", end="", flush=True)
+            while pending:
+                queueParsedPdf(pending.popleft().result(), embed_queue, embedder, queued_hashes)
+        except BaseException:
+            # don't wait for parses nobody will take
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+class StageStopped(Exception):
+    """The next pipeline stage is no longer running; it recorded its own error."""
+
+def putStage(stage_queue: queue.Queue, item, consumer: threading.Thread):
+    """Put `item` on the queue `consumer` reads, giving up if `consumer` has stopped."""
+    while True:
+        if not consumer.is_alive():
+            raise StageStopped()
+        try:
+            stage_queue.put(item, timeout=STAGE_POLL_SECONDS)
+            return
+        except queue.Full:
+            pass
+
+def queueParsedPdf(parsed: tuple, embed_queue: queue.Queue, embedder: threading.Thread, queued_hashes: set):
+    """Hand a parsed PDF to the embedding stage unless identical content was already ingested under another name."""
+    filename, title, content_hash, texts = parsed
+    if content_hash is not None and (content_hash in queued_hashes or getLedger().contains_hash(content_hash)):
+        print("\n\tduplicate content, recording for skip: " + filename)
+        getLedger().record(filename, title, content_hash, 0)
+        return
+    if content_hash is not None:
+        queued_hashes.add(content_hash)
+    putStage(embed_queue, [parsed], embedder)
+
+def embedStage(embed_queue: queue.Queue, write_queue: queue.Queue, writer: threading.Thread, errors: list):
+    """Group parsed PDFs into batches of at least EMBED_BATCH_SIZE chunks and embed each batch in one call."""
+    try:
+        embeddings = getChromaDb().embeddings
+        batch = []
+        batch_size = 0
+        while True:
+            parsed = embed_queue.get()
+            if parsed is not None:
+                batch.extend(parsed)
+                batch_size += sum(len(texts) for _, _, _, texts in parsed)
+            if batch and (batch_size >= EMBED_BATCH_SIZE or parsed is None):
+                texts = [text for _, _, _, file_texts in batch for text in file_texts]
+                try:
+                    vectors = embeddings.embed_documents(texts) if texts else []
+                except Exception as e:
+                    # the files stay unrecorded and are retried on the next run
+                    print(e)
                 else:
-                    print("skipping already processed.", end="", flush=True)
-                skip_count += 1
-            count += 1
->>>>>>> 4884a93c4df5a4baa10dac7648dce6b71f4a93c8
+                    putStage(write_queue, (batch, vectors), writer)
+                batch = []
+                batch_size = 0
+            if parsed is None:
+                putStage(write_queue, None, writer)
+                return
+    except StageStopped:
+        pass
+    except BaseException as e:
+        errors.append(e)
+        # the writer commits what it already has
+        try:
+            putStage(write_queue, None, writer)
+        except StageStopped:
+            pass
+
+def writeStage(write_queue: queue.Queue, errors: list):
+    """Commit embedded chunks to the `pdfs` collection in large batches, then record the files as processed."""
+    try:
+        files = []
+        texts = []
+        vectors = []
+        commits = 0
+        while True:
+            item = write_queue.get()
+            if item is not None:
+                batch, batch_vectors = item
+                files.extend(batch)
+                texts.extend(text for _, _, _, file_texts in batch for text in file_texts)
+                vectors.extend(batch_vectors)
+            if files and (len(texts) >= WRITE_BATCH_SIZE or item is None):
+                commitPdfs(files, texts, vectors)
+                files = []
+                texts = []
+                vectors = []
+                commits += 1
+                if commits % LEXICAL_SAVE_EVERY == 0:
+                    getLexicalIndex().save()
+            if item is None:
+                return
+    except BaseException as e:
+        errors.append(e)
+
+def commitPdfs(files: list, texts: list, vectors: list):
+    metadatas = []
+    ids = []
+    for filename, title, content_hash, file_texts in files:
+        print("\t title: " + title + " (num chunks: " + str(len(file_texts)) + ")")
+        if len(file_texts) == 0:
+            print("\tnothing to ingest, recording for skip anyway")
+        # create Chroma DB metadata for each chunk
+        metadatas.extend({"title": title, "source_type": "pdf"} for _ in file_texts)
+        ids.extend(pdfChunkId(filename, content_hash, index) for index in range(len(file_texts)))
+    try:
+        collection = getChromaDb()._collection
+        for i in range(0, len(texts), WRITE_BATCH_SIZE):
+            # the same PDF always gets the same IDs, so a batch re-added after a crash before the
+            # ledger commit replaces its chunks instead of duplicating them
+            collection.upsert(
+                ids = ids[i:i + WRITE_BATCH_SIZE],
+                embeddings = vectors[i:i + WRITE_BATCH_SIZE],
+                documents = texts[i:i + WRITE_BATCH_SIZE],
+                metadatas = metadatas[i:i + WRITE_BATCH_SIZE]
+            )
+    except Exception as e:
+        # the files stay unrecorded and are retried on the next run
+        print(e)
+        return
+    getLexicalIndex().add(ids, texts)
+    # record the files in the ledger, one transaction for the whole batch
+    for filename, title, content_hash, file_texts in files:
+        getLedger().record(filename, title, content_hash, len(file_texts))
+    getLedger().commit()
+
+def pdfChunkId(filename: str, content_hash: str, index: int):
+    """Stable ID for the `index`th chunk of a PDF: its content hash (or, if unreadable, its path) and the chunk index."""
+    source = content_hash or hashlib.sha256(filename.encode("utf-8")).hexdigest()
+    return f"pdf:{source}:{index}"
 
 def isAlreadyProcessed(filename: str, title: str):
-    return len(pdf_ingest_table.search(where('file') == filename)) > 0 or (title != "" and len(pdf_ingest_table.search(where('title') == title)) > 0)
+    return getLedger().contains(filename, title)
 
-def processPdf(filename: str):
-    # get PDF as chunks
+def parsePdf(filename: str):
+    """Parse and split one PDF. Runs in a worker process."""
     texts = list(map(lambda c: c.page_content, getPdfChromaDbChunks(filename)))
-    print("\t num chunks: " + str(len(texts)))
-    # get metadata for PDF
-    title = getPdfTitle(filename)
-    print("\t title: " + title)
-    if len(texts) > 0:
-        # create Chroma DB metadata for each chunk
-        metadatas = []
-        for _ in range(len(texts)):
-            metadatas.append({"title": title})
-        # add data to Chroma DB
-        chroma_db.add_texts(
-            texts = texts,
-            metadatas = metadatas
-        )
-    else:
-        print("\tnothing to ingest, recording for skip anyway")
-    # add record to lightweight records DB
-    pdf_ingest_table.insert({
-        "file": filename,
-        "title": title
-    })
+    return filename, getPdfTitle(filename), getPdfContentHash(filename), texts
 
+def processPdf(filename: str):
+    """Ingest a single PDF synchronously, bypassing the pipeline."""
+    parsed = [parsePdf(filename)]
+    texts = parsed[0][3]
+    vectors = getChromaDb().embeddings.embed_documents(texts) if texts else []
+    commitPdfs(parsed, texts, vectors)
+    getLexicalIndex().save()
+    bump_generation(collection=COLLECTION)
 
 def getPdfChromaDbChunks(filename: str):
     try:
@@ -138,6 +314,17 @@ def getPdfChromaDbChunks(filename: str):
         print(e)
         return []
 
+def getPdfContentHash(filename: str):
+    try:
+        sha = hashlib.sha256()
+        with open(filename, "rb") as fp:
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+    except OSError as e:
+        print(e)
+        return None
+
 def getPdfTitle(filename: str):
     title = ""
     filename_parts = filename.split("/")
@@ -149,12 +336,6 @@ def getPdfTitle(filename: str):
 
 def removeNonAlphaNumOrSpace(s: str):
     return re.sub(r'[^A-Za-z0-9,:\. ]+', '', s)
-    
-<<<<<<< HEAD
-if __name__ == "__main__":
-    start()
-=======
 
 if __name__ == "__main__":
     start()
->>>>>>> 4884a93c4df5a4baa10dac7648dce6b71f4a93c8
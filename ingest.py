@@ -1,20 +1,242 @@
-from langchain_community.document_loaders import TextLoader
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from retrieval import EMBEDDING_MODEL_NAME, LEXICAL_INDEX_PATH, PERSIST_DIRECTORY
+from embedding_cache import CachedEmbeddings
+from lexical_index import LexicalIndex
+from index_generation import bump_generation
+from search_filters import to_timestamp
+import hashlib, json, os
 
-# Load documents
-documents = []
-for file in ["reddit_data.txt", "github_data.txt"]:
-    loader = TextLoader(file)
-    documents.extend(loader.load())
+# .jsonl files are read as scraper records; the .txt files are the old scrapers' output
+SOURCE_FILES = ["reddit_data.jsonl", "github_data.jsonl", "reddit_data.txt", "github_data.txt"]
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+# Chunks embedded and added to (or deleted from) Chroma per call; bounds ingestion memory
+WRITE_BATCH_SIZE = 1000
+# Text files are split a segment at a time: at least this many characters, cut at a blank line
+# (or at a line break once a segment is four times this long)
+SEGMENT_CHARS = 64 * 1024
+# The collection's name in retrieval.COLLECTIONS; its generation tells exports and ONNX validations of it apart from the PDFs'
+COLLECTION = "reddit_github"
 
-# Split documents
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-docs = text_splitter.split_documents(documents)
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-# Create embeddings
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+def chunk_id(source, text):
+    """Stable ID for a chunk: the same text from the same source always maps to the same ID."""
+    return content_hash(f"{source}\0{text}")
 
-# Store in Chroma
-Chroma.from_documents(docs, embeddings, persist_directory="./chroma_db")
\ No newline at end of file
+def source_type(file):
+    """`source_type` metadata for chunks of a source file: "reddit" or "github" by its name."""
+    return "github" if os.path.basename(file).startswith("github") else "reddit"
+
+def clean_metadata(metadata):
+    # Chroma only stores str, int, float and bool values
+    return {key: value for key, value in metadata.items() if value is not None}
+
+def read_segments(file, segment_chars=SEGMENT_CHARS):
+    """Yield the text of `file` piece by piece, each piece ending at a paragraph break where possible."""
+    lines = []
+    size = 0
+    with open(file, 'r') as f:
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if (size >= segment_chars and not line.strip()) or size >= 4 * segment_chars:
+                yield "".join(lines)
+                lines = []
+                size = 0
+    if lines:
+        yield "".join(lines)
+
+def index_records(file):
+    """Group a scraper JSONL file's records into documents without loading their text.
+
+    Returns {document key: [byte offsets]}: one key per Reddit thread (its post
+    and comments, including comments appended by later runs) and one per
+    GitHub record. A record written twice counts once, at its latest offset.
+    """
+    latest = {}
+    with open(file, 'rb') as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by an interrupted scrape
+                    record = None
+                if record is not None:
+                    if record["type"] in ("post", "comment"):
+                        key = ("thread", record["id"] if record["type"] == "post" else record["post_id"])
+                    else:
+                        key = ("record", record["id"])
+                    latest[record["id"]] = (key, offset)
+            offset += len(line)
+    groups = {}
+    for key, offset in latest.values():
+        groups.setdefault(key, []).append(offset)
+    return groups
+
+def thread_document(post_id, post, comments):
+    """One Reddit thread: title and body, then the comments oldest first."""
+    parts = [f"{post['title']}\n{post['text']}"] if post else []
+    comments = sorted(comments, key=lambda comment: int(comment["id"], 36))
+    parts.extend(comment["text"] for comment in comments)
+    first = post or comments[0]
+    metadata = {"source_type": "reddit", "post_id": post_id, "subreddit": first["subreddit"]}
+    if post:
+        metadata.update(
+            title=post["title"],
+            permalink=post["permalink"],
+            url="https://www.reddit.com" + post["permalink"],
+            timestamp=to_timestamp(post.get("created_utc")),
+            score=post.get("score"),
+            num_comments=len(comments)
+        )
+    return Document(page_content="\n".join(parts), metadata=clean_metadata(metadata))
+
+def github_document(record):
+    metadata = {
+        "source_type": "github",
+        "type": record["type"],
+        "repo": record["repo"],
+        "title": record["title"],
+        "url": record.get("url") or "",
+        "timestamp": to_timestamp(record.get("updated_at"))
+    }
+    return Document(page_content=f"{record['title']}\n{record['text']}", metadata=clean_metadata(metadata))
+
+def iter_jsonl_documents(file):
+    """Documents from scrape_reddit.py or scrape_github.py output, one at a time.
+
+    Reddit posts and comments become one document per thread; every GitHub
+    record (repo, doc, release, issue) is its own document. Each document
+    carries the metadata `search_filters.SearchFilters` filters on:
+    `source_type`, `subreddit` or `repo`, `url`, and where known `timestamp`
+    (epoch seconds) and `score`. Only one document's records are in memory at
+    a time; they are read back by offset from the index built by `index_records`.
+    """
+    groups = index_records(file)
+    with open(file, 'rb') as f:
+        for (kind, key), offsets in groups.items():
+            records = []
+            for offset in sorted(offsets):
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+            if kind == "record":
+                yield github_document(records[0])
+                continue
+            post = next((record for record in records if record["type"] == "post"), None)
+            yield thread_document(key, post, [record for record in records if record["type"] == "comment"])
+
+def iter_documents(file):
+    if file.endswith(".jsonl"):
+        yield from iter_jsonl_documents(file)
+        return
+    for segment in read_segments(file):
+        yield Document(page_content=segment, metadata={"source": file})
+
+def iter_chunks(files):
+    """Yield (chunk ID, chunk) for each source file, splitting one document at a time.
+
+    Identical chunks within a source are yielded once.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    seen = set()
+    for file in files:
+        for doc in iter_documents(file):
+            for chunk in text_splitter.split_documents([doc]):
+                cid = chunk_id(file, chunk.page_content)
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                chunk.metadata["source"] = file
+                chunk.metadata.setdefault("source_type", source_type(file))
+                chunk.metadata["content_hash"] = content_hash(chunk.page_content)
+                yield cid, chunk
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def write_batch(vectorstore, lexical_index, batch, existing_ids, index_all):
+    """Add a batch's new chunks, refresh changed metadata, and index them; returns (added, updated)."""
+    new = [(cid, chunk) for cid, chunk in batch if cid not in existing_ids]
+    changed = []
+    stored_ids = [cid for cid, _ in batch if cid in existing_ids]
+    if stored_ids:
+        stored = vectorstore.get(ids=stored_ids, include=["metadatas"])
+        stored_metadata = dict(zip(stored["ids"], stored["metadatas"]))
+        changed = [(cid, chunk) for cid, chunk in batch if cid in stored_metadata and stored_metadata[cid] != chunk.metadata]
+    if new:
+        vectorstore.add_documents([chunk for _, chunk in new], ids=[cid for cid, _ in new])
+    if changed:
+        # metadata only: the text, and so the vector, is unchanged
+        vectorstore._collection.update(ids=[cid for cid, _ in changed], metadatas=[chunk.metadata for _, chunk in changed])
+    # a new index also needs the chunks that were already in Chroma
+    indexed = batch if index_all else new
+    lexical_index.add([cid for cid, _ in indexed], [chunk.page_content for _, chunk in indexed])
+    return len(new), len(changed)
+
+def ingest(files=SOURCE_FILES, persist_directory=PERSIST_DIRECTORY, lexical_index_path=LEXICAL_INDEX_PATH):
+    """Bring the Chroma store in line with `files`, embedding only chunks that are new or changed.
+
+    Chunks already stored under the same ID keep their vectors; only their
+    metadata is rewritten if it changed (a new score or comment count, or
+    chunks ingested before a field existed). Stored chunks from these sources
+    whose text no longer appears are deleted. A missing source file is
+    skipped and its existing chunks are kept. The BM25 index at `lexical_index_path`
+    gets the same additions and deletions, under the same chunk IDs.
+
+    Sources are streamed: documents are split one at a time and chunks are
+    embedded and written `WRITE_BATCH_SIZE` at a time, so memory does not grow
+    with the size of the scrape (only the set of chunk IDs does).
+    """
+    present = []
+    for file in files:
+        if os.path.exists(file):
+            present.append(file)
+        else:
+            print(f"Skipping '{file}': file not found, existing chunks are kept")
+    if not present:
+        return {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+
+    # vectors seen in earlier runs (or other collections) come from the on-disk cache
+    embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME))
+    vectorstore = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    existing_ids = set(vectorstore.get(where={"source": {"$in": present}}, include=[])["ids"])
+    index_is_new = not os.path.exists(lexical_index_path)
+    lexical_index = LexicalIndex(lexical_index_path)
+
+    seen_ids = set()
+    added = updated = 0
+    for batch in batched(iter_chunks(present), WRITE_BATCH_SIZE):
+        seen_ids.update(cid for cid, _ in batch)
+        batch_added, batch_updated = write_batch(vectorstore, lexical_index, batch, existing_ids, index_is_new)
+        added += batch_added
+        updated += batch_updated
+
+    removed_ids = list(existing_ids - seen_ids)
+    for i in range(0, len(removed_ids), WRITE_BATCH_SIZE):
+        vectorstore.delete(ids=removed_ids[i:i + WRITE_BATCH_SIZE])
+    lexical_index.remove(removed_ids)
+    lexical_index.save()
+    if added or updated or removed_ids:
+        # invalidates cached retrieval results in running apps
+        bump_generation(collection=COLLECTION)
+
+    summary = {"added": added, "updated": updated, "unchanged": len(seen_ids) - added - updated, "removed": len(removed_ids)}
+    print(f"Ingest complete: {summary['added']} added, {summary['updated']} updated, {summary['unchanged']} unchanged, {summary['removed']} removed chunks")
+    return summary
+
+if __name__ == "__main__":
+    ingest()
@@ -0,0 +1,93 @@
+import json, os, sqlite3, threading, time
+
+LEDGER_PATH = "./records-pdf.sqlite3"
+LEGACY_TINYDB_PATH = "./records-pdf.json"
+LEGACY_TINYDB_TABLE = "pdf_ingest"
+
+class IngestLedger:
+    """Record of ingested files, backed by SQLite with indexes on path, title and content hash.
+
+    Lookups are single index probes, and `record()` only buffers rows; they are
+    written in one transaction by `commit()`, so the cost per file stays flat
+    as the corpus grows. Buffered rows are visible to lookups before they are
+    committed.
+    """
+
+    def __init__(self, path=LEDGER_PATH, legacy_path=LEGACY_TINYDB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_titles = set()
+        self._pending_hashes = set()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS ingested ("
+                "file TEXT PRIMARY KEY, title TEXT, content_hash TEXT, num_chunks INTEGER, ingested_at REAL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS ingested_title ON ingested (title)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS ingested_content_hash ON ingested (content_hash)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._migrate(legacy_path)
+
+    def _migrate(self, legacy_path):
+        """Import rows from the old TinyDB `records-pdf.json` once. The JSON file is left in place."""
+        if legacy_path is None or not os.path.exists(legacy_path):
+            return
+        if self._connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_from'").fetchone():
+            return
+        try:
+            with open(legacy_path) as fp:
+                rows = json.load(fp).get(LEGACY_TINYDB_TABLE, {}).values()
+        except (OSError, ValueError) as e:
+            print(f"Could not migrate '{legacy_path}': {e}")
+            return
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO ingested (file, title, content_hash, num_chunks, ingested_at) VALUES (?, ?, NULL, NULL, ?)",
+                ((row.get("file"), row.get("title", ""), now) for row in rows if row.get("file"))
+            )
+            self._connection.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', ?)", (legacy_path,))
+        print(f"Migrated {len(rows)} records from '{legacy_path}' to '{self.path}'")
+
+    def contains(self, file, title=""):
+        """True if `file` was ingested, or any file with the same non-empty `title` was."""
+        with self._lock:
+            if file in self._pending or (title != "" and title in self._pending_titles):
+                return True
+            if self._connection.execute("SELECT 1 FROM ingested WHERE file = ?", (file,)).fetchone():
+                return True
+            return title != "" and self._connection.execute("SELECT 1 FROM ingested WHERE title = ? LIMIT 1", (title,)).fetchone() is not None
+
+    def contains_hash(self, content_hash):
+        with self._lock:
+            if content_hash in self._pending_hashes:
+                return True
+            return self._connection.execute("SELECT 1 FROM ingested WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone() is not None
+
+    def record(self, file, title="", content_hash=None, num_chunks=None):
+        with self._lock:
+            self._pending[file] = (file, title, content_hash, num_chunks, time.time())
+            self._pending_titles.add(title)
+            if content_hash is not None:
+                self._pending_hashes.add(content_hash)
+
+    def commit(self):
+        """Write all buffered rows in a single transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO ingested (file, title, content_hash, num_chunks, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                    self._pending.values()
+                )
+            self._pending = {}
+            self._pending_titles = set()
+            self._pending_hashes = set()
+
+    def close(self):
+        self.commit()
+        self._connection.close()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Lexical (BM25) index for Scraper2Notebook
+
+A persistent inverted index over the same chunk IDs that are stored in Chroma,
+so exact identifiers (mode names, config keys, error strings, repo names) can
+be found even when vector search misses them. Built by ingest.py and
+ingest-pdf.py; searched by retrieval.py alongside the vector store.
+
+Usage: python lexical_index.py rebuild <collection name>
+"""
+
+from array import array
+from collections import Counter
+import numpy as np
+import os, re, sys
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[.\-/:][a-z0-9_]+)*")
+TOKEN_SEPARATORS = re.compile(r"[.\-/:]")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in into is it its of on or so that the their then "
+    "there these they this to was were will with you your".split()
+)
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Query terms found in more than this share of chunks are ignored; if all are, only the rarest is used
+MAX_DF_RATIO = 0.25
+
+def tokenize(text):
+    """Lowercase word tokens. Dotted/dashed/slashed identifiers are kept whole and also split into their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token not in STOPWORDS:
+            tokens.append(token)
+        if TOKEN_SEPARATORS.search(token):
+            tokens.extend(part for part in TOKEN_SEPARATORS.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+class LexicalIndex:
+    """BM25 index stored as CSR-style postings in NumPy arrays.
+
+    `terms` is sorted, so a query term is found with a binary search, and its
+    postings are the slice `offsets[t]:offsets[t + 1]` of `postings_docs` /
+    `postings_tfs`. Scoring is vectorised over all postings of the query terms.
+    On disk the doc numbers are delta-encoded per term and the file is
+    deflate-compressed (`.npz`).
+
+    `add()` and `remove()` only stage changes; `save()` merges them into the
+    arrays and rewrites the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.terms = np.array([], dtype=str)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings_docs = np.array([], dtype=np.uint32)
+        self.postings_tfs = np.array([], dtype=np.uint16)
+        self.doc_ids = np.array([], dtype=str)
+        self.doc_lengths = np.array([], dtype=np.uint32)
+        self._reset_staging()
+        if os.path.exists(path):
+            self._load()
+        self._update_stats()
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _load(self):
+        with np.load(self.path) as data:
+            self.terms = data["terms"]
+            self.offsets = data["offsets"]
+            self.postings_tfs = data["postings_tfs"]
+            self.doc_ids = data["doc_ids"]
+            self.doc_lengths = data["doc_lengths"]
+            deltas = data["postings_deltas"].astype(np.int64)
+        # undo the per-term delta encoding: a cumulative sum, restarted at every term
+        totals = np.cumsum(deltas)
+        starts = self.offsets[:-1]
+        base = np.where(starts > 0, totals[np.maximum(starts - 1, 0)], 0) if len(totals) else np.zeros(0, dtype=np.int64)
+        self.postings_docs = (totals - np.repeat(base, np.diff(self.offsets))).astype(np.uint32)
+
+    def _update_stats(self):
+        average_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 1.0
+        # the per-document part of the BM25 denominator, computed once rather than per query
+        self.length_norms = (K1 * (1.0 - B + B * self.doc_lengths / average_length)).astype(np.float32)
+
+    def search(self, query, k=10):
+        """Return [(chunk id, BM25 score)] for the top `k` chunks, best first."""
+        tokens = np.unique(np.array(tokenize(query), dtype=str))
+        if len(tokens) == 0 or len(self.terms) == 0:
+            return []
+        positions = np.searchsorted(self.terms, tokens)
+        found = positions < len(self.terms)
+        found[found] = self.terms[positions[found]] == tokens[found]
+        positions = positions[found]
+        if len(positions) == 0:
+            return []
+        doc_count = len(self.doc_ids)
+        frequencies = self.offsets[positions + 1] - self.offsets[positions]
+        # terms in most chunks add almost nothing to the ranking but dominate the cost
+        if (frequencies <= doc_count * MAX_DF_RATIO).any():
+            positions = positions[frequencies <= doc_count * MAX_DF_RATIO]
+        else:
+            positions = positions[np.argmin(frequencies)][None]
+        doc_parts = []
+        score_parts = []
+        for term in positions:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.float32(np.log(1.0 + (doc_count - df + 0.5) / (df + 0.5)))
+            doc_parts.append(docs)
+            score_parts.append(idf * tfs * np.float32(K1 + 1.0) / (tfs + self.length_norms[docs]))
+        docs = np.concatenate(doc_parts)
+        scores = np.concatenate(score_parts)
+        if len(doc_parts) > 1:
+            # sum the contributions of each query term per document
+            if len(docs) > doc_count // 16:
+                scores = np.bincount(docs, weights=scores, minlength=doc_count)
+                docs = np.flatnonzero(scores)
+                scores = scores[docs]
+            else:
+                docs, inverse = np.unique(docs, return_inverse=True)
+                scores = np.bincount(inverse, weights=scores)
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(str(self.doc_ids[docs[i]]), float(scores[i])) for i in top]
+
+    def add(self, ids, texts):
+        """Stage chunks for indexing. Re-adding an ID replaces its text."""
+        for chunk_id, text in zip(ids, texts):
+            if chunk_id in self._staged:
+                self._staged_dead.add(self._staged[chunk_id])
+            position = len(self._staged_ids)
+            self._staged[chunk_id] = position
+            self._staged_ids.append(chunk_id)
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                self._staged_terms.append(self._staged_vocab.setdefault(term, len(self._staged_vocab)))
+                self._staged_docs.append(position)
+                self._staged_tfs.append(min(tf, 0xFFFF))
+            self._staged_lengths.append(sum(counts.values()))
+
+    def remove(self, ids):
+        """Stage chunks for removal."""
+        for chunk_id in ids:
+            if chunk_id in self._staged:
+                self._staged_dead.add(self._staged.pop(chunk_id))
+            self._removed.add(chunk_id)
+
+    def save(self):
+        """Merge staged changes into the index and write it to `path`."""
+        if self._staged_ids or self._removed:
+            self._merge()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        deltas = self.postings_docs.astype(np.int64)
+        if len(deltas):
+            first = np.zeros(len(deltas), dtype=bool)
+            first[self.offsets[:-1][np.diff(self.offsets) > 0]] = True
+            deltas[1:] = np.where(first[1:], deltas[1:], deltas[1:] - deltas[:-1])
+        tmp_path = self.path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            terms=self.terms,
+            offsets=self.offsets,
+            postings_deltas=deltas.astype(np.uint32),
+            postings_tfs=self.postings_tfs,
+            doc_ids=self.doc_ids,
+            doc_lengths=self.doc_lengths
+        )
+        os.replace(tmp_path, self.path)
+
+    def _reset_staging(self):
+        self._staged = {}
+        self._staged_ids = []
+        self._staged_dead = set()
+        self._staged_vocab = {}
+        self._staged_terms = array("I")
+        self._staged_docs = array("I")
+        self._staged_tfs = array("H")
+        self._staged_lengths = array("I")
+        self._removed = set()
+
+    def _merge(self):
+        # existing postings, minus removed docs and docs being re-added
+        dropped = self._removed | set(self._staged)
+        keep_docs = np.ones(len(self.doc_ids), dtype=bool)
+        if dropped and len(self.doc_ids):
+            keep_docs = ~np.isin(self.doc_ids, np.array(list(dropped), dtype=str))
+        keep_postings = keep_docs[self.postings_docs]
+        old_docs = (np.cumsum(keep_docs) - 1)[self.postings_docs[keep_postings]]
+        old_terms = np.repeat(np.arange(len(self.terms)), np.diff(self.offsets))[keep_postings]
+        old_tfs = self.postings_tfs[keep_postings]
+
+        # staged postings, minus staged docs that were removed or replaced again
+        live_staged = np.ones(len(self._staged_ids), dtype=bool)
+        live_staged[list(self._staged_dead)] = False
+        staged_docs = np.frombuffer(self._staged_docs, dtype=np.uint32).astype(np.int64)
+        keep_staged = live_staged[staged_docs]
+        new_docs = int(keep_docs.sum()) + (np.cumsum(live_staged) - 1)[staged_docs[keep_staged]]
+        new_terms = np.frombuffer(self._staged_terms, dtype=np.uint32)[keep_staged]
+        new_tfs = np.frombuffer(self._staged_tfs, dtype=np.uint16)[keep_staged]
+
+        # one sorted vocabulary; old and staged term numbers are mapped into it
+        staged_vocab = np.array(list(self._staged_vocab), dtype=str)
+        vocabulary = np.union1d(self.terms, staged_vocab)
+        term_numbers = np.concatenate([
+            np.searchsorted(vocabulary, self.terms)[old_terms],
+            np.searchsorted(vocabulary, staged_vocab)[new_terms] if len(staged_vocab) else np.zeros(0, dtype=np.int64)
+        ])
+        docs = np.concatenate([old_docs, new_docs])
+        tfs = np.concatenate([old_tfs, new_tfs])
+        counts = np.bincount(term_numbers, minlength=len(vocabulary))
+        # drop terms whose last posting was removed
+        used_terms = counts > 0
+        term_numbers = (np.cumsum(used_terms) - 1)[term_numbers]
+        order = np.lexsort((docs, term_numbers))
+        self.terms = vocabulary[used_terms]
+        self.offsets = np.concatenate([[0], np.cumsum(counts[used_terms])]).astype(np.int64)
+        self.postings_docs = docs[order].astype(np.uint32)
+        self.postings_tfs = tfs[order].astype(np.uint16)
+        self.doc_ids = np.concatenate([self.doc_ids[keep_docs], np.array(self._staged_ids, dtype=str)[live_staged]])
+        self.doc_lengths = np.concatenate([
+            self.doc_lengths[keep_docs],
+            np.frombuffer(self._staged_lengths, dtype=np.uint32)[live_staged]
+        ])
+        self._reset_staging()
+        self._update_stats()
+
+def rebuild(collection_name, page_size=5000):
+    """Build the lexical index for a configured collection from the documents already in Chroma."""
+    import chromadb
+    from retrieval import COLLECTIONS
+    config = next((c for c in COLLECTIONS if c["name"] == collection_name), None)
+    if config is None or "lexical_index" not in config:
+        print(f"Error: no collection named '{collection_name}' with a lexical index is configured in retrieval.COLLECTIONS.")
+        sys.exit(1)
+    collection = chromadb.PersistentClient(path=config["persist_directory"]).get_collection(config.get("collection_name", "langchain"))
+    if os.path.exists(config["lexical_index"]):
+        os.remove(config["lexical_index"])
+    index = LexicalIndex(config["lexical_index"])
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=["documents"])
+        if not page["ids"]:
+            break
+        index.add(page["ids"], page["documents"])
+        offset += len(page["ids"])
+        print(f"Read {offset} chunks", end="\r", flush=True)
+    index.save()
+    print(f"\nLexical index for '{collection_name}' written to {config['lexical_index']} ({len(index)} chunks)")
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] != "rebuild":
+        print("Usage: python lexical_index.py rebuild <collection name>")
+        sys.exit(1)
+    rebuild(sys.argv[2])
+
+if __name__ == "__main__":
+    main()
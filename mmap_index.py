@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped vector index for Scraper2Notebook
+
+A read-only export of a Chroma collection for searching without the Chroma
+client: the vectors as one contiguous float16 or int8 matrix, searched with
+vectorised NumPy, plus the chunk texts and metadata in side files. Every file
+is opened with mmap, so worker processes serving the same index share one copy
+of its pages in the OS page cache instead of each loading its own.
+
+An export is a snapshot. It records its collection's generation (bumped only by
+ingests of that collection), and retrieval.py falls back to Chroma for a
+collection whose export is older than the collection's latest ingest.
+Re-export after ingesting.
+
+Select it per collection in retrieval.COLLECTIONS with
+"vector_backend": "mmap" (and optionally "mmap_index", "mmap_dtype", "mmap_rerank").
+
+Usage: python mmap_index.py export <collection name> [--dtype float16|int8]
+       python mmap_index.py info <collection name>
+"""
+
+from langchain_core.documents import Document
+from index_generation import bump_generation, read_generation
+import numpy as np
+import argparse, json, mmap, os, shutil, sys
+
+MMAP_INDEX_DIRECTORY = "./mmap_index"
+# int8 scans faster than float16 (whose conversion to float32 dominates a NumPy scan) and, with the
+# float32 re-ranking, finds the same top k
+DEFAULT_DTYPE = "int8"
+DTYPES = ("float16", "int8")
+# Candidates re-ranked with the exact float32 vectors: this many times k per query
+RERANK_FACTOR = 4
+# Rows scored per matrix product; small enough for the float32 copy of a block to stay in cache
+BLOCK_ROWS = 1024
+# Chunks read from Chroma per call during an export
+EXPORT_PAGE_SIZE = 2000
+# Metadata stored as integer codes (with the distinct values in the manifest) for filtering
+CATEGORICAL_FIELDS = ("source_type", "repo", "subreddit")
+NUMERIC_FIELDS = ("timestamp", "score")
+
+def index_path(config):
+    return config.get("mmap_index") or os.path.join(MMAP_INDEX_DIRECTORY, config["name"])
+
+class MmapVectorIndex:
+    """Top-k search over an exported collection.
+
+    Rows are in chunk ID order, so an ID is found with a binary search. Scores
+    are computed against the quantised matrix a block at a time. With
+    `rerank`, the best `RERANK_FACTOR * k` candidates of each query are
+    re-scored with the float32 vectors, which only touches their rows.
+    Distances are the collection's own (squared L2, or 1 - cosine/inner
+    product), so they can be read like Chroma's.
+    """
+
+    def __init__(self, path, rerank=True):
+        self.path = path
+        self.rerank = rerank
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.space = self.manifest["space"]
+        self.dtype = self.manifest["dtype"]
+        self.generation = self.manifest["generation"]
+        self.collection = self.manifest["collection"]
+        self.vectors = self._load("vectors.npy")
+        self.exact_vectors = self._load("vectors_f32.npy")
+        self.scales = self._load("scales.npy") if self.dtype == "int8" else None
+        self.norms = self._load("norms.npy")
+        self.ids = self._load("ids.npy")
+        self.offsets = self._load("offsets.npy")
+        self.columns = {field: self._load(f"{field}.npy") for field in CATEGORICAL_FIELDS + NUMERIC_FIELDS}
+        self.vocabularies = self.manifest["vocabularies"]
+        with open(os.path.join(path, "records.jsonl"), "rb") as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, name), mmap_mode="r")
+
+    def is_current(self):
+        """False once an ingest has changed this export's collection since it was taken."""
+        return self.generation == read_generation(collection=self.collection)
+
+    def search(self, embedding, k, filters=None, source_types=None):
+        """Return [(document, distance)] for one query embedding, nearest first."""
+        return self.search_batch([embedding], k, filters, source_types)[0]
+
+    def search_batch(self, embeddings, k, filters=None, source_types=None):
+        """Top-k for several query embeddings at once; one result list per query.
+
+        `filters` (a `search_filters.SearchFilters`) is evaluated on the
+        metadata columns first, and only matching rows are scored.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        if self.space == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        mask = filters.to_mask(self.columns, self.vocabularies, source_types) if filters is not None else None
+        rows = np.flatnonzero(mask) if mask is not None else None
+        total = len(self) if rows is None else len(rows)
+        if total == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+        candidates = min(total, k * RERANK_FACTOR if self.rerank else k)
+        best_rows, best_distances = self._scan(queries, rows, total, candidates)
+        results = []
+        for query, query_rows, distances in zip(queries, best_rows, best_distances):
+            if self.rerank:
+                distances = self._exact_distances(query, query_rows)
+            else:
+                distances = self._finish_approximate(query, distances)
+            order = np.argsort(distances, kind="stable")[:k]
+            results.append([(self.document(int(query_rows[i])), float(distances[i])) for i in order])
+        return results
+
+    def _scan(self, queries, rows, total, candidates):
+        """Best `candidates` rows per query by approximate distance (without per-query constants)."""
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_distances = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, total, BLOCK_ROWS):
+            if rows is None:
+                block_rows = np.arange(start, min(start + BLOCK_ROWS, total))
+                selection = slice(start, start + BLOCK_ROWS)
+            else:
+                block_rows = selection = rows[start:start + BLOCK_ROWS]
+            block = np.asarray(self.vectors[selection], dtype=np.float32)
+            scales = self.scales[selection] if self.scales is not None else None
+            products = block @ queries.T
+            if scales is not None:
+                products *= scales[:, None]
+            if self.space == "l2":
+                distances = self.norms[selection][:, None] - 2.0 * products
+            else:
+                distances = -products
+            distances = distances.T
+            merged_rows = np.concatenate([best_rows, np.broadcast_to(block_rows, distances.shape)], axis=1)
+            merged_distances = np.concatenate([best_distances, distances], axis=1)
+            if merged_rows.shape[1] > candidates:
+                keep = np.argpartition(merged_distances, candidates - 1, axis=1)[:, :candidates]
+                merged_rows = np.take_along_axis(merged_rows, keep, axis=1)
+                merged_distances = np.take_along_axis(merged_distances, keep, axis=1)
+            best_rows, best_distances = merged_rows, merged_distances
+        return best_rows, best_distances
+
+    def _exact_distances(self, query, rows):
+        # sorted, so the float32 rows are read in file order
+        order = np.argsort(rows)
+        vectors = np.asarray(self.exact_vectors[rows[order]], dtype=np.float32)
+        if self.space == "l2":
+            distances = np.sum((vectors - query) ** 2, axis=1)
+        elif self.space == "cosine":
+            distances = 1.0 - (vectors @ query) / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        else:
+            distances = 1.0 - vectors @ query
+        exact = np.empty_like(distances)
+        exact[order] = distances
+        return exact
+
+    def _finish_approximate(self, query, distances):
+        if self.space == "l2":
+            return distances + float(query @ query)
+        return 1.0 + distances
+
+    def row_of(self, chunk_id):
+        row = int(np.searchsorted(self.ids, chunk_id))
+        return row if row < len(self.ids) and self.ids[row] == chunk_id else None
+
+    def document(self, row):
+        record = json.loads(self._records[self.offsets[row]:self.offsets[row + 1]])
+        return Document(page_content=record["text"], metadata=record["metadata"], id=str(self.ids[row]))
+
+    def get_documents(self, chunk_ids, filters=None, source_types=None):
+        """{chunk ID: document} for the given IDs that exist and match `filters`."""
+        rows = [row for row in (self.row_of(chunk_id) for chunk_id in chunk_ids) if row is not None]
+        if filters is not None and rows:
+            mask = filters.to_mask(self.columns, self.vocabularies, source_types)
+            if mask is not None:
+                rows = [row for row in rows if mask[row]]
+        return {str(self.ids[row]): self.document(row) for row in rows}
+
+def export_collection(collection, path, name, dtype=DEFAULT_DTYPE, page_size=EXPORT_PAGE_SIZE):
+    """Write `collection` (a chromadb collection) to `path` as an `MmapVectorIndex`.
+
+    `name` is the collection's name in retrieval.COLLECTIONS, whose generation
+    the export records. The export is written next to `path` and swapped in
+    when complete, so processes still reading the old export are unaffected.
+    The overall index generation is bumped afterwards, so running apps reload it.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown dtype '{dtype}', expected one of {', '.join(DTYPES)}")
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    ids = sorted(collection.get(include=[])["ids"])
+    tmp_path = path.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    count = len(ids)
+    exact = None
+    numeric = {field: np.full(count, np.nan) for field in NUMERIC_FIELDS}
+    categorical = {field: np.full(count, -1, dtype=np.int32) for field in CATEGORICAL_FIELDS}
+    vocabularies = {field: {} for field in CATEGORICAL_FIELDS}
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    with open(os.path.join(tmp_path, "records.jsonl"), "wb") as records:
+        for start in range(0, count, page_size):
+            page_ids = ids[start:start + page_size]
+            page = collection.get(ids=page_ids, include=["embeddings", "documents", "metadatas"])
+            # Chroma doesn't promise to return the rows in the order asked for
+            position = {chunk_id: i for i, chunk_id in enumerate(page["ids"])}
+            for row, chunk_id in enumerate(page_ids, start):
+                i = position[chunk_id]
+                vector = np.asarray(page["embeddings"][i], dtype=np.float32)
+                if exact is None:
+                    exact = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors_f32.npy"), mode="w+", dtype=np.float32, shape=(count, len(vector)))
+                exact[row] = vector
+                metadata = page["metadatas"][i] or {}
+                for field in NUMERIC_FIELDS:
+                    if isinstance(metadata.get(field), (int, float)):
+                        numeric[field][row] = metadata[field]
+                for field in CATEGORICAL_FIELDS:
+                    if metadata.get(field) is not None:
+                        categorical[field][row] = vocabularies[field].setdefault(metadata[field], len(vocabularies[field]))
+                records.write(json.dumps({"text": page["documents"][i], "metadata": metadata}).encode("utf-8") + b"\n")
+                offsets[row + 1] = records.tell()
+    if exact is None:
+        exact = np.zeros((0, 0), dtype=np.float32)
+        np.save(os.path.join(tmp_path, "vectors_f32.npy"), exact)
+    else:
+        exact.flush()
+
+    np.save(os.path.join(tmp_path, "ids.npy"), np.array(ids, dtype=str))
+    np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+    for field in NUMERIC_FIELDS:
+        np.save(os.path.join(tmp_path, f"{field}.npy"), numeric[field])
+    for field in CATEGORICAL_FIELDS:
+        np.save(os.path.join(tmp_path, f"{field}.npy"), categorical[field])
+    write_quantized(exact, tmp_path, dtype, space)
+
+    manifest = {
+        "space": space,
+        "dtype": dtype,
+        "count": count,
+        "dimensions": int(exact.shape[1]) if count else 0,
+        "collection": name,
+        "generation": read_generation(collection=name),
+        "vocabularies": {field: list(values) for field, values in vocabularies.items()}
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    old_path = path.rstrip("/") + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    bump_generation()
+    return manifest
+
+def write_quantized(exact, path, dtype, space):
+    """The scanned matrix (float16, or int8 with a float32 scale per row) and the squared row norms."""
+    count = len(exact)
+    dimensions = exact.shape[1] if count else 0
+    vectors = np.lib.format.open_memmap(os.path.join(path, "vectors.npy"), mode="w+", dtype=dtype, shape=(count, dimensions))
+    norms = np.zeros(count, dtype=np.float32)
+    scales = np.ones(count, dtype=np.float32)
+    for start in range(0, count, BLOCK_ROWS):
+        block = np.asarray(exact[start:start + BLOCK_ROWS], dtype=np.float32)
+        if space == "cosine":
+            block = block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        norms[start:start + len(block)] = np.sum(block * block, axis=1)
+        if dtype == "int8":
+            block_scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127.0
+            scales[start:start + len(block)] = block_scales
+            block = np.round(block / block_scales[:, None])
+        vectors[start:start + len(block)] = block.astype(dtype)
+    vectors.flush()
+    np.save(os.path.join(path, "norms.npy"), norms)
+    if dtype == "int8":
+        np.save(os.path.join(path, "scales.npy"), scales)
+
+def collection_config(name):
+    from retrieval import COLLECTIONS
+    for config in COLLECTIONS:
+        if config["name"] == name:
+            return config
+    raise SystemExit(f"Unknown collection '{name}'; choose from: {', '.join(config['name'] for config in COLLECTIONS)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a Chroma collection to a memory-mapped vector index.")
+    parser.add_argument("command", choices=["export", "info"])
+    parser.add_argument("collection")
+    parser.add_argument("--dtype", choices=DTYPES, help="Scanned matrix type (default: the collection's \"mmap_dtype\" or int8)")
+    args = parser.parse_args()
+    config = collection_config(args.collection)
+    path = index_path(config)
+    if args.command == "info":
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            print(f"No export at '{path}'")
+            sys.exit(1)
+        index = MmapVectorIndex(path)
+        print(f"{path}: {len(index)} vectors, {index.dtype}, {index.space} distance, generation {index.generation} ({'current' if index.is_current() else 'stale'})")
+        return
+    if not os.path.isdir(config["persist_directory"]):
+        raise SystemExit(f"'{config['persist_directory']}' does not exist. Run ingest.py or ingest-pdf.py first.")
+    import chromadb
+    client = chromadb.PersistentClient(path=config["persist_directory"])
+    collection = client.get_collection(config.get("collection_name", "langchain"))
+    manifest = export_collection(collection, path, config["name"], args.dtype or config.get("mmap_dtype", DEFAULT_DTYPE))
+    print(f"Exported {manifest['count']} vectors ({manifest['dtype']}, {manifest['space']}) to '{path}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from concurrent.futures import Future
+import logging, queue, threading, time
+
+# How long Ollama keeps a model loaded after its last request (Ollama's own default is 5m). Every
+# generation sends it too, so answering doesn't shorten what a preload set.
+OLLAMA_KEEP_ALIVE = "30m"
+# How long the installed-model list (ollama.list) is reused before asking Ollama again
+MODEL_LIST_TTL_SECONDS = 60
+# How long the resident-model list (ollama.ps) is reused
+RESIDENCY_TTL_SECONDS = 5
+# Embedding models Ollama lists alongside the chat models; not offered for answering
+EXCLUDED_MODEL_PREFIXES = ("mxbai-embed", "nomic-embed", "all-minilm")
+
+class ModelManager:
+    """Preloads Ollama models in the background and tracks which ones are resident.
+
+    `preload(model)` queues a load and returns a `Future`. A single worker
+    thread performs the loads one at a time, so several users switching models
+    at once load one model after another instead of pulling all of them into
+    RAM together. A model already queued or loading is not queued again. Each
+    load also reads the model's context window and tokenizer ratio
+    (`context_packing.get_model_limits`), so the first question after a switch
+    pays for neither.
+
+    Whether a model stays loaded is up to Ollama: preloads and generations ask
+    it to keep the model for `keep_alive`, and OLLAMA_MAX_LOADED_MODELS on the
+    server caps how many fit at once. `resident()` reports what is loaded now.
+    """
+
+    def __init__(self, host=None, keep_alive=OLLAMA_KEEP_ALIVE, list_ttl=MODEL_LIST_TTL_SECONDS, residency_ttl=RESIDENCY_TTL_SECONDS):
+        import ollama
+        # host None lets the client read OLLAMA_HOST, as converse.py does
+        self.client = ollama.Client(host=host)
+        self.keep_alive = keep_alive
+        self.list_ttl = list_ttl
+        self.residency_ttl = residency_ttl
+        self.loads = 0
+        self.failures = 0
+        self.load_seconds = {}
+        self.loading = None
+        self._pending = {}
+        self._models = (0.0, None)
+        self._resident = (0.0, None)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="model-preload", daemon=True).start()
+
+    def preload(self, model):
+        """Queue `model` to be loaded with `keep_alive`; returns a `Future` resolved when it is loaded."""
+        with self._lock:
+            if model in self._pending:
+                return self._pending[model]
+            future = Future()
+            self._pending[model] = future
+        self._queue.put(model)
+        return future
+
+    def status(self, model):
+        """One of "loading", "queued", "resident" or "not loaded"."""
+        with self._lock:
+            if self.loading == model:
+                return "loading"
+            if model in self._pending:
+                return "queued"
+        try:
+            return "resident" if model in self.resident() else "not loaded"
+        except Exception:
+            return "not loaded"
+
+    def list_models(self, refresh=False):
+        """Installed chat models, from `ollama.list()` at most every `list_ttl` seconds. Raises if Ollama can't be reached."""
+        fetched_at, models = self._models
+        if refresh or models is None or time.monotonic() - fetched_at > self.list_ttl:
+            response = self.client.list()
+            models = [model.model for model in response.models if not model.model.startswith(EXCLUDED_MODEL_PREFIXES)]
+            self._models = (time.monotonic(), models)
+        return list(models)
+
+    def resident(self, refresh=False):
+        """{model: {size_mb, vram_mb, expires_at}} for the models Ollama has loaded, from `ollama.ps()` at most every `residency_ttl` seconds."""
+        fetched_at, resident = self._resident
+        if refresh or resident is None or time.monotonic() - fetched_at > self.residency_ttl:
+            resident = {
+                model.model: {
+                    "size_mb": (model.size or 0) / (1024 * 1024),
+                    "vram_mb": (model.size_vram or 0) / (1024 * 1024),
+                    "expires_at": model.expires_at.astimezone().strftime("%H:%M:%S") if model.expires_at else None
+                }
+                for model in self.client.ps().models
+            }
+            self._resident = (time.monotonic(), resident)
+        return dict(resident)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "keep_alive": self.keep_alive,
+                "loading": self.loading,
+                "queued": [model for model in self._pending if model != self.loading],
+                "loads": self.loads,
+                "failures": self.failures,
+                "load_seconds": dict(self.load_seconds)
+            }
+
+    def _run(self):
+        while True:
+            model = self._queue.get()
+            with self._lock:
+                self.loading = model
+                future = self._pending[model]
+            start_time = time.perf_counter()
+            try:
+                self._load(model)
+            except Exception as e:
+                logging.error(f"Preloading model '{model}' failed: {e}")
+                with self._lock:
+                    self.failures += 1
+                future.set_exception(e)
+            else:
+                seconds = time.perf_counter() - start_time
+                logging.info(f"Preloaded model '{model}' in {seconds:.1f}s (keep_alive {self.keep_alive})")
+                with self._lock:
+                    self.loads += 1
+                    self.load_seconds[model] = seconds
+                future.set_result(model)
+            finally:
+                with self._lock:
+                    self.loading = None
+                    del self._pending[model]
+                self._resident = (0.0, None)
+
+    def _load(self, model):
+        from context_packing import get_model_limits
+        limits = get_model_limits(model)
+        # an empty prompt only loads the model, and sets how long it stays. Answers run with the
+        # model's num_ctx, and Ollama reloads a model asked for a different one, so load it with that.
+        self.client.generate(model=model, prompt="", options={"num_ctx": limits.num_ctx}, keep_alive=self.keep_alive)
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_model_manager():
+    """Return the process-wide `ModelManager`, creating it on first use."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ModelManager()
+    return _manager
@@ -0,0 +1,164 @@
+from collections import deque
+from contextlib import contextmanager
+from tinydb import TinyDB
+import logging, os, re, threading, time
+
+MODEL_CONFIG_PATH = "./config.json"
+
+# Heuristic thresholds; override any of them with a "routing" object in the
+# `model` table of config.json (written by setup.py)
+ROUTING_DEFAULTS = {
+    "enabled": True,
+    # questions longer than this always go to the main model
+    "max_fast_words": 14,
+    # a question starting with one of these (as whole words) is a lookup
+    "lookup_prefixes": [
+        "what is", "what's", "what are", "where is", "where are", "where do", "which", "who", "when",
+        "is there", "are there", "does", "do i need", "can i", "list", "name", "define", "how do i enable",
+        "how do i install", "how do i set"
+    ],
+    # words that mean explanation, comparison or code generation, which need the main model
+    "escalate_keywords": [
+        "why", "explain", "compare", "difference", "versus", "vs", "tradeoff", "trade-off", "pros", "cons",
+        "design", "debug", "refactor", "implement", "write", "step by step", "in detail", "architecture"
+    ],
+    # retrieval is high-confidence when the top chunk was found by both vector and BM25 search
+    # and its raw vector distance is at most this
+    "max_confident_distance": 0.8,
+    # generations running or waiting on the fast model above which questions fall back to the main model
+    "max_fast_in_flight": 2
+}
+# Latencies kept per tier for the running averages in `stats()`
+LATENCY_WINDOW = 200
+
+class Route:
+    def __init__(self, tier, model, reason):
+        self.tier = tier
+        self.model = model
+        self.reason = reason
+
+class ModelRouter:
+    """Chooses between the main model and the fast model for each question.
+
+    Short lookup-style questions, and questions whose retrieval came back with
+    a confident top match, go to the fast model; anything long or asking for
+    explanation goes to the main model. If the fast model already has
+    `max_fast_in_flight` generations in progress the question is escalated
+    rather than queued behind them. In-flight counts and per-tier latency are
+    tracked by `track()`, which `Converse` wraps around every generation.
+    """
+
+    def __init__(self, fast_model=None, settings=None):
+        self.fast_model = fast_model
+        self.settings = {**ROUTING_DEFAULTS, **(settings or {})}
+        self._in_flight = {}
+        self._latencies = {"fast": deque(maxlen=LATENCY_WINDOW), "main": deque(maxlen=LATENCY_WINDOW)}
+        self._counts = {"fast": 0, "main": 0, "fallback": 0}
+        # optional callable(model) -> requests waiting for the model outside Converse (api.py's limiter)
+        self.queue_depth = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path=MODEL_CONFIG_PATH):
+        """Read `fast_model` and `routing` from the `model` table of config.json.
+
+        A missing file or table means routing is off. A file TinyDB can't read,
+        or a `routing` value that isn't an object, is logged and replaced by
+        the defaults, so a bad config never stops `Converse` from being created.
+        """
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with TinyDB(path) as db:
+                rows = db.table('model').all()
+        except Exception as e:
+            logging.error(f"Routing: could not read the model table of {path} ({e}); routing is off. Expected TinyDB's layout, see config.example.json")
+            return cls()
+        row = rows[0] if rows else {}
+        routing = row.get("routing")
+        if routing is not None and not isinstance(routing, dict):
+            logging.error(f"Routing: 'routing' in {path} must be an object, got {type(routing).__name__}; using the defaults")
+            routing = None
+        unknown = sorted(set(routing or {}) - set(ROUTING_DEFAULTS))
+        if unknown:
+            logging.error(f"Routing: ignoring unknown settings in {path}: {', '.join(unknown)}")
+            routing = {key: value for key, value in routing.items() if key in ROUTING_DEFAULTS}
+        return cls(row.get("fast_model"), routing)
+
+    @property
+    def enabled(self):
+        return bool(self.settings["enabled"] and self.fast_model)
+
+    def route(self, question, main_model, docs=None):
+        """Return the `Route` for `question`; `main_model` is the model selected in the app."""
+        if not self.enabled or self.fast_model == main_model:
+            return Route("main", main_model, "routing disabled")
+        tier, reason = self._classify(question, docs or [])
+        if tier == "fast" and self.in_flight(self.fast_model) >= self.settings["max_fast_in_flight"]:
+            with self._lock:
+                self._counts["fallback"] += 1
+            return Route("main", main_model, f"fast model saturated ({reason})")
+        return Route(tier, self.fast_model if tier == "fast" else main_model, reason)
+
+    def _classify(self, question, docs):
+        text = " ".join(question.lower().split())
+        words = re.findall(r"[\w'\-]+", text)
+        if len(words) > self.settings["max_fast_words"]:
+            return "main", f"long question ({len(words)} words)"
+        for keyword in self.settings["escalate_keywords"]:
+            if re.search(r"\b" + re.escape(keyword) + r"\b", text):
+                return "main", f"needs reasoning ('{keyword}')"
+        for prefix in self.settings["lookup_prefixes"]:
+            # whole words only: "list" must not match "listen", nor "does" match "doesn't"
+            if re.match(re.escape(prefix) + r"\b", text):
+                return "fast", f"lookup ('{prefix}')"
+        if docs:
+            top = docs[0].metadata
+            distance = top.get("vector_distance")
+            if "lexical_score" in top and distance is not None and distance <= self.settings["max_confident_distance"]:
+                return "fast", f"confident retrieval (distance {distance:.2f})"
+        return "main", "default"
+
+    def in_flight(self, model):
+        """Generations running on `model`, plus requests queued for it if a `queue_depth` callback is set."""
+        with self._lock:
+            running = self._in_flight.get(model, 0)
+        return running + (self.queue_depth(model) if self.queue_depth else 0)
+
+    @contextmanager
+    def track(self, route):
+        """Count a generation on `route.model` while it runs and record its latency for the tier."""
+        with self._lock:
+            self._in_flight[route.model] = self._in_flight.get(route.model, 0) + 1
+            self._counts[route.tier] += 1
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start_time
+            with self._lock:
+                self._in_flight[route.model] -= 1
+                self._latencies[route.tier].append(seconds)
+            logging.info(f"Routing: tier={route.tier} | model={route.model} | reason={route.reason} | latency={seconds:.2f}s")
+
+    def stats(self):
+        with self._lock:
+            stats = {"fallbacks": self._counts["fallback"]}
+            for tier, latencies in self._latencies.items():
+                stats[tier] = {
+                    "questions": self._counts[tier],
+                    "average_seconds": sum(latencies) / len(latencies) if latencies else None
+                }
+            return stats
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_model_router():
+    """Return the process-wide `ModelRouter`, reading config.json on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter.from_config()
+    return _router
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime query embedder for Scraper2Notebook
+
+Runs a sentence-transformers model (by default all-MiniLM-L6-v2, the model
+./chroma_db was built with) through ONNX Runtime instead of PyTorch, so the
+app and the API never import torch. With int8 dynamic quantization the model
+file shrinks to about a quarter and runs faster on CPU. `python benchmark.py`
+measures the memory and latency of each.
+
+The vectors are not bit-identical to PyTorch's. `validate` re-embeds a sample
+of the chunks stored in a collection and compares them with the stored vectors
+by cosine similarity. If they agree above the threshold, the existing index
+can be queried with the ONNX model without re-ingesting.
+
+Select it per collection in retrieval.COLLECTIONS with "embedding": "onnx"
+(and optionally "onnx_model", "onnx_quantized").
+
+Usage: python onnx_embeddings.py export <collection name> [--no-quantize]
+       python onnx_embeddings.py validate <collection name> [--float32] [--sample 1000] [--min-cosine 0.98]
+"""
+
+from langchain_core.embeddings import Embeddings
+from index_generation import read_generation
+import numpy as np
+import argparse, json, os, random, shutil, sys
+
+ONNX_MODEL_DIRECTORY = "./onnx_models"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+VALIDATION_FILE = "validation.json"
+# ONNX opset for the export; 14 covers every op BERT-style encoders need
+OPSET_VERSION = 14
+# Texts per forward pass when embedding documents
+DOCUMENT_BATCH_SIZE = 32
+# ONNX Runtime intra-op threads; 0 lets it use every core
+ONNX_THREADS = 0
+# A model passes validation when every sampled stored vector has at least this cosine similarity with its re-embedding
+MIN_COSINE = 0.98
+# Stored chunks re-embedded by `validate`
+VALIDATION_SAMPLE = 1000
+
+def model_path(config):
+    return config.get("onnx_model") or os.path.join(ONNX_MODEL_DIRECTORY, config["model_name"].split("/")[-1])
+
+def model_file(quantized):
+    return QUANTIZED_MODEL_FILE if quantized else MODEL_FILE
+
+class OnnxEmbeddings(Embeddings):
+    """A sentence-transformers model exported with `export_model`, run with ONNX Runtime.
+
+    Reproduces the model's sentence-transformers pipeline: the same tokenizer
+    and truncation, mean pooling over the attention mask, and L2 normalisation
+    when the model has a Normalize module. Queries and documents are embedded
+    the same way, as `HuggingFaceEmbeddings` does. The session is safe to call
+    from several threads.
+    """
+
+    def __init__(self, path, quantized=True, threads=ONNX_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.path = path
+        self.quantized = quantized
+        self.model_name = self.manifest["model_name"]
+        self.file = model_file(quantized)
+        if not os.path.exists(os.path.join(path, self.file)):
+            raise FileNotFoundError(f"No {self.file} in '{path}'. Run: python onnx_embeddings.py export <collection>{'' if quantized else ' --no-quantize'}")
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.manifest["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.manifest["pad_token_id"], pad_token=self.manifest["pad_token"])
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(os.path.join(path, self.file), options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def embed_documents(self, texts):
+        vectors = []
+        for i in range(0, len(texts), DOCUMENT_BATCH_SIZE):
+            vectors.extend(self._embed(texts[i:i + DOCUMENT_BATCH_SIZE]).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _embed(self, texts):
+        if not texts:
+            return np.zeros((0, self.manifest["dimension"]), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(list(texts))
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        }
+        hidden = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+        mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.manifest["normalize"]:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
+
+def export_model(model_name, path, quantize=True):
+    """Export `model_name`'s transformer to `path` as ONNX (plus an int8 copy), with its tokenizer and pooling settings.
+
+    Needs torch and sentence-transformers (already installed for ingestion)
+    and, to quantize, the onnx package. The model is read from the local
+    Hugging Face cache when it is there.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device="cpu")
+    modules = list(model)
+    pooling = next((module for module in modules if type(module).__name__ == "Pooling"), None)
+    if pooling is None or pooling.get_pooling_mode_str() != "mean":
+        raise ValueError(f"'{model_name}' does not use mean pooling, which is all OnnxEmbeddings implements")
+    tokenizer = model.tokenizer
+    transformer = modules[0].auto_model.eval()
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in tokenizer.model_input_names]
+
+    tmp_path = path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    tokenizer.save_pretrained(tmp_path)
+    if not os.path.exists(os.path.join(tmp_path, "tokenizer.json")):
+        raise ValueError(f"'{model_name}' has no fast tokenizer (tokenizer.json) to export")
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            os.path.join(tmp_path, MODEL_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=OPSET_VERSION
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(os.path.join(tmp_path, MODEL_FILE), os.path.join(tmp_path, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+    manifest = {
+        "model_name": model_name,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "normalize": any(type(module).__name__ == "Normalize" for module in modules),
+        "files": [MODEL_FILE] + ([QUANTIZED_MODEL_FILE] if quantize else [])
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    # replace the previous export only once this one is complete
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return manifest
+
+def validate(embeddings, collection, sample=VALIDATION_SAMPLE, min_cosine=MIN_COSINE, seed=0):
+    """Compare `embeddings` with the vectors stored in a Chroma `collection` on a random sample of its chunks."""
+    ids = collection.get(include=[])["ids"]
+    ids = random.Random(seed).sample(ids, min(sample, len(ids)))
+    if not ids:
+        raise ValueError("The collection is empty")
+    stored = {"ids": [], "embeddings": [], "documents": []}
+    for i in range(0, len(ids), DOCUMENT_BATCH_SIZE * 10):
+        page = collection.get(ids=ids[i:i + DOCUMENT_BATCH_SIZE * 10], include=["embeddings", "documents"])
+        for key in stored:
+            stored[key].extend(page[key])
+    expected = np.asarray(stored["embeddings"], dtype=np.float32)
+    computed = np.asarray(embeddings.embed_documents(stored["documents"]), dtype=np.float32)
+    cosines = (expected * computed).sum(axis=1) / np.maximum(np.linalg.norm(expected, axis=1) * np.linalg.norm(computed, axis=1), 1e-12)
+    worst = np.argsort(cosines)[:3]
+    return {
+        "sample": len(cosines),
+        "mean_cosine": float(cosines.mean()),
+        "p01_cosine": float(np.quantile(cosines, 0.01)),
+        "min_cosine": float(cosines.min()),
+        "min_cosine_required": min_cosine,
+        "passed": bool(cosines.min() >= min_cosine),
+        "worst_ids": [stored["ids"][i] for i in worst]
+    }
+
+def read_validation(path):
+    try:
+        with open(os.path.join(path, VALIDATION_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def is_validated(config, quantized):
+    """Whether the collection's ONNX model passed `validate` against the collection as it is now."""
+    result = read_validation(model_path(config)).get(config["name"], {}).get(model_file(quantized))
+    return bool(result and result["passed"] and result["generation"] == read_generation(collection=config["name"]))
+
+def record_validation(config, quantized, result):
+    path = model_path(config)
+    validation = read_validation(path)
+    validation.setdefault(config["name"], {})[model_file(quantized)] = {**result, "generation": read_generation(collection=config["name"])}
+    with open(os.path.join(path, VALIDATION_FILE), "w") as f:
+        json.dump(validation, f, indent=2)
+
+def main():
+    from mmap_index import collection_config
+    parser = argparse.ArgumentParser(description="Export a collection's sentence-transformers model to ONNX and check it against the stored vectors.")
+    parser.add_argument("command", choices=["export", "validate"])
+    parser.add_argument("collection")
+    parser.add_argument("--no-quantize", action="store_true", help="Export only the float32 model")
+    parser.add_argument("--float32", action="store_true", help="Validate the float32 model instead of the int8 one")
+    parser.add_argument("--sample", type=int, default=VALIDATION_SAMPLE, help="Stored chunks to re-embed")
+    parser.add_argument("--min-cosine", type=float, default=MIN_COSINE)
+    args = parser.parse_args()
+    config = collection_config(args.collection)
+    if "model_name" not in config:
+        raise SystemExit(f"Collection '{args.collection}' has no \"model_name\" in retrieval.COLLECTIONS to export")
+    path = model_path(config)
+    if args.command == "export":
+        manifest = export_model(config["model_name"], path, quantize=not args.no_quantize)
+        print(f"Exported {manifest['model_name']} ({manifest['dimension']} dimensions, {', '.join(manifest['files'])}) to '{path}'")
+        print(f"Check it against the stored vectors before switching: python onnx_embeddings.py validate {args.collection}")
+        return
+    if not os.path.isdir(config["persist_directory"]):
+        raise SystemExit(f"'{config['persist_directory']}' does not exist. Run ingest.py first.")
+    import chromadb
+    client = chromadb.PersistentClient(path=config["persist_directory"])
+    collection = client.get_collection(config.get("collection_name", "langchain"))
+    quantized = not args.float32
+    embeddings = OnnxEmbeddings(path, quantized=quantized)
+    result = validate(embeddings, collection, args.sample, args.min_cosine)
+    record_validation(config, quantized, result)
+    print(f"{embeddings.file} against '{config['persist_directory']}' ({result['sample']} chunks): mean cosine {result['mean_cosine']:.4f}, 1st percentile {result['p01_cosine']:.4f}, min {result['min_cosine']:.4f}")
+    if not result["passed"]:
+        print(f"FAILED: below {args.min_cosine}, e.g. chunks {', '.join(result['worst_ids'])}. Keep \"embedding\": \"huggingface\" or re-ingest.")
+        sys.exit(1)
+    setting = '"embedding": "onnx"' if quantized else '"embedding": "onnx", "onnx_quantized": False'
+    print(f"Passed. Set {setting} for '{config['name']}' in retrieval.COLLECTIONS.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+from collections import OrderedDict
+import numpy as np
+import re, sys, threading, time, unicodedata
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 60 * 60
+# Cosine similarity above which two queries are treated as the same question
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+def normalize_query(query):
+    query = unicodedata.normalize("NFKC", query).lower()
+    query = re.sub(r"[^\w\s.\-/:]", " ", query)
+    return re.sub(r"\s+", " ", query).strip()
+
+class QueryCache:
+    """Retrieval result cache that matches on normalised text or on query-embedding similarity.
+
+    Entries are evicted least-recently-used beyond `max_entries` and expire
+    after `ttl_seconds`. Each entry is tagged with the index generation it was
+    computed under; a lookup under a newer generation drops every older entry,
+    so results never outlive the data they came from.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.generation = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+
+    def get(self, query, embedding=None, generation=0, scope=""):
+        """Return the cached documents for `query`, or None.
+
+        Entries only match lookups with the same `scope` (e.g. the search filters in effect).
+        """
+        key = (scope, normalize_query(query))
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._entries.get(key)
+            hit = "exact" if entry is not None else None
+            if entry is None and embedding is not None:
+                key = self._nearest(embedding, scope)
+                entry = self._entries.get(key) if key is not None else None
+                hit = "semantic" if entry is not None else None
+            if entry is not None and time.monotonic() - entry["created_at"] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            if hit == "exact":
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            self._entries.move_to_end(key)
+            return entry["docs"]
+
+    def put(self, query, docs, embedding=None, generation=0, scope=""):
+        key = (scope, normalize_query(query))
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        with self._lock:
+            self._check_generation(generation)
+            self._entries[key] = {
+                "docs": docs,
+                "embedding": embedding,
+                "created_at": time.monotonic(),
+                "size": self._size_of(key, docs, embedding)
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "memory_bytes": sum(entry["size"] for entry in self._entries.values()),
+                "generation": self.generation
+            }
+
+    def _check_generation(self, generation):
+        if generation != self.generation:
+            self._entries.clear()
+            self._matrix = None
+            self.generation = generation
+
+    def _nearest(self, embedding, scope):
+        """Key of the cached query in `scope` most similar to `embedding`, if above the threshold."""
+        if self._matrix is None:
+            self._matrix_keys = [key for key, entry in self._entries.items() if entry["embedding"] is not None]
+            self._matrix = np.stack([self._entries[key]["embedding"] for key in self._matrix_keys]) if self._matrix_keys else None
+        if self._matrix is None:
+            return None
+        embedding = np.asarray(embedding, dtype=np.float32)
+        similarities = self._matrix @ (embedding / (np.linalg.norm(embedding) or 1.0))
+        similarities[[key[0] != scope for key in self._matrix_keys]] = -np.inf
+        best = int(np.argmax(similarities))
+        return self._matrix_keys[best] if similarities[best] >= self.similarity_threshold else None
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    @staticmethod
+    def _size_of(key, docs, embedding):
+        size = sys.getsizeof(key[1]) + (embedding.nbytes if embedding is not None else 0)
+        for doc in docs:
+            size += sys.getsizeof(doc.page_content) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in doc.metadata.items())
+        return size
@@ -0,0 +1,407 @@
+import logging, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+import numpy as np
+from lexical_index import LexicalIndex
+from mmap_index import MmapVectorIndex, index_path
+from embedding_batcher import BatchingEmbeddings
+from index_generation import read_generation
+from query_cache import QueryCache
+from tracing import annotate, in_context, span
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+PERSIST_DIRECTORY = "./chroma_db"
+LEXICAL_INDEX_PATH = "./lexical_index/reddit_github.npz"
+RETRIEVER_K = 6
+WARM_UP_QUERY = "warm up"
+# Concurrent query embeddings are batched: at most this many per forward pass, waiting up to this long
+# under load (override per collection with "query_batch_size" / "query_batch_wait_ms")
+QUERY_BATCH_SIZE = 32
+QUERY_BATCH_WAIT_MS = 5.0
+# Reciprocal rank fusion constant: a result at rank r contributes weight / (RRF_K + r)
+RRF_K = 60
+# BM25 can't filter on metadata, so a filtered lexical search fetches this many times k hits and
+# keeps those that pass the filter
+LEXICAL_FILTER_OVERFETCH = 5
+# Sources whose chunks carry the repo/subreddit metadata offered as filters
+FILTER_OPTION_SOURCES = {"reddit", "github"}
+# Chunk metadata read from Chroma per call when listing filter options
+FILTER_OPTIONS_PAGE_SIZE = 5000
+
+# Collections searched for every query. Each is embedded with its own model, so
+# each gets its own embedder, and may have a BM25 index built at ingest time.
+# "source_types" lists the `source_type` values a collection holds, so a search
+# filtered to other sources skips it.
+# "vector_backend" is "chroma", or "mmap" to search an export made with
+# `python mmap_index.py export <name>` instead ("mmap_dtype": "float16" or
+# "int8" for the export, "mmap_rerank": False to skip the float32 re-ranking).
+# "embedding" is "huggingface" (PyTorch), "fastembed", or "onnx" to run the
+# "model_name" model exported with `python onnx_embeddings.py export <name>`
+# through ONNX Runtime ("onnx_quantized": False for the float32 export instead
+# of int8). Check it first with `python onnx_embeddings.py validate <name>`.
+# The first entry is the primary collection that `Converse.embedding_function` /
+# `Converse.vectorstore` refer to.
+COLLECTIONS = [
+    {
+        "name": "reddit_github",
+        "persist_directory": PERSIST_DIRECTORY,
+        "collection_name": "langchain",
+        "embedding": "huggingface",
+        "model_name": EMBEDDING_MODEL_NAME,
+        "lexical_index": LEXICAL_INDEX_PATH,
+        "source_types": ["reddit", "github"],
+        "vector_backend": "chroma",
+        "weight": 1.0
+    },
+    {
+        "name": "pdfs",
+        "persist_directory": "./chroma_db_pdfs",
+        "collection_name": "pdfs",
+        "embedding": "fastembed",
+        "lexical_index": "./lexical_index/pdfs.npz",
+        "source_types": ["pdf"],
+        "vector_backend": "chroma",
+        "weight": 1.0
+    }
+]
+
+def create_embeddings(config):
+    # the embedding libraries (torch, transformers, onnxruntime) and Chroma are imported when a
+    # service is first built, so importing this module (or converse.py) stays cheap
+    if config["embedding"] == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=config.get("model_name", EMBEDDING_MODEL_NAME))
+    if config["embedding"] == "fastembed":
+        from langchain_community.embeddings import FastEmbedEmbeddings
+        return FastEmbedEmbeddings(model_name=config["model_name"]) if "model_name" in config else FastEmbedEmbeddings()
+    if config["embedding"] == "onnx":
+        from onnx_embeddings import OnnxEmbeddings, is_validated, model_path
+        quantized = config.get("onnx_quantized", True)
+        if not is_validated(config, quantized):
+            print(f"Collection '{config['name']}': the ONNX model has not been validated against the current index. Run: python onnx_embeddings.py validate {config['name']}")
+        return OnnxEmbeddings(model_path(config), quantized=quantized)
+    raise ValueError(f"Unknown embedding type '{config['embedding']}' for collection '{config['name']}'")
+
+def load_vector_index(config):
+    """The collection's `MmapVectorIndex` if it is configured and its export is current, else None (search Chroma)."""
+    if config.get("vector_backend", "chroma") != "mmap":
+        return None
+    path = index_path(config)
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        print(f"Collection '{config['name']}': no memory-mapped export at '{path}', searching Chroma. Run: python mmap_index.py export {config['name']}")
+        return None
+    vector_index = MmapVectorIndex(path, rerank=config.get("mmap_rerank", True))
+    if not vector_index.is_current():
+        print(f"Collection '{config['name']}': the export at '{path}' predates the collection's last ingest, searching Chroma. Run: python mmap_index.py export {config['name']}")
+        return None
+    return vector_index
+
+def query_batch_function(config, embeddings):
+    """A function embedding a list of queries exactly as the model's `embed_query` embeds one."""
+    if config["embedding"] in ("huggingface", "onnx"):
+        # embed_query is embed_documents([text])[0] for both
+        return embeddings.embed_documents
+    if config["embedding"] == "fastembed":
+        # FastEmbed embeds queries with its own query_embed, which takes a list
+        return lambda texts: [vector.tolist() for vector in embeddings.model.query_embed(texts)]
+    return None
+
+class RetrievalShard:
+    """One Chroma collection together with the embedder it was built with and its optional BM25 index.
+
+    With a `vector_index` (an `MmapVectorIndex` exported from the collection),
+    searches and chunk lookups go to it instead of Chroma.
+    """
+
+    def __init__(self, name, embedding_function, vectorstore, weight=1.0, lexical_index=None, source_types=None, vector_index=None):
+        self.name = name
+        self.embedding_function = embedding_function
+        self.vectorstore = vectorstore
+        self.weight = weight
+        self.lexical_index = lexical_index
+        self.source_types = source_types
+        self.vector_index = vector_index
+
+    @classmethod
+    def from_config(cls, config):
+        embeddings = create_embeddings(config)
+        embedding_function = BatchingEmbeddings(
+            embeddings,
+            query_batch_function(config, embeddings),
+            config.get("query_batch_size", QUERY_BATCH_SIZE),
+            config.get("query_batch_wait_ms", QUERY_BATCH_WAIT_MS)
+        )
+        from langchain_chroma import Chroma
+        vectorstore = Chroma(
+            persist_directory=config["persist_directory"],
+            collection_name=config.get("collection_name", "langchain"),
+            embedding_function=embedding_function
+        )
+        lexical_index = None
+        if config.get("lexical_index") and os.path.exists(config["lexical_index"]):
+            lexical_index = LexicalIndex(config["lexical_index"])
+        return cls(config["name"], embedding_function, vectorstore, config.get("weight", 1.0), lexical_index, config.get("source_types"), load_vector_index(config))
+
+    def search(self, query, k, embedding=None, filters=None):
+        """Return [(document, score)] with scores min-max normalised to 0..1 within this shard, best first.
+
+        Pass `embedding` when the query was already embedded with this shard's model.
+        `filters` (a `SearchFilters`) is applied by Chroma before the similarity search.
+        """
+        if self.vector_index is not None:
+            if embedding is None:
+                embedding = self.embedding_function.embed_query(query)
+            results = self.vector_index.search(embedding, k, filters, self.source_types)
+        elif embedding is not None:
+            where = filters.to_where(self.source_types) if filters is not None else None
+            results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=where)
+        else:
+            where = filters.to_where(self.source_types) if filters is not None else None
+            results = self.vectorstore.similarity_search_with_score(query, k=k, filter=where)
+        if not results:
+            return []
+        distances = [distance for _, distance in results]
+        low, high = min(distances), max(distances)
+        spread = (high - low) or 1.0
+        for doc, distance in results:
+            # the raw distance is comparable across queries, unlike the normalised score
+            doc.metadata["vector_distance"] = float(distance)
+        return [(doc, 1.0 - (distance - low) / spread) for doc, distance in results]
+
+    def lexical_search(self, query, k, filters=None):
+        """Return [(document, BM25 score)] from the lexical index, best first.
+
+        With `filters`, hits that don't match are dropped by Chroma when their text is fetched.
+        """
+        if self.lexical_index is None:
+            return []
+        where = filters.to_where(self.source_types) if filters is not None else None
+        hits = self.lexical_index.search(query, k * LEXICAL_FILTER_OVERFETCH if where else k)
+        if not hits:
+            return []
+        if self.vector_index is not None:
+            docs = self.vector_index.get_documents([chunk_id for chunk_id, _ in hits], filters, self.source_types)
+        else:
+            stored = self.vectorstore.get(ids=[chunk_id for chunk_id, _ in hits], where=where, include=["documents", "metadatas"])
+            docs = {
+                chunk_id: Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+                for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+            }
+        # chunks deleted from Chroma since the index was saved are skipped
+        return [(docs[chunk_id], score) for chunk_id, score in hits if chunk_id in docs][:k]
+
+class FederatedRetriever:
+    """Runs a query against every shard concurrently and merges the results into one top-k.
+
+    Each shard contributes a vector result list and, if it has a lexical index,
+    a BM25 result list; all of them are searched in parallel. Scores from
+    different embedding models and from BM25 are not comparable, so the lists
+    are fused by rank (reciprocal rank fusion, weighted per collection). The
+    time each search took is returned by `search()` and logged, so a slow shard
+    shows up in `query_log.txt`.
+    """
+
+    def __init__(self, shards, k=RETRIEVER_K):
+        self.shards = shards
+        self.k = k
+        # room for a vector and a lexical search per shard
+        self._executor = ThreadPoolExecutor(max_workers=max(1, 2 * len(shards)), thread_name_prefix="retrieval")
+
+    def invoke(self, query):
+        docs, _ = self.search(query)
+        return docs
+
+    def search(self, query, k=None, query_embedding=None, filters=None):
+        """Return (documents, {search name: seconds}).
+
+        `query_embedding`, if given, must come from the first shard's embedder and is reused for that shard.
+        `filters` (a `SearchFilters`) is pushed down to each shard; shards that can't match are not searched.
+        """
+        k = k or self.k
+        if filters is not None and filters.is_empty():
+            filters = None
+        futures = {}
+        for i, shard in enumerate(self.shards):
+            if filters is not None and filters.excludes(shard.source_types):
+                continue
+            embedding = query_embedding if i == 0 else None
+            futures[shard.name] = (shard, "vector", self._executor.submit(in_context(self._timed_search), shard.name, shard.search, query, k, embedding, filters))
+            if shard.lexical_index is not None:
+                name = shard.name + ".lexical"
+                futures[name] = (shard, "lexical", self._executor.submit(in_context(self._timed_search), name, shard.lexical_search, query, k, None, filters))
+        fused = {}
+        latencies = {}
+        for name, (shard, kind, future) in futures.items():
+            try:
+                results, latencies[name] = future.result()
+            except Exception as e:
+                logging.error(f"Retrieval from '{name}' failed: {e}")
+                continue
+            for rank, (doc, score) in enumerate(results):
+                # the same chunk found by both searches counts once
+                key = (shard.name, doc.page_content)
+                if key not in fused:
+                    doc.metadata["collection"] = shard.name
+                    fused[key] = [doc, 0.0]
+                fused[key][0].metadata[f"{kind}_score"] = score
+                fused[key][1] += shard.weight / (RRF_K + rank + 1)
+        ranked = sorted(fused.values(), key=lambda item: item[1], reverse=True)[:k]
+        for doc, score in ranked:
+            doc.metadata["score"] = score
+        logging.info("Retrieval latency: " + ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in latencies.items()))
+        return [doc for doc, _ in ranked], latencies
+
+    def _timed_search(self, name, search, query, k, embedding, filters):
+        start_time = time.perf_counter()
+        with span(f"search.{name}"):
+            if embedding is None:
+                results = search(query, k, filters=filters)
+            else:
+                results = search(query, k, embedding, filters=filters)
+        return results, time.perf_counter() - start_time
+
+class RetrievalService:
+    """Holds the embedders, vector stores and retriever for the lifetime of the process.
+
+    Loading the embedding models and opening the Chroma stores are the
+    expensive parts of a query, so they are done once here and shared by every
+    `Converse` instance instead of being rebuilt per question.
+    """
+
+    def __init__(self, collections=COLLECTIONS, k=RETRIEVER_K):
+        self.shards = []
+        for config in collections:
+            if not os.path.isdir(config["persist_directory"]):
+                print(f"Skipping collection '{config['name']}': '{config['persist_directory']}' does not exist")
+                continue
+            self.shards.append(RetrievalShard.from_config(config))
+        if not self.shards:
+            raise RuntimeError("No vector store found. Run ingest.py or ingest-pdf.py first.")
+        self.embedding_function = self.shards[0].embedding_function
+        self.vectorstore = self.shards[0].vectorstore
+        self.retriever = FederatedRetriever(self.shards, k)
+        self.query_cache = QueryCache()
+        self.generation = read_generation()
+        self._collections = {config["name"]: config for config in collections}
+        self._filter_options = None
+
+    def retrieve(self, query, filters=None):
+        """Retrieve documents for `query` through the query cache.
+
+        The query is embedded once with the primary embedder; the embedding is
+        used both for the cache's similarity match and, on a miss, for the search.
+        Results are cached separately for each set of `filters` (a `SearchFilters`).
+        """
+        docs, _ = self.retrieve_with_embedding(query, filters)
+        return docs
+
+    def retrieve_with_embedding(self, query, filters=None):
+        """Like `retrieve`, but returns (documents, query embedding)."""
+        self._check_generation()
+        scope = filters.key() if filters is not None else ""
+        with span("retrieval.embed_query"):
+            embedding = self.embedding_function.embed_query(query)
+        with span("retrieval.query_cache"):
+            docs = self.query_cache.get(query, embedding, self.generation, scope)
+        annotate(query_cache_hit=docs is not None)
+        if docs is None:
+            with span("retrieval.search"):
+                docs, _ = self.retriever.search(query, query_embedding=embedding, filters=filters)
+            self.query_cache.put(query, docs, embedding, self.generation, scope)
+        return docs, embedding
+
+    def document_vectors(self, docs):
+        """{chunk text: stored vector} for those of `docs` that come from the primary collection.
+
+        The vectors are read from Chroma (or the memory-mapped export) rather
+        than recomputed. They are in the primary embedder's space, like the
+        query embedding; chunks from other collections are left out.
+        """
+        shard = self.shards[0]
+        texts = {doc.id: doc.page_content for doc in docs if getattr(doc, "id", None) and doc.metadata.get("collection") == shard.name}
+        if not texts:
+            return {}
+        if shard.vector_index is not None:
+            rows = {chunk_id: shard.vector_index.row_of(chunk_id) for chunk_id in texts}
+            return {texts[chunk_id]: np.asarray(shard.vector_index.exact_vectors[row]) for chunk_id, row in rows.items() if row is not None}
+        stored = shard.vectorstore.get(ids=list(texts), include=["embeddings"])
+        return {texts[chunk_id]: vector for chunk_id, vector in zip(stored["ids"], stored["embeddings"]) if chunk_id in texts}
+
+    def filter_options(self):
+        """Source types, repos and subreddits present in the stores, for filter controls.
+
+        Computed once per index generation. Only collections that can hold
+        Reddit or GitHub chunks are read: from the vocabularies of their
+        memory-mapped export when it is current, otherwise from Chroma's
+        metadata a page at a time.
+        """
+        self._check_generation()
+        if self._filter_options is None:
+            options = {"sources": set(), "repos": set(), "subreddits": set()}
+            for shard in self.shards:
+                options["sources"].update(shard.source_types or [])
+                if shard.source_types is not None and not set(shard.source_types) & FILTER_OPTION_SOURCES:
+                    continue
+                if shard.vector_index is not None and shard.vector_index.is_current():
+                    vocabularies = shard.vector_index.vocabularies
+                    options["repos"].update(value for value in vocabularies.get("repo", []) if value)
+                    options["subreddits"].update(value for value in vocabularies.get("subreddit", []) if value)
+                    continue
+                offset = 0
+                while True:
+                    metadatas = shard.vectorstore.get(include=["metadatas"], limit=FILTER_OPTIONS_PAGE_SIZE, offset=offset)["metadatas"]
+                    for metadata in metadatas:
+                        metadata = metadata or {}
+                        if metadata.get("repo"):
+                            options["repos"].add(metadata["repo"])
+                        if metadata.get("subreddit"):
+                            options["subreddits"].add(metadata["subreddit"])
+                    if len(metadatas) < FILTER_OPTIONS_PAGE_SIZE:
+                        break
+                    offset += FILTER_OPTIONS_PAGE_SIZE
+            self._filter_options = {key: sorted(values) for key, values in options.items()}
+        return self._filter_options
+
+    def _check_generation(self):
+        """Pick up lexical indexes and vector exports rewritten since the last query.
+
+        A collection whose memory-mapped export is now stale is searched through Chroma until it is re-exported.
+        """
+        generation = read_generation()
+        if generation == self.generation:
+            return
+        for shard in self.shards:
+            config = self._collections.get(shard.name, {})
+            path = config.get("lexical_index")
+            if path and os.path.exists(path):
+                shard.lexical_index = LexicalIndex(path)
+            if config:
+                shard.vector_index = load_vector_index(config)
+        self._filter_options = None
+        self.generation = generation
+
+    def embedding_stats(self):
+        """Query-embedding batch metrics per collection."""
+        return {shard.name: shard.embedding_function.stats() for shard in self.shards}
+
+    def warm_up(self, query=WARM_UP_QUERY):
+        """Run a dummy query so the first real question doesn't pay for lazy initialisation."""
+        try:
+            self.retriever.invoke(query)
+        except Exception as e:
+            print(f"Retrieval warm-up failed: {e}")
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_retrieval_service(warm_up=True):
+    """Return the process-wide `RetrievalService`, creating (and warming) it on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                service = RetrievalService()
+                if warm_up:
+                    service.warm_up()
+                _service = service
+    return _service
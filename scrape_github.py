@@ -1,10 +1,346 @@
-from github import Github
-
-g = Github()  # No token needed for public repos
-repos = ["RooVetGit/Roo-Code", "Mnehmos/The-Ultimate-Roo-Code-Hack-Building-a-Structured-Transparent-and-Well-Documented-AI-Team"]
-with open("github_data.txt", "w") as f:
-    for repo_name in repos:
-        repo = g.get_repo(repo_name)
-        f.write(f"{repo.description}\n")
-        readme = repo.get_readme()
-        f.write(readme.decoded_content.decode() + "\n")
\ No newline at end of file
+import requests
+import json
+import sys
+import hashlib, os, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+# Configuration file path; optional, the defaults below are used without it
+CONFIG_FILE = "github.config.json"
+# Point at a local stand-in (e.g. fake_github.py) for testing
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+
+DEFAULT_REPOS = ["RooVetGit/Roo-Code", "Mnehmos/The-Ultimate-Roo-Code-Hack-Building-a-Structured-Transparent-and-Well-Documented-AI-Team"]
+DEFAULT_OUTPUT_FILE = "github_data.jsonl"
+DEFAULT_CACHE_DIR = "./github_cache"
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_DOCS = 500
+DEFAULT_MAX_RELEASES = 50
+DEFAULT_MAX_ISSUES = 200
+# Markdown files taken from each repo's tree
+DOC_EXTENSIONS = (".md", ".mdx", ".markdown")
+PAGE_SIZE = 100
+
+def load_config(config_file=CONFIG_FILE):
+    config = {}
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r') as f:
+                config = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Error: Could not decode JSON from '{config_file}'. Please check its syntax.")
+            sys.exit(1)
+    if not isinstance(config.get("repos", DEFAULT_REPOS), list):
+        print(f"Error: 'repos' in '{config_file}' must be a list of \"owner/name\" strings.")
+        sys.exit(1)
+    return config
+
+class ResponseCache:
+    """On-disk cache of API responses keyed by URL, with their ETags, plus git blobs keyed by SHA.
+
+    A blob's content never changes for a given SHA, so cached blobs are used
+    without any request at all.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.responses = os.path.join(directory, "responses")
+        self.blobs = os.path.join(directory, "blobs")
+        os.makedirs(self.responses, exist_ok=True)
+        os.makedirs(self.blobs, exist_ok=True)
+
+    def get(self, url):
+        path = self._response_path(url)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def put(self, url, etag, body, next_url):
+        self._write(self._response_path(url), json.dumps({"url": url, "etag": etag, "body": body, "next": next_url}))
+
+    def get_blob(self, sha):
+        path = os.path.join(self.blobs, sha)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def put_blob(self, sha, text):
+        self._write(os.path.join(self.blobs, sha), text)
+
+    def _response_path(self, url):
+        return os.path.join(self.responses, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _write(self, path, text):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+class GitHubClient:
+    """GitHub REST client with conditional requests and pooled connections.
+
+    Every GET sends the cached ETag as If-None-Match. A 304 is served from the
+    cache and, for authenticated requests, does not count against the rate
+    limit. If a request fails and a cached copy exists, the stale copy is used.
+    """
+
+    def __init__(self, base_url=GITHUB_API_URL, token=None, cache=None, pool_size=DEFAULT_WORKERS):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.cache = cache or ResponseCache()
+        self.pool_size = pool_size
+        self.requests = 0
+        self.not_modified = 0
+        self.blob_cache_hits = 0
+        self.rate_limit_remaining = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def session(self):
+        # one session per thread; each keeps its connections to the API open
+        if not hasattr(self._local, "session"):
+            session = requests.Session()
+            session.mount(self.base_url, HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+            session.headers["Accept"] = "application/vnd.github+json"
+            session.headers["X-GitHub-Api-Version"] = "2022-11-28"
+            if self.token:
+                session.headers["Authorization"] = f"Bearer {self.token}"
+            self._local.session = session
+        return self._local.session
+
+    def get(self, path_or_url, params=None):
+        """Return (JSON body, next page URL or None)."""
+        url = path_or_url if path_or_url.startswith("http") else self.base_url + path_or_url
+        if params:
+            url = requests.Request("GET", url, params=params).prepare().url
+        cached = self.cache.get(url)
+        headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+        try:
+            response = self.session().get(url, headers=headers, timeout=30)
+        except requests.RequestException as e:
+            if cached:
+                print(f"Warning: {url} failed ({e}); using the cached copy")
+                return cached["body"], cached["next"]
+            raise
+        self._count(response)
+        if response.status_code == 304 and cached:
+            with self._lock:
+                self.not_modified += 1
+            return cached["body"], cached["next"]
+        if response.status_code != 200:
+            if cached:
+                print(f"Warning: {url} returned {response.status_code}; using the cached copy")
+                return cached["body"], cached["next"]
+            if response.status_code in (403, 429) and response.headers.get("X-RateLimit-Remaining") == "0":
+                reset = int(response.headers.get("X-RateLimit-Reset", time.time()))
+                raise RuntimeError(f"GitHub rate limit exhausted until {time.strftime('%H:%M:%S', time.localtime(reset))}. Set GITHUB_TOKEN for a higher limit.")
+            response.raise_for_status()
+        body = response.json()
+        next_url = response.links.get("next", {}).get("url")
+        self.cache.put(url, response.headers.get("ETag"), body, next_url)
+        return body, next_url
+
+    def get_pages(self, path, params=None, limit=None):
+        """Items from a paginated listing, following Link headers until `limit` items."""
+        items = []
+        body, next_url = self.get(path, {**(params or {}), "per_page": PAGE_SIZE})
+        items.extend(body)
+        while next_url and (limit is None or len(items) < limit):
+            body, next_url = self.get(next_url)
+            items.extend(body)
+        return items[:limit] if limit is not None else items
+
+    def get_blob(self, repo, sha):
+        text = self.cache.get_blob(sha)
+        if text is not None:
+            with self._lock:
+                self.blob_cache_hits += 1
+            return text
+        response = self.session().get(
+            f"{self.base_url}/repos/{repo}/git/blobs/{sha}",
+            headers={"Accept": "application/vnd.github.raw"},
+            timeout=30
+        )
+        self._count(response)
+        response.raise_for_status()
+        text = response.content.decode("utf-8", errors="replace")
+        self.cache.put_blob(sha, text)
+        return text
+
+    def _count(self, response):
+        with self._lock:
+            self.requests += 1
+            remaining = response.headers.get("X-RateLimit-Remaining")
+            if remaining is not None:
+                self.rate_limit_remaining = int(remaining)
+
+class GitHubScraper:
+    """Fetches repo descriptions, Markdown docs, releases and issues for every configured repo.
+
+    Repos are scraped concurrently, then the doc blobs and issue comments of
+    all repos are fetched concurrently. The output is rewritten as JSONL with
+    one record per document, under IDs that stay the same between runs.
+    ingest.py chunks each record, so unchanged content maps to chunks that are
+    already stored. ingest.py also deletes the chunks of records that are gone
+    from the output, so when a repo or a single doc/issue can't be fetched its
+    records from the previous output are written again unchanged.
+    """
+
+    def __init__(self, config, client=None):
+        self.repos = config.get("repos", DEFAULT_REPOS)
+        self.output_file = config.get("output_file", DEFAULT_OUTPUT_FILE)
+        self.workers = config.get("workers", DEFAULT_WORKERS)
+        self.max_docs = config.get("max_docs", DEFAULT_MAX_DOCS)
+        self.max_releases = config.get("max_releases", DEFAULT_MAX_RELEASES)
+        self.max_issues = config.get("max_issues", DEFAULT_MAX_ISSUES)
+        self.issue_comments = config.get("issue_comments", False)
+        self.client = client or GitHubClient(
+            config.get("api_url", GITHUB_API_URL),
+            config.get("token") or os.environ.get("GITHUB_TOKEN"),
+            ResponseCache(config.get("cache_dir", DEFAULT_CACHE_DIR)),
+            self.workers
+        )
+
+    def run(self):
+        start_time = time.perf_counter()
+        previous = self._previous_records()
+        records = []
+        follow_ups = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._scrape_repo, repo): repo for repo in self.repos}
+            for future in as_completed(futures):
+                try:
+                    repo_records, repo_follow_ups = future.result()
+                except Exception as e:
+                    repo = futures[future]
+                    kept = [record for record in previous.values() if record.get("repo") == repo]
+                    print(f"Error scraping {repo}: {e}; keeping its {len(kept)} records from the last run")
+                    records.extend(kept)
+                    continue
+                records.extend(repo_records)
+                follow_ups.extend(repo_follow_ups)
+            # doc blobs and issue comments of all repos, fetched in parallel
+            futures = {executor.submit(function, *args): args for function, *args in follow_ups}
+            for future in as_completed(futures):
+                try:
+                    records.append(future.result())
+                except Exception as e:
+                    print(f"Error fetching {futures[future][-1].get('path') or futures[future][-1].get('id')}: {e}")
+                    record_id = self._follow_up_id(*futures[future])
+                    if record_id in previous:
+                        records.append(previous[record_id])
+        records.sort(key=lambda record: record["id"])
+        tmp_path = self.output_file + ".tmp"
+        with open(tmp_path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self.output_file)
+        client = self.client
+        print(
+            f"Wrote {len(records)} records for {len(self.repos)} repos to {self.output_file} in {time.perf_counter() - start_time:.1f}s: "
+            f"{client.requests} requests, {client.not_modified} not modified, {client.blob_cache_hits} docs unchanged"
+            + (f", {client.rate_limit_remaining} requests left this hour" if client.rate_limit_remaining is not None else "")
+        )
+        return records
+
+    def _previous_records(self):
+        """{id: record} from the last run's output, or {} when there is none."""
+        previous = {}
+        if not os.path.exists(self.output_file):
+            return previous
+        with open(self.output_file, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                previous[record["id"]] = record
+        return previous
+
+    def _follow_up_id(self, repo, *args):
+        # (branch, tree item) for a doc, (record,) for an issue with comments
+        if len(args) == 2:
+            return f"github:{repo}:doc:{args[1]['path']}"
+        return args[0]["id"]
+
+    def _scrape_repo(self, repo):
+        """Records for one repo, plus follow-up fetches as (function, *args) tuples that each return a record."""
+        info, _ = self.client.get(f"/repos/{repo}")
+        branch = info.get("default_branch", "main")
+        records = [{
+            "type": "repo",
+            "id": f"github:{repo}:repo",
+            "repo": repo,
+            "title": repo,
+            "text": f"{repo}\n{info.get('description') or ''}\nTopics: {', '.join(info.get('topics') or [])}".strip(),
+            "url": info.get("html_url", f"https://github.com/{repo}"),
+            "updated_at": info.get("pushed_at")
+        }]
+
+        tree, _ = self.client.get(f"/repos/{repo}/git/trees/{branch}", {"recursive": 1})
+        docs = [item for item in tree.get("tree", []) if item.get("type") == "blob" and item["path"].lower().endswith(DOC_EXTENSIONS)]
+        if tree.get("truncated"):
+            print(f"Warning: the file tree of {repo} is too large to list completely; some docs may be missing")
+        if len(docs) > self.max_docs:
+            print(f"Warning: {repo} has {len(docs)} Markdown files; keeping the first {self.max_docs}")
+        follow_ups = [(self._doc_record, repo, branch, item) for item in docs[:self.max_docs]]
+
+        if self.max_releases:
+            for release in self.client.get_pages(f"/repos/{repo}/releases", limit=self.max_releases):
+                records.append({
+                    "type": "release",
+                    "id": f"github:{repo}:release:{release['id']}",
+                    "repo": repo,
+                    "tag": release.get("tag_name"),
+                    "title": f"{repo} {release.get('name') or release.get('tag_name')}",
+                    "text": release.get("body") or "",
+                    "url": release.get("html_url"),
+                    "updated_at": release.get("published_at")
+                })
+
+        if self.max_issues:
+            for issue in self.client.get_pages(f"/repos/{repo}/issues", {"state": "all", "sort": "updated", "direction": "desc"}, limit=self.max_issues):
+                # the issues listing includes pull requests
+                if "pull_request" in issue:
+                    continue
+                record = {
+                    "type": "issue",
+                    "id": f"github:{repo}:issue:{issue['number']}",
+                    "repo": repo,
+                    "number": issue["number"],
+                    "state": issue.get("state"),
+                    "labels": [label["name"] for label in issue.get("labels", []) if isinstance(label, dict)],
+                    "title": f"{repo}#{issue['number']}: {issue.get('title', '')}",
+                    "text": issue.get("body") or "",
+                    "url": issue.get("html_url"),
+                    "updated_at": issue.get("updated_at")
+                }
+                if self.issue_comments and issue.get("comments"):
+                    follow_ups.append((self._with_comments, repo, record))
+                else:
+                    records.append(record)
+        return records, follow_ups
+
+    def _doc_record(self, repo, branch, item):
+        return {
+            "type": "doc",
+            "id": f"github:{repo}:doc:{item['path']}",
+            "repo": repo,
+            "path": item["path"],
+            "title": f"{repo}: {item['path']}",
+            "text": self.client.get_blob(repo, item["sha"]),
+            "url": f"https://github.com/{repo}/blob/{branch}/{item['path']}",
+            "sha": item["sha"]
+        }
+
+    def _with_comments(self, repo, record):
+        comments = self.client.get_pages(f"/repos/{repo}/issues/{record['number']}/comments")
+        record["text"] += "".join(f"\n\n{comment.get('body') or ''}" for comment in comments)
+        return record
+
+def main():
+    GitHubScraper(load_config()).run()
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,298 @@
 import praw
 import json
 import sys # For sys.exit
+import os, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Configuration file path
 CONFIG_FILE = "reddit.config.json"
 
-# Load configuration
-try:
-    with open(CONFIG_FILE, 'r') as f:
-        config = json.load(f)
-    
-    # Validate top-level keys
-    if "reddit" not in config or "scrape_config" not in config:
-        print(f"Error: '{CONFIG_FILE}' is missing required top-level keys ('reddit', 'scrape_config').")
-        print(f"Please ensure '{CONFIG_FILE}' follows the structure of 'reddit.config.example.json'.")
-        sys.exit(1)
+# Defaults for the optional scrape_config keys
+DEFAULT_SORT = "top"
+DEFAULT_TIME_FILTER = "all"
+DEFAULT_WORKERS = 4
+# Reddit allows 100 OAuth requests per minute per client; stay under it
+DEFAULT_REQUESTS_PER_MINUTE = 90
+# "Load more comments" expansions per post, one request each
+DEFAULT_REPLACE_MORE_LIMIT = 8
+# Newest subreddit comments checked for replies to already-scraped posts
+DEFAULT_COMMENT_LIMIT = 500
+DEFAULT_CHECKPOINT_FILE = "reddit_checkpoint.json"
+# Listings return up to 100 items per request
+LISTING_PAGE_SIZE = 100
+# The checkpoint is rewritten after this many finished posts, so an interrupted run can resume
+CHECKPOINT_EVERY = 10
 
-    # Validate Reddit API credentials keys
-    reddit_config = config["reddit"]
-    required_reddit_keys = ["client_id", "client_secret", "user_agent"]
-    if not all(key in reddit_config for key in required_reddit_keys):
-        print(f"Error: 'reddit' section in '{CONFIG_FILE}' is missing one or more required keys: {required_reddit_keys}.")
-        sys.exit(1)
+def load_config(config_file=CONFIG_FILE):
+    try:
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+
+        # Validate top-level keys
+        if "reddit" not in config or "scrape_config" not in config:
+            print(f"Error: '{config_file}' is missing required top-level keys ('reddit', 'scrape_config').")
+            print(f"Please ensure '{config_file}' follows the structure of 'reddit.config.example.json'.")
+            sys.exit(1)
+
+        # Validate Reddit API credentials keys
+        reddit_config = config["reddit"]
+        required_reddit_keys = ["client_id", "client_secret", "user_agent"]
+        if not all(key in reddit_config for key in required_reddit_keys):
+            print(f"Error: 'reddit' section in '{config_file}' is missing one or more required keys: {required_reddit_keys}.")
+            sys.exit(1)
 
-    # Validate Scrape configuration keys
-    scrape_config = config["scrape_config"]
-    required_scrape_keys = ["subreddit", "post_limit", "output_file"]
-    if not all(key in scrape_config for key in required_scrape_keys):
-        print(f"Error: 'scrape_config' section in '{CONFIG_FILE}' is missing one or more required keys: {required_scrape_keys}.")
+        # Validate Scrape configuration keys
+        scrape_config = config["scrape_config"]
+        required_scrape_keys = ["subreddit", "post_limit", "output_file"]
+        if not all(key in scrape_config for key in required_scrape_keys):
+            print(f"Error: 'scrape_config' section in '{config_file}' is missing one or more required keys: {required_scrape_keys}.")
+            sys.exit(1)
+
+    except FileNotFoundError:
+        print(f"Error: Configuration file '{config_file}' not found.")
+        print(f"Please create it by copying 'reddit.config.example.json' to '{config_file}'")
+        print("and fill in your Reddit API credentials and desired scraping parameters.")
+        sys.exit(1)
+    except json.JSONDecodeError:
+        print(f"Error: Could not decode JSON from '{config_file}'. Please check its syntax.")
         sys.exit(1)
+    except Exception as e: # Catch any other unexpected errors during config loading
+        print(f"An unexpected error occurred while loading the configuration: {e}")
+        sys.exit(1)
+    return reddit_config, scrape_config
+
+def id_value(reddit_id):
+    """Reddit IDs are base-36 counters, so newer posts and comments have larger values."""
+    return int(reddit_id, 36) if reddit_id else -1
+
+class RateBudget:
+    """Token bucket shared by all worker threads: at most `requests_per_minute`, with bursts of up to `burst`."""
+
+    def __init__(self, requests_per_minute, burst=10):
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.requests = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Checkpoint:
+    """Newest post and comment IDs already written, per subreddit, plus posts finished in an interrupted run
+    and posts whose comment tree failed to download (retried on the next run)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+
+    def for_subreddit(self, name):
+        return self.data.setdefault(name.lower(), {"last_post_id": None, "last_comment_id": None, "completed_posts": [], "failed_posts": []})
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+def author_name(item):
+    return item.author.name if getattr(item, "author", None) is not None else None
+
+def post_record(post, subreddit_name):
+    return {
+        "type": "post",
+        "id": post.id,
+        "subreddit": subreddit_name,
+        "title": post.title,
+        "text": post.selftext,
+        "author": author_name(post),
+        "score": post.score,
+        "num_comments": post.num_comments,
+        "created_utc": post.created_utc,
+        "url": post.url,
+        "permalink": post.permalink
+    }
+
+def comment_record(comment, post_id, subreddit_name):
+    return {
+        "type": "comment",
+        "id": comment.id,
+        "subreddit": subreddit_name,
+        "post_id": post_id,
+        "parent_id": comment.parent_id,
+        "text": comment.body,
+        "author": author_name(comment),
+        "score": comment.score,
+        "created_utc": comment.created_utc,
+        "permalink": comment.permalink
+    }
+
+class RedditScraper:
+    """Incremental, concurrent scraper that appends posts and comments to a JSONL file.
+
+    A run lists new posts (plus the configured `top`/`new` listing the first
+    time) and fetches each post's comment tree on a worker thread. Records are
+    appended to the output file as each tree arrives. A post whose tree can't
+    be fetched is kept in the checkpoint and retried on the next run. Comments
+    added since the last run to posts not fetched in this run come from the
+    subreddit's comment listing, read back to the last-seen comment ID.
+
+    Every API request first takes a token from a shared `RateBudget`. Each
+    worker thread gets its own client from `reddit_factory`, because PRAW
+    objects are not thread-safe. `fake_reddit.FakeReddit(...).client` can
+    stand in for `praw.Reddit`.
+    """
+
+    def __init__(self, reddit_factory, scrape_config):
+        self.reddit_factory = reddit_factory
+        self.subreddit_name = scrape_config["subreddit"]
+        self.post_limit = scrape_config["post_limit"]
+        self.output_file = scrape_config["output_file"]
+        if not self.output_file.endswith(".jsonl"):
+            # ingest.py reads scraper records only from .jsonl files
+            self.output_file = os.path.splitext(self.output_file)[0] + ".jsonl"
+            print(f"Writing records to '{self.output_file}' (JSONL) instead of '{scrape_config['output_file']}'")
+        self.sort = scrape_config.get("sort", DEFAULT_SORT)
+        self.time_filter = scrape_config.get("time_filter", DEFAULT_TIME_FILTER)
+        self.workers = scrape_config.get("workers", DEFAULT_WORKERS)
+        self.replace_more_limit = scrape_config.get("replace_more_limit", DEFAULT_REPLACE_MORE_LIMIT)
+        self.comment_limit = scrape_config.get("comment_limit", DEFAULT_COMMENT_LIMIT)
+        self.budget = RateBudget(scrape_config.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE))
+        self.checkpoint = Checkpoint(scrape_config.get("checkpoint_file", DEFAULT_CHECKPOINT_FILE))
+        self._local = threading.local()
+
+    def client(self):
+        if not hasattr(self._local, "reddit"):
+            self._local.reddit = self.reddit_factory()
+        return self._local.reddit
+
+    def run(self):
+        state = self.checkpoint.for_subreddit(self.subreddit_name)
+        subreddit = self.client().subreddit(self.subreddit_name)
+        completed = set(state["completed_posts"])
+        new_posts = [post.id for post in self._new_posts(subreddit, state)]
+        retries = [post_id for post_id in state["failed_posts"] if post_id not in completed and post_id not in new_posts]
+        post_ids = [post_id for post_id in new_posts if post_id not in completed] + retries
+        print(f"Fetching comment trees for {len(post_ids)} posts in r/{self.subreddit_name} ({len(retries)} retried from the last run)")
+        written_comments = set()
+        failed = []
+        newest_post = state["last_post_id"]
+        newest_comment = state["last_comment_id"]
+        records = 0
+        with open(self.output_file, 'a') as out, ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._fetch_thread, post_id): post_id for post_id in post_ids}
+            for future in as_completed(futures):
+                post_id = futures[future]
+                try:
+                    post, comments = future.result()
+                except Exception as e:
+                    print(f"Error fetching comments for post {post_id}, will retry next run: {e}")
+                    failed.append(post_id)
+                    continue
+                lines = [post] + comments
+                out.write("".join(json.dumps(record) + "\n" for record in lines))
+                out.flush()
+                records += len(lines)
+                written_comments.update(record["id"] for record in comments)
+                newest_comment = max([newest_comment] + [record["id"] for record in comments], key=id_value)
+                state["completed_posts"].append(post_id)
+                if len(state["completed_posts"]) % CHECKPOINT_EVERY == 0:
+                    self.checkpoint.save()
+            # failed posts are remembered below, so the checkpoint can move past them
+            newest_post = max([newest_post] + new_posts, key=id_value)
+
+            # new comments on posts whose tree wasn't fetched in this run: posts scraped in earlier
+            # runs (including by an interrupted run), and posts never scraped (older than the first
+            # run's listing). Comments on posts that failed come with their tree when the post is
+            # retried. A comment an interrupted run already wrote may be written again;
+            # ingest.py keeps one record per ID.
+            tree_posts = set(post_ids)
+            for comment in self._new_comments(subreddit, state):
+                newest_comment = max(newest_comment, comment.id, key=id_value)
+                post_id = comment.link_id.split("_", 1)[-1]
+                if post_id in tree_posts or comment.id in written_comments:
+                    continue
+                out.write(json.dumps(comment_record(comment, post_id, self.subreddit_name)) + "\n")
+                records += 1
+
+        state["last_post_id"] = newest_post
+        state["last_comment_id"] = newest_comment
+        state["completed_posts"] = []
+        state["failed_posts"] = failed
+        self.checkpoint.save()
+        print(f"Wrote {records} records to {self.output_file} using {self.budget.requests} API requests")
+        if failed:
+            print(f"{len(failed)} posts failed and will be retried on the next run: {', '.join(failed)}")
+        return records
+
+    def _new_posts(self, subreddit, state):
+        """Posts newer than the checkpoint; on the first run also the configured listing."""
+        posts = {}
+        if state["last_post_id"] is None:
+            listing = subreddit.top(time_filter=self.time_filter, limit=self.post_limit) if self.sort == "top" else subreddit.new(limit=self.post_limit)
+            for post in self._paged(listing):
+                posts[post.id] = post
+        for post in self._paged(subreddit.new(limit=self.post_limit)):
+            if id_value(post.id) <= id_value(state["last_post_id"]):
+                break
+            posts.setdefault(post.id, post)
+        return list(posts.values())
+
+    def _new_comments(self, subreddit, state):
+        if state["last_comment_id"] is None:
+            return
+        for comment in self._paged(subreddit.comments(limit=self.comment_limit)):
+            if id_value(comment.id) <= id_value(state["last_comment_id"]):
+                break
+            yield comment
+
+    def _paged(self, listing):
+        """Iterate a lazy listing, taking a budget token for every page it loads."""
+        for i, item in enumerate(self._with_first_token(listing)):
+            if i and i % LISTING_PAGE_SIZE == 0:
+                self.budget.acquire()
+            yield item
+
+    def _with_first_token(self, listing):
+        self.budget.acquire()
+        yield from listing
+
+    def _fetch_thread(self, post_id):
+        """(post record, comment records) for one post, with up to `replace_more_limit` "load more" expansions."""
+        self.budget.acquire()
+        submission = self.client().submission(id=post_id)
+        forest = submission.comments
+        for _ in range(self.replace_more_limit):
+            self.budget.acquire()
+            if not forest.replace_more(limit=1):
+                break
+        forest.replace_more(limit=0)
+        comments = [comment_record(comment, post_id, self.subreddit_name) for comment in forest.list() if hasattr(comment, 'body')]
+        # the submission was loaded together with its comments, so this makes no further request
+        return post_record(submission, self.subreddit_name), comments
+
+def main():
+    reddit_config, scrape_config = load_config()
+    reddit_factory = lambda: praw.Reddit(
+        client_id=reddit_config["client_id"],
+        client_secret=reddit_config["client_secret"],
+        user_agent=reddit_config["user_agent"]
+    )
+    RedditScraper(reddit_factory, scrape_config).run()
 
-except FileNotFoundError:
-    print(f"Error: Configuration file '{CONFIG_FILE}' not found.")
-    print(f"Please create it by copying 'reddit.config.example.json' to '{CONFIG_FILE}'")
-    print("and fill in your Reddit API credentials and desired scraping parameters.")
-    sys.exit(1)
-except json.JSONDecodeError:
-    print(f"Error: Could not decode JSON from '{CONFIG_FILE}'. Please check its syntax.")
-    sys.exit(1)
-except Exception as e: # Catch any other unexpected errors during config loading
-    print(f"An unexpected error occurred while loading the configuration: {e}")
-    sys.exit(1)
-
-
-reddit = praw.Reddit(
-    client_id=reddit_config["client_id"],
-    client_secret=reddit_config["client_secret"],
-    user_agent=reddit_config["user_agent"]
-)
-subreddit = reddit.subreddit(scrape_config["subreddit"])
-with open(scrape_config["output_file"], "w") as f:
-    for post in subreddit.top(limit=scrape_config["post_limit"]):
-        f.write(f"{post.title}\n{post.selftext}\n")
-        for comment in post.comments:
-            if hasattr(comment, 'body'):
-                f.write(f"{comment.body}\n")
+if __name__ == "__main__":
+    main()
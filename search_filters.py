@@ -0,0 +1,137 @@
+from datetime import date, datetime, timedelta, timezone
+import numpy as np
+import json
+
+# Values of the `source_type` metadata: chunks written by ingest.py and ingest-pdf.py, and web_search.py results
+SOURCE_TYPES = ("reddit", "github", "pdf", "web")
+
+def to_timestamp(value):
+    """Epoch seconds for a Reddit `created_utc`, an ISO 8601 string (GitHub) or a date; None if missing."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    elif isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp()
+
+def to_date(value):
+    if value is None or value == "" or isinstance(value, date):
+        return value or None
+    return date.fromisoformat(value)
+
+class SearchFilters:
+    """Restrictions on which chunks a search may return, as a Chroma `where` clause.
+
+    Chroma applies the clause before the similarity search, so a narrow filter
+    shrinks the candidate set instead of discarding results afterwards. Repos
+    and subreddits together mean "from any of these". Date and score conditions
+    only match chunks that carry a `timestamp` / `score`: Reddit threads have
+    both, GitHub repos, releases and issues only a timestamp, docs and PDFs
+    neither. Dates are UTC days and `end_date` is inclusive.
+    """
+
+    def __init__(self, sources=None, repos=None, subreddits=None, start_date=None, end_date=None, min_score=None):
+        self.sources = sorted(sources or [])
+        self.repos = sorted(repos or [])
+        self.subreddits = sorted(subreddits or [])
+        self.start_date = to_date(start_date)
+        self.end_date = to_date(end_date)
+        self.min_score = min_score
+
+    @classmethod
+    def from_dict(cls, data):
+        """Filters from a JSON-style dict (dates as "YYYY-MM-DD"); None or {} means no filtering."""
+        return cls(**(data or {}))
+
+    def to_dict(self):
+        return {
+            "sources": self.sources,
+            "repos": self.repos,
+            "subreddits": self.subreddits,
+            "start_date": self.start_date.isoformat() if self.start_date else None,
+            "end_date": self.end_date.isoformat() if self.end_date else None,
+            "min_score": self.min_score
+        }
+
+    def is_empty(self):
+        return not (self.sources or self.repos or self.subreddits or self.start_date or self.end_date or self.min_score is not None)
+
+    def key(self):
+        """Stable string identifying these filters; "" when there are none."""
+        return "" if self.is_empty() else json.dumps(self.to_dict(), sort_keys=True)
+
+    def excludes(self, source_types):
+        """True if no chunk of a collection holding only `source_types` can match."""
+        return bool(self.sources and source_types and not set(source_types) & set(self.sources))
+
+    def allows_source(self, source_type):
+        """True if results of `source_type` that carry no other metadata (web results) can pass."""
+        return (not self.sources or source_type in self.sources) and not (
+            self.repos or self.subreddits or self.start_date or self.end_date or self.min_score is not None
+        )
+
+    def to_where(self, source_types=None):
+        """The Chroma `where` clause for a collection holding `source_types`, or None to search everything.
+
+        The source condition is left out when every source type in the
+        collection is selected, so chunks ingested before `source_type` existed
+        still match.
+        """
+        conditions = []
+        if self.sources and not (source_types and set(source_types) <= set(self.sources)):
+            conditions.append({"source_type": {"$in": self.sources}})
+        origins = []
+        if self.repos:
+            origins.append({"repo": {"$in": self.repos}})
+        if self.subreddits:
+            origins.append({"subreddit": {"$in": self.subreddits}})
+        if origins:
+            conditions.append(origins[0] if len(origins) == 1 else {"$or": origins})
+        if self.start_date:
+            conditions.append({"timestamp": {"$gte": to_timestamp(self.start_date)}})
+        if self.end_date:
+            conditions.append({"timestamp": {"$lt": to_timestamp(self.end_date + timedelta(days=1))}})
+        if self.min_score is not None:
+            conditions.append({"score": {"$gte": self.min_score}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def to_mask(self, columns, vocabularies, source_types=None):
+        """The `to_where` conditions as a boolean mask over rows of metadata columns (mmap_index.py).
+
+        `columns` maps "source_type", "repo" and "subreddit" to integer codes
+        into `vocabularies[field]` (-1 where missing), and "timestamp" and
+        "score" to floats (NaN where missing). Returns None when every row matches.
+        """
+        mask = None
+
+        def restrict(condition):
+            nonlocal mask
+            mask = condition if mask is None else mask & condition
+
+        def one_of(field, values):
+            codes = [code for code, value in enumerate(vocabularies[field]) if value in values]
+            return np.isin(columns[field], codes)
+
+        if self.sources and not (source_types and set(source_types) <= set(self.sources)):
+            restrict(one_of("source_type", self.sources))
+        origins = None
+        if self.repos:
+            origins = one_of("repo", self.repos)
+        if self.subreddits:
+            subreddits = one_of("subreddit", self.subreddits)
+            origins = subreddits if origins is None else origins | subreddits
+        if origins is not None:
+            restrict(origins)
+        # comparisons with NaN are False, so rows without the field never match, as in Chroma
+        if self.start_date:
+            restrict(np.asarray(columns["timestamp"]) >= to_timestamp(self.start_date))
+        if self.end_date:
+            restrict(np.asarray(columns["timestamp"]) < to_timestamp(self.end_date + timedelta(days=1)))
+        if self.min_score is not None:
+            restrict(np.asarray(columns["score"]) >= self.min_score)
+        return mask
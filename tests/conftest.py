@@ -0,0 +1,21 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ollama import FakeOllama
+import pytest
+
+# converse.py and the ollama client read OLLAMA_HOST when they are imported, so the fake server
+# is started before any test module imports them
+_fake_ollama = FakeOllama(port=0, token_delay=0.0, first_token_delay=0.0).start()
+os.environ["OLLAMA_HOST"] = _fake_ollama.url
+
+@pytest.fixture(scope="session")
+def fake_ollama():
+    return _fake_ollama
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory: the modules keep db.json, config.json, caches and logs relative to it."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
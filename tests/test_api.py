@@ -0,0 +1,151 @@
+from concurrent.futures import Future
+import json, os
+
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from starlette.requests import ClientDisconnect
+from tinydb import TinyDB
+import pytest
+
+MODEL = "llama3:8b"
+FAST_MODEL = "qwen2.5:1.5b"
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+    def embed_documents(self, texts):
+        return [[1.0, float(i)] for i in range(len(texts))]
+
+class FakeRetrievalService:
+    """Stands in for `retrieval.RetrievalService`: two chunks for every question, no Chroma."""
+
+    generation = 0
+
+    def __init__(self):
+        self.embedding_function = FakeEmbeddings()
+        self.vectorstore = None
+        self.retriever = object()
+        self.queries = []
+
+    def retrieve_with_embedding(self, query, filters=None):
+        self.queries.append(query)
+        docs = [
+            Document(page_content=f"Custom modes are defined in .roomodes ({source})", metadata={"source_type": source, "collection": "reddit_github"})
+            for source in ("reddit", "github")
+        ]
+        if filters is not None:
+            docs = [doc for doc in docs if filters.allows_source(doc.metadata["source_type"])]
+        return docs, self.embedding_function.embed_query(query)
+
+    def document_vectors(self, docs):
+        return {}
+
+    def filter_options(self):
+        return {"sources": ["github", "reddit"], "repos": ["RooVetGit/Roo-Code"], "subreddits": ["RooCode"]}
+
+    def embedding_stats(self):
+        return {}
+
+@pytest.fixture(scope="module")
+def service():
+    return FakeRetrievalService()
+
+@pytest.fixture(scope="module")
+def client(service, tmp_path_factory):
+    # one client for the module: the shared OllamaLLM clients bind to the first event loop they run on
+    directory = tmp_path_factory.mktemp("api")
+    previous = os.getcwd()
+    os.chdir(directory)
+    with TinyDB("db.json") as db:
+        db.table("agent").insert({"model": MODEL, "system_message": "You are a helpful assistant.", "user_name": "User", "agent_name": "Assistant"})
+    import api
+    future = Future()
+    future.set_result(service)
+    try:
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(api, "warm_up_in_background", lambda model=None: future)
+            with TestClient(api.app) as client:
+                yield client
+    finally:
+        os.chdir(previous)
+
+def test_health(client):
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+
+def test_filters(client):
+    assert client.get("/filters").json()["repos"] == ["RooVetGit/Roo-Code"]
+
+def test_retrieve(client, service):
+    response = client.post("/retrieve", json={"question": "How do custom modes work?"})
+    assert response.status_code == 200
+    assert len(response.json()["documents"]) == 2
+    assert service.queries[-1] == "How do custom modes work?"
+
+def test_retrieve_with_filters(client):
+    response = client.post("/retrieve", json={"question": "custom modes", "filters": {"sources": ["github"]}})
+    documents = response.json()["documents"]
+    assert [document["metadata"]["source_type"] for document in documents] == ["github"]
+
+def test_answer(client, fake_ollama):
+    response = client.post("/answer", json={"question": "Where are custom modes defined?", "use_cache": False})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["model"] == MODEL
+    # the fake model answers with its name and the prompt's last words
+    assert body["answer"].startswith(f"[{MODEL}]")
+    assert "defined?" in body["answer"]
+    assert body["cached"] is False
+    assert len(body["documents"]) == 2
+
+def test_answer_is_cached(client, fake_ollama):
+    question = {"question": "Which file holds the custom modes?"}
+    first = client.post("/answer", json=question).json()
+    requests = fake_ollama.requests
+    second = client.post("/answer", json=question).json()
+    assert second["cached"] is True
+    assert second["answer"] == first["answer"]
+    assert fake_ollama.requests == requests
+
+def test_answer_with_model(client):
+    body = client.post("/answer", json={"question": "Summarise custom modes", "model": FAST_MODEL, "use_cache": False}).json()
+    assert body["model"] == FAST_MODEL
+    assert body["answer"].startswith(f"[{FAST_MODEL}]")
+
+def test_answer_stream(client):
+    with client.stream("POST", "/answer/stream", json={"question": "Stream the answer about custom modes", "use_cache": False}) as response:
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+    assert len(lines[0]["documents"]) == 2
+    tokens = [line["token"] for line in lines[1:-1]]
+    assert "".join(tokens).startswith(f"[{MODEL}]")
+    assert lines[-1]["done"] is True
+    assert lines[-1]["model"] == MODEL
+
+def test_stream_slot_is_released_when_the_client_leaves_before_the_body(client):
+    import api
+
+    async def disconnect_before_body():
+        response = await api.answer_stream(api.AnswerRequest(question="Leave before the answer", use_cache=False))
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("client disconnected")
+
+        try:
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        except ClientDisconnect:
+            pass
+
+    client.portal.call(disconnect_before_body)
+    assert api.model_limiter.stats()[MODEL]["running"] == 0
+
+def test_models(client, fake_ollama):
+    client.post("/answer", json={"question": "Load the model", "use_cache": False})
+    body = client.get("/models").json()
+    assert set(body["models"]) == set(fake_ollama.models)
+    assert MODEL in body["resident"]
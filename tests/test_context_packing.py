@@ -0,0 +1,36 @@
+from context_packing import MIN_PARTIAL_TOKENS, ModelLimits, context_budget, pack_context
+from langchain_core.documents import Document
+
+LIMITS = ModelLimits(num_ctx=2048, chars_per_token=4.0)
+
+def docs(*texts):
+    return [Document(page_content=text, metadata={"source_type": "github"}) for text in texts]
+
+def words(count, word="mode"):
+    return " ".join(f"{word}{i}" for i in range(count))
+
+def test_chunks_that_fit_are_kept_in_order():
+    packed = pack_context("custom modes", docs("first chunk", "second chunk"), LIMITS, 100)
+    assert packed.text == "first chunk\n---\nsecond chunk"
+    assert len(packed.docs) == 2
+
+def test_duplicates_are_dropped():
+    packed = pack_context("custom modes", docs("Custom modes live in .roomodes", "custom  modes live in .roomodes", "modes live"), LIMITS, 100)
+    assert packed.text == "Custom modes live in .roomodes"
+
+def test_last_chunk_is_cut_to_the_budget():
+    packed = pack_context("custom modes", docs(words(50), words(400, "slug")), LIMITS, 300)
+    assert packed.text.endswith(" …")
+    assert packed.tokens <= 300
+    assert len(packed.docs) == 2
+
+def test_exhausted_budget_keeps_the_top_chunk():
+    budget = context_budget(LIMITS, "You are a helpful assistant.", words(2000))
+    assert budget == 0
+    packed = pack_context("custom modes", docs(words(400), words(400, "slug")), LIMITS, budget)
+    assert packed.text.startswith("mode0 mode1")
+    assert 0 < packed.tokens <= MIN_PARTIAL_TOKENS + 1
+    assert len(packed.docs) == 1
+
+def test_no_documents_give_an_empty_context():
+    assert pack_context("custom modes", [], LIMITS, 0).text == ""
@@ -0,0 +1,36 @@
+from embedding_batcher import BatchingEmbeddings
+import pytest
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+def test_queries_get_their_own_vectors():
+    embeddings = BatchingEmbeddings(FakeEmbeddings())
+    futures = [embeddings.submit("x" * i) for i in range(1, 20)]
+    assert [future.result(timeout=5) for future in futures] == [[float(i), 1.0] for i in range(1, 20)]
+    assert embeddings.stats()["requests"] == 19
+
+def test_short_result_fails_every_query_in_the_batch():
+    embeddings = BatchingEmbeddings(FakeEmbeddings(), embed_queries=lambda texts: [[0.0, 1.0]] * (len(texts) - 1))
+    futures = [embeddings.submit(f"query {i}") for i in range(10)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+
+def test_model_error_fails_the_batch_and_the_worker_keeps_going():
+    calls = []
+
+    def embed_queries(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("model failed")
+        return [[1.0] for _ in texts]
+
+    embeddings = BatchingEmbeddings(FakeEmbeddings(), embed_queries=embed_queries)
+    with pytest.raises(RuntimeError):
+        embeddings.embed_query("first")
+    assert embeddings.embed_query("second") == [1.0]
@@ -0,0 +1,83 @@
+from embedding_cache import CachedEmbeddings
+import embedding_cache
+import pytest
+
+class FakeEmbeddings:
+    model_name = "fake/embeddings"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), float(sum(map(ord, text))), 1.0, 0.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1.0
+        return self.now
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # least recently used is decided by the time of the last lookup, so every call gets its own tick
+    clock = Clock()
+    monkeypatch.setattr(embedding_cache, "time", clock)
+    return clock
+
+def cache(workdir, model, **limits):
+    return CachedEmbeddings(model, cache_dir=str(workdir / "embedding_cache"), **limits)
+
+def test_only_missing_texts_reach_the_model(workdir):
+    model = FakeEmbeddings()
+    embeddings = cache(workdir, model)
+    first = embeddings.embed_documents(["custom modes", "mcp servers"])
+    # whitespace differences share an entry
+    second = embeddings.embed_documents(["custom  modes ", "mcp servers", "slash commands"])
+    assert second[:2] == first
+    assert model.embedded == ["custom modes", "mcp servers", "slash commands"]
+    assert embeddings.stats()["hits"] == 2
+    assert embeddings.stats()["misses"] == 3
+
+def test_vectors_persist_across_instances(workdir):
+    vectors = cache(workdir, FakeEmbeddings()).embed_documents(["custom modes"])
+    model = FakeEmbeddings()
+    assert cache(workdir, model).embed_documents(["custom modes"]) == vectors
+    assert model.embedded == []
+
+def test_queries_are_not_cached(workdir):
+    model = FakeEmbeddings()
+    embeddings = cache(workdir, model)
+    embeddings.embed_query("custom modes")
+    embeddings.embed_query("custom modes")
+    assert model.embedded == ["custom modes"] * 2
+    assert embeddings.stats()["entries"] == 0
+
+def test_least_recently_used_entry_is_evicted(workdir):
+    model = FakeEmbeddings()
+    embeddings = cache(workdir, model, max_entries=3)
+    for text in ("a", "b", "c"):
+        embeddings.embed_documents([text])
+    embeddings.embed_documents(["a"])
+    embeddings.embed_documents(["d"])
+    assert embeddings.stats()["entries"] == 3
+    model.embedded.clear()
+    embeddings.embed_documents(["a", "c", "d"])
+    assert model.embedded == []
+    assert embeddings.embed_documents(["b"]) == FakeEmbeddings().embed_documents(["b"])
+    assert model.embedded == ["b"]
+
+def test_byte_limit_caps_the_rows(workdir):
+    model = FakeEmbeddings()
+    # two 4-dimensional float32 vectors
+    embeddings = cache(workdir, model, max_bytes=32)
+    embeddings.embed_documents(["a", "b", "c"])
+    assert embeddings.stats()["entries"] == 2
+    model.embedded.clear()
+    embeddings.embed_documents(["b", "c"])
+    assert model.embedded == []
@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor
+import json, os
+
+from index_generation import bump_generation, read_generation
+
+def bump_many(path, collection, times):
+    for _ in range(times):
+        bump_generation(path, collection)
+
+def test_bumps_count_overall_and_per_collection(workdir):
+    path = str(workdir / "index_generation.json")
+    assert read_generation(path) == 0
+    bump_generation(path, "pdfs")
+    bump_generation(path, "reddit_github")
+    bump_generation(path)
+    assert read_generation(path) == 3
+    assert read_generation(path, "pdfs") == read_generation(path, "reddit_github") == 1
+    assert read_generation(path, "web") == 0
+
+def test_rewrite_with_the_same_mtime_is_read_again(workdir):
+    path = str(workdir / "index_generation.json")
+    bump_generation(path, "pdfs")
+    assert read_generation(path) == 1
+    stat = os.stat(path)
+    with open(path, "w") as fp:
+        json.dump({"generation": 12, "collections": {"pdfs": 12}}, fp)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert read_generation(path) == 12
+
+def test_concurrent_ingests_keep_every_bump(workdir):
+    path = str(workdir / "index_generation.json")
+    with ProcessPoolExecutor(4) as pool:
+        for future in [pool.submit(bump_many, path, collection, 50) for collection in ("pdfs", "reddit_github") * 2]:
+            future.result()
+    assert read_generation(path) == 200
+    assert read_generation(path, "pdfs") == read_generation(path, "reddit_github") == 100
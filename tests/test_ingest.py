@@ -0,0 +1,96 @@
+import hashlib, json
+
+import pytest
+
+pytest.importorskip("langchain_chroma")
+pytest.importorskip("langchain_huggingface")
+pytest.importorskip("langchain.text_splitter")
+
+from langchain_core.embeddings import Embeddings
+from lexical_index import LexicalIndex
+import ingest
+
+class FakeEmbeddings(Embeddings):
+    """Stands in for the sentence-transformers model: a vector from the text's hash, and a count of texts embedded."""
+
+    embedded = 0
+
+    def __init__(self, model_name=None):
+        self.model_name = "fake-embeddings"
+
+    def embed_documents(self, texts):
+        FakeEmbeddings.embedded += len(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255.0 for byte in digest[:8]]
+
+def post(post_id, title, score=1):
+    return {"type": "post", "id": post_id, "subreddit": "RooCode", "title": title, "text": f"{title} body", "score": score, "created_utc": 1700000000.0, "permalink": f"/r/RooCode/comments/{post_id}"}
+
+def comment(comment_id, post_id, text):
+    return {"type": "comment", "id": comment_id, "subreddit": "RooCode", "post_id": post_id, "text": text, "created_utc": 1700000100.0}
+
+def github_record(record_id, text, updated_at="2024-05-01T00:00:00Z"):
+    return {"type": "doc", "id": record_id, "repo": "example/repo", "title": record_id, "text": text, "url": "", "updated_at": updated_at}
+
+def write_jsonl(path, records, mode="w"):
+    with open(path, mode) as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+@pytest.fixture
+def sources(workdir, monkeypatch):
+    monkeypatch.setattr(ingest, "HuggingFaceEmbeddings", FakeEmbeddings)
+    write_jsonl(workdir / "reddit_data.jsonl", [post("a1", "Custom modes"), comment("c1", "a1", "Put them in .roomodes"), post("a2", "MCP servers")])
+    write_jsonl(workdir / "github_data.jsonl", [github_record("github:doc:modes", "Modes are defined per project."), github_record("github:doc:mcp", "MCP servers are configured globally.")])
+    return workdir
+
+def run(workdir):
+    return ingest.ingest(
+        files=[str(workdir / "reddit_data.jsonl"), str(workdir / "github_data.jsonl")],
+        persist_directory=str(workdir / "chroma_db"),
+        lexical_index_path=str(workdir / "lexical_index.npz")
+    )
+
+def test_index_records_groups_threads_and_keeps_the_latest_copy(workdir):
+    path = workdir / "reddit_data.jsonl"
+    write_jsonl(path, [post("a1", "First"), comment("c1", "a1", "Reply"), github_record("r1", "Doc")])
+    write_jsonl(path, [post("a1", "First, edited")], mode="a")
+    with open(path, "a") as f:
+        f.write('{"type": "comment", "id": "c2"')
+    groups = ingest.index_records(str(path))
+    assert set(groups) == {("thread", "a1"), ("record", "r1")}
+    assert len(groups[("thread", "a1")]) == 2
+    documents = list(ingest.iter_jsonl_documents(str(path)))
+    assert documents[0].page_content == "First, edited\nFirst, edited body\nReply"
+
+def test_first_ingest_adds_every_chunk(sources):
+    summary = run(sources)
+    assert summary == {"added": 4, "updated": 0, "unchanged": 0, "removed": 0}
+    assert len(LexicalIndex(str(sources / "lexical_index.npz"))) == 4
+
+def test_unchanged_sources_embed_nothing(sources):
+    run(sources)
+    embedded = FakeEmbeddings.embedded
+    assert run(sources) == {"added": 0, "updated": 0, "unchanged": 4, "removed": 0}
+    assert FakeEmbeddings.embedded == embedded
+
+def test_new_comment_replaces_its_thread_chunk(sources):
+    run(sources)
+    write_jsonl(sources / "reddit_data.jsonl", [comment("c2", "a1", "Or in custom_modes.json")], mode="a")
+    assert run(sources) == {"added": 1, "updated": 0, "unchanged": 3, "removed": 1}
+
+def test_changed_metadata_is_updated_without_embedding(sources):
+    run(sources)
+    embedded = FakeEmbeddings.embedded
+    write_jsonl(sources / "reddit_data.jsonl", [post("a2", "MCP servers", score=40)], mode="a")
+    assert run(sources) == {"added": 0, "updated": 1, "unchanged": 3, "removed": 0}
+    assert FakeEmbeddings.embedded == embedded
+
+def test_removed_record_is_deleted_from_both_indexes(sources):
+    run(sources)
+    write_jsonl(sources / "github_data.jsonl", [github_record("github:doc:modes", "Modes are defined per project.")])
+    assert run(sources) == {"added": 0, "updated": 0, "unchanged": 3, "removed": 1}
+    assert len(LexicalIndex(str(sources / "lexical_index.npz"))) == 3
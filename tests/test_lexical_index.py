@@ -0,0 +1,75 @@
+from lexical_index import LexicalIndex, tokenize
+import numpy as np
+import pytest
+
+CHUNKS = {
+    "modes": "Custom modes are defined in .roomodes or custom_modes.json",
+    "ollama": "Error: ECONNREFUSED 127.0.0.1:11434 means ollama serve is not running",
+    "mcp": "MCP servers are configured in mcp_settings.json",
+    "slash": "Slash commands live in .roo/commands",
+    "models": "Pick a model per mode with the model selector"
+}
+
+def build(path, chunks=CHUNKS):
+    index = LexicalIndex(str(path))
+    index.add(list(chunks), list(chunks.values()))
+    index.save()
+    return index
+
+def ids(results):
+    return [chunk_id for chunk_id, _ in results]
+
+def test_identifiers_are_kept_whole_and_split():
+    assert tokenize("Edit custom_modes.json") == ["edit", "custom_modes.json", "custom_modes", "json"]
+
+def test_exact_identifier_ranks_first(workdir):
+    index = build(workdir / "index.npz")
+    assert ids(index.search("ECONNREFUSED on 127.0.0.1:11434", k=1)) == ["ollama"]
+    assert ids(index.search("where is mcp_settings.json"))[0] == "mcp"
+    assert index.search("nothing matches this") == []
+
+def test_postings_are_delta_encoded_and_restored_on_load(workdir):
+    path = workdir / "index.npz"
+    index = build(path, {f"chunk-{i}": f"shared term{i % 3}" for i in range(40)})
+    with np.load(path) as data:
+        deltas = data["postings_deltas"]
+        offsets = data["offsets"]
+    # every term's first posting is a doc number and the rest are gaps
+    assert np.array_equal(deltas[offsets[:-1]], index.postings_docs[offsets[:-1]])
+    assert deltas.max() < index.postings_docs.max()
+    loaded = LexicalIndex(str(path))
+    for field in ("terms", "offsets", "postings_docs", "postings_tfs", "doc_ids", "doc_lengths"):
+        assert np.array_equal(getattr(loaded, field), getattr(index, field)), field
+    assert loaded.search("term1 shared") == index.search("term1 shared")
+
+def test_saves_in_several_steps_match_one_build(workdir):
+    whole = build(workdir / "whole.npz")
+    items = list(CHUNKS.items())
+    build(workdir / "parts.npz", dict(items[:2]))
+    parts = LexicalIndex(str(workdir / "parts.npz"))
+    parts.add([chunk_id for chunk_id, _ in items[2:]], [text for _, text in items[2:]])
+    parts.save()
+    parts = LexicalIndex(str(workdir / "parts.npz"))
+    assert len(parts) == len(whole)
+    for query in ("custom modes json", "model selector", "ollama serve running"):
+        assert parts.search(query) == pytest.approx(whole.search(query))
+
+def test_remove_drops_chunks_and_their_terms(workdir):
+    index = build(workdir / "index.npz")
+    index.remove(["ollama"])
+    index.save()
+    index = LexicalIndex(str(workdir / "index.npz"))
+    assert len(index) == 4
+    assert index.search("ECONNREFUSED") == []
+    assert "econnrefused" not in set(index.terms)
+
+def test_re_added_chunk_replaces_its_text(workdir):
+    index = build(workdir / "index.npz")
+    index.add(["slash"], ["Slash commands moved to the prompts panel"])
+    index.add(["staged"], ["Staged and removed before saving"])
+    index.remove(["staged"])
+    index.save()
+    index = LexicalIndex(str(workdir / "index.npz"))
+    assert sorted(index.doc_ids) == sorted(CHUNKS)
+    assert index.search(".roo") == []
+    assert ids(index.search("prompts panel")) == ["slash"]
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from index_generation import bump_generation, read_generation
+from mmap_index import MmapVectorIndex, export_collection
+from search_filters import SearchFilters
+
+DIMENSIONS = 16
+
+class FakeCollection:
+    """The slice of a chromadb collection the export reads; `get` returns rows shuffled, as Chroma may."""
+
+    def __init__(self, count, space="l2", seed=0):
+        rng = np.random.default_rng(seed)
+        self.metadata = {"hnsw:space": space}
+        self.ids = [f"chunk-{i:04d}" for i in range(count)]
+        self.embeddings = rng.normal(size=(count, DIMENSIONS)).astype(np.float32)
+        self.documents = [f"text {i}" for i in range(count)]
+        self.metadatas = [
+            {"source_type": ("reddit", "github")[i % 2], "score": i, **({"subreddit": "RooCode"} if i % 2 == 0 else {"repo": f"example/repo-{i % 3}"})}
+            for i in range(count)
+        ]
+        self.rng = rng
+
+    def get(self, ids=None, include=()):
+        rows = [self.ids.index(chunk_id) for chunk_id in ids] if ids is not None else list(range(len(self.ids)))
+        rows = list(self.rng.permutation(rows))
+        return {
+            "ids": [self.ids[row] for row in rows],
+            "embeddings": [self.embeddings[row] for row in rows],
+            "documents": [self.documents[row] for row in rows],
+            "metadatas": [self.metadatas[row] for row in rows]
+        }
+
+def exact_top_k(collection, query, k, rows=None):
+    rows = np.arange(len(collection.ids)) if rows is None else np.asarray(rows)
+    vectors = collection.embeddings[rows]
+    if collection.metadata["hnsw:space"] == "cosine":
+        distances = 1.0 - (vectors @ query) / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    else:
+        distances = np.sum((vectors - query) ** 2, axis=1)
+    return [collection.ids[row] for row in rows[np.argsort(distances)[:k]]]
+
+@pytest.fixture
+def exported(workdir):
+    collection = FakeCollection(300)
+    export_collection(collection, str(workdir / "index"), "reddit_github", page_size=64)
+    return collection, MmapVectorIndex(str(workdir / "index"))
+
+def test_export_keeps_every_chunk(exported):
+    collection, index = exported
+    assert len(index) == 300
+    document = index.get_documents(["chunk-0007"])["chunk-0007"]
+    assert document.page_content == "text 7"
+    assert document.metadata == collection.metadatas[7]
+
+@pytest.mark.parametrize("space", ["l2", "cosine"])
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_search_matches_exact_top_k(workdir, space, dtype):
+    collection = FakeCollection(300, space=space)
+    export_collection(collection, str(workdir / "index"), "reddit_github", dtype=dtype)
+    index = MmapVectorIndex(str(workdir / "index"))
+    queries = np.random.default_rng(1).normal(size=(5, DIMENSIONS)).astype(np.float32)
+    for query, results in zip(queries, index.search_batch(queries, 10)):
+        assert [document.id for document, _ in results] == exact_top_k(collection, query, 10)
+        distances = [distance for _, distance in results]
+        assert distances == sorted(distances)
+
+def test_filters_are_applied_before_the_top_k(exported):
+    collection, index = exported
+    query = np.random.default_rng(2).normal(size=DIMENSIONS).astype(np.float32)
+    filters = SearchFilters(sources=["github"], repos=["example/repo-1"], min_score=100)
+    allowed = [
+        row for row, metadata in enumerate(collection.metadatas)
+        if metadata["source_type"] == "github" and metadata.get("repo") == "example/repo-1" and metadata["score"] >= 100
+    ]
+    results = index.search(query, 5, filters)
+    assert [document.id for document, _ in results] == exact_top_k(collection, query, 5, allowed)
+    assert index.get_documents(["chunk-0000", collection.ids[allowed[0]]], filters).keys() == {collection.ids[allowed[0]]}
+
+def test_export_is_current_until_its_collection_is_ingested(exported):
+    _, index = exported
+    assert read_generation() == 1
+    bump_generation(collection="pdfs")
+    assert index.is_current()
+    bump_generation(collection="reddit_github")
+    assert not index.is_current()
@@ -0,0 +1,55 @@
+from langchain_core.documents import Document
+from model_router import ModelRouter
+import pytest
+
+MODEL = "llama3:8b"
+FAST_MODEL = "qwen2.5:1.5b"
+
+@pytest.fixture
+def router():
+    return ModelRouter(FAST_MODEL)
+
+@pytest.mark.parametrize("question", [
+    "What is a custom mode?",
+    "Where are custom modes defined?",
+    "What's the default model?",
+    "List the slash commands",
+    "Does Roo Code support MCP?",
+    "Name the built-in modes"
+])
+def test_lookup_goes_to_the_fast_model(router, question):
+    route = router.route(question, MODEL)
+    assert route.model == FAST_MODEL
+    assert route.reason.startswith("lookup")
+
+@pytest.mark.parametrize("question", [
+    "Namespace collisions between modes",
+    "Listen for file changes in a mode",
+    "Doesn't the fast model get used?",
+    "Whoever set the default model"
+])
+def test_prefix_inside_a_longer_word_is_not_a_lookup(router, question):
+    route = router.route(question, MODEL)
+    assert route.model == MODEL
+    assert route.reason == "default"
+
+def test_reasoning_keyword_goes_to_the_main_model(router):
+    route = router.route("What is the difference between modes?", MODEL)
+    assert route.model == MODEL
+    assert route.reason == "needs reasoning ('difference')"
+
+def test_long_question_goes_to_the_main_model(router):
+    assert router.route("Where " + "and more " * 10 + "?", MODEL).reason.startswith("long question")
+
+def test_confident_retrieval_goes_to_the_fast_model(router):
+    docs = [Document(page_content="Custom modes", metadata={"vector_distance": 0.3, "lexical_score": 4.0})]
+    assert router.route("Custom modes file location", MODEL, docs).model == FAST_MODEL
+
+def test_saturated_fast_model_falls_back(router):
+    router.queue_depth = lambda model: 2
+    route = router.route("What is a custom mode?", MODEL)
+    assert route.model == MODEL
+    assert route.reason.startswith("fast model saturated")
+
+def test_no_fast_model_disables_routing():
+    assert ModelRouter().route("What is a custom mode?", MODEL).reason == "routing disabled"
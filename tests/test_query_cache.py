@@ -0,0 +1,75 @@
+import math
+
+from langchain_core.documents import Document
+from query_cache import QueryCache
+import query_cache
+import pytest
+
+DOCS = [Document(page_content="Custom modes live in .roomodes", metadata={"source_type": "github"})]
+EMBEDDING = [1.0, 0.0]
+
+def rotated(cosine):
+    """A 2-d vector at the given cosine similarity to EMBEDDING."""
+    return [cosine, math.sqrt(1.0 - cosine * cosine)]
+
+def test_normalised_text_is_an_exact_hit():
+    cache = QueryCache()
+    cache.put("How do custom modes work?", DOCS)
+    assert cache.get("  how do CUSTOM modes work ") is DOCS
+    assert cache.stats()["exact_hits"] == 1
+
+def test_similar_embedding_is_a_semantic_hit():
+    cache = QueryCache()
+    cache.put("How do custom modes work?", DOCS, embedding=EMBEDDING)
+    assert cache.get("Explain custom modes", embedding=rotated(0.96)) is DOCS
+    assert cache.stats()["semantic_hits"] == 1
+
+@pytest.mark.parametrize("cosine", [0.94, 0.5, 0.0])
+def test_embedding_below_the_threshold_misses(cosine):
+    cache = QueryCache()
+    cache.put("How do custom modes work?", DOCS, embedding=EMBEDDING)
+    assert cache.get("Something else", embedding=rotated(cosine)) is None
+    assert cache.stats()["misses"] == 1
+
+def test_scope_keeps_filtered_results_apart():
+    cache = QueryCache()
+    cache.put("custom modes", DOCS, embedding=EMBEDDING, scope="sources=github")
+    assert cache.get("custom modes") is None
+    assert cache.get("custom modes", embedding=EMBEDDING) is None
+    assert cache.get("custom modes", embedding=EMBEDDING, scope="sources=github") is DOCS
+
+def test_new_generation_drops_every_entry():
+    cache = QueryCache()
+    cache.put("custom modes", DOCS, embedding=EMBEDDING, generation=3)
+    assert cache.get("custom modes", generation=3) is DOCS
+    assert cache.get("custom modes", embedding=EMBEDDING, generation=4) is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["generation"] == 4
+    # an entry from the old generation isn't served after going back either
+    assert cache.get("custom modes", generation=3) is None
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.put("first", DOCS)
+    cache.put("second", DOCS)
+    cache.get("first")
+    cache.put("third", DOCS)
+    assert cache.get("second") is None
+    assert cache.get("first") is DOCS and cache.get("third") is DOCS
+
+class Clock:
+    now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+def test_entries_expire(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache, "time", clock)
+    cache = QueryCache(ttl_seconds=60)
+    cache.put("custom modes", DOCS, embedding=EMBEDDING)
+    clock.now += 59
+    assert cache.get("custom modes") is DOCS
+    clock.now += 2
+    assert cache.get("custom modes", embedding=EMBEDDING) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,62 @@
+from fake_github import FakeGitHub
+from scrape_github import GitHubScraper
+import pytest
+
+@pytest.fixture
+def github():
+    fake = FakeGitHub.generate(repos=2, docs=3, releases=2, issues=5, port=0).start()
+    yield fake
+    fake.stop()
+
+def scraper(github, workdir, cache="github_cache"):
+    return GitHubScraper({
+        "repos": sorted(github.repos),
+        "api_url": github.url,
+        "output_file": str(workdir / "github_data.jsonl"),
+        "cache_dir": str(workdir / cache)
+    })
+
+def scrape(github, workdir, cache="github_cache"):
+    return scraper(github, workdir, cache).run()
+
+def by_id(records):
+    return {record["id"]: record for record in records}
+
+def test_writes_every_document_type(github, workdir):
+    records = scrape(github, workdir)
+    # per repo: the repo, 4 docs (3 pages and the README), 2 releases, 5 issues
+    assert len(records) == 2 * (1 + 4 + 2 + 5)
+    assert {record["type"] for record in records} == {"repo", "doc", "release", "issue"}
+    assert "github:example/repo-0:doc:README.md" in by_id(records)
+
+def test_unchanged_repos_are_served_from_the_cache(github, workdir):
+    first = scrape(github, workdir)
+    requests = github.requests
+    second = scraper(github, workdir)
+    assert second.run() == first
+    # every listing is revalidated with its ETag, and no doc blob is downloaded again
+    assert github.not_modified == github.requests - requests
+    assert second.client.blob_cache_hits == 2 * 4
+
+def test_changed_doc_is_downloaded_again(github, workdir):
+    scrape(github, workdir)
+    github.set_doc("example/repo-1", "README.md", "# repo-1\n\nUpdated.")
+    records = by_id(scrape(github, workdir))
+    assert records["github:example/repo-1:doc:README.md"]["text"] == "# repo-1\n\nUpdated."
+
+def test_failed_repo_without_cache_keeps_its_previous_records(github, workdir):
+    first = scrape(github, workdir)
+    github.failing_repos.add("example/repo-1")
+    # a fresh cache, so there is no cached copy to fall back on
+    second = scrape(github, workdir, cache="empty_cache")
+    assert second == first
+
+def test_failed_repo_with_cache_uses_the_cached_copy(github, workdir):
+    first = scrape(github, workdir)
+    github.failing_repos.add("example/repo-1")
+    assert scrape(github, workdir) == first
+
+def test_failed_repo_on_the_first_run_is_left_out(github, workdir):
+    github.failing_repos.add("example/repo-1")
+    records = scrape(github, workdir)
+    assert {record["repo"] for record in records} == {"example/repo-0"}
@@ -0,0 +1,82 @@
+import json
+
+from fake_reddit import FakeReddit
+from scrape_reddit import RedditScraper
+import pytest
+
+@pytest.fixture
+def reddit():
+    return FakeReddit.generate(posts=8, comments=5, seed=1)
+
+def scrape(reddit, workdir, **config):
+    return RedditScraper(reddit.client, {
+        "subreddit": reddit.subreddit,
+        "post_limit": 20,
+        "output_file": str(workdir / "reddit_data.jsonl"),
+        "checkpoint_file": str(workdir / "reddit_checkpoint.json"),
+        "requests_per_minute": 60000,
+        **config
+    }).run()
+
+def read_records(workdir):
+    with open(workdir / "reddit_data.jsonl") as f:
+        return [json.loads(line) for line in f]
+
+def read_checkpoint(workdir):
+    with open(workdir / "reddit_checkpoint.json") as f:
+        return json.load(f)["fake"]
+
+def test_first_run_writes_every_post_and_comment(reddit, workdir):
+    assert scrape(reddit, workdir) == 8 * 6
+    records = read_records(workdir)
+    assert sum(record["type"] == "post" for record in records) == 8
+    assert len({record["id"] for record in records}) == len(records)
+    checkpoint = read_checkpoint(workdir)
+    assert checkpoint["last_post_id"] == max((post["id"] for post in reddit.posts), key=lambda post_id: int(post_id, 36))
+    assert checkpoint["failed_posts"] == []
+
+def test_second_run_writes_only_new_content(reddit, workdir):
+    scrape(reddit, workdir)
+    assert scrape(reddit, workdir) == 0
+    post_id = reddit.add_post("A new post", "Body")
+    reddit.add_comment(post_id, "A reply on the new post")
+    comment_id = reddit.add_comment(reddit.posts[0]["id"], "A late reply on an old post")
+    assert scrape(reddit, workdir) == 3
+    records = read_records(workdir)
+    assert len({record["id"] for record in records}) == len(records) == 8 * 6 + 3
+    assert {post_id, comment_id} <= {record["id"] for record in records}
+
+def test_failed_post_is_retried_on_the_next_run(reddit, workdir):
+    failing = reddit.posts[3]["id"]
+    reddit.failing_posts.add(failing)
+    assert scrape(reddit, workdir) == 7 * 6
+    assert read_checkpoint(workdir)["failed_posts"] == [failing]
+
+    reddit.failing_posts.clear()
+    assert scrape(reddit, workdir) == 6
+    records = read_records(workdir)
+    assert len({record["id"] for record in records}) == len(records) == 8 * 6
+    assert read_checkpoint(workdir)["failed_posts"] == []
+
+def test_interrupted_run_skips_completed_posts(reddit, workdir):
+    completed = reddit.posts[0]["id"]
+    with open(workdir / "reddit_checkpoint.json", "w") as f:
+        json.dump({"fake": {"last_post_id": None, "last_comment_id": None, "completed_posts": [completed], "failed_posts": []}}, f)
+    assert scrape(reddit, workdir) == 7 * 6
+    assert completed not in {record["id"] for record in read_records(workdir)}
+
+def test_reply_to_a_post_finished_by_an_interrupted_run_is_kept(reddit, workdir):
+    scrape(reddit, workdir)
+    post_id = reddit.add_post("A post finished before the interruption", "Body")
+    # the interrupted run wrote this post's tree, then stopped before updating the checkpoint's IDs
+    checkpoint = json.loads((workdir / "reddit_checkpoint.json").read_text())
+    checkpoint["fake"]["completed_posts"] = [post_id]
+    (workdir / "reddit_checkpoint.json").write_text(json.dumps(checkpoint))
+    comment_id = reddit.add_comment(post_id, "A reply after the interruption")
+    scrape(reddit, workdir)
+    scrape(reddit, workdir)
+    assert comment_id in {record["id"] for record in read_records(workdir)}
+
+def test_non_jsonl_output_is_written_as_jsonl(reddit, workdir):
+    scrape(reddit, workdir, output_file=str(workdir / "reddit_data.txt"))
+    assert len(read_records(workdir)) == 8 * 6
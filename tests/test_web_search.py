@@ -0,0 +1,115 @@
+from concurrent.futures import CancelledError
+import threading, time
+
+from converse import Converse
+from fake_web_search import FakeSearchBackend
+from langchain_core.documents import Document
+from search_filters import SearchFilters
+from web_search import WebSearch, WebSearchCache
+import web_search as web_search_module
+import pytest
+
+QUERY = "roo code custom modes"
+
+def web_search(workdir, backend, deadline_seconds=1.0):
+    return WebSearch(backend, WebSearchCache(str(workdir / "web_search_cache.sqlite3")), deadline_seconds=deadline_seconds)
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_results_are_cached(workdir):
+    backend = FakeSearchBackend()
+    search = web_search(workdir, backend)
+    first = search.search(QUERY)
+    assert len(first) == 3
+    # the cache key is the normalised query
+    assert search.search("  Roo Code custom MODES ") == first
+    assert backend.calls == 1
+    assert search.stats()["hits"] == 1
+
+def test_slow_search_misses_the_deadline_and_fills_the_cache(workdir):
+    backend = FakeSearchBackend(latency=0.5)
+    search = web_search(workdir, backend, deadline_seconds=0.1)
+    start_time = time.perf_counter()
+    assert search.search(QUERY) == []
+    assert time.perf_counter() - start_time < 0.4
+    assert search.stats()["timeouts"] == 1
+    # the search keeps running after the deadline, so the next question gets its results
+    wait_for(lambda: search.cache.get(QUERY, search.num_results) is not None)
+    assert len(search.search(QUERY)) == 3
+    assert backend.calls == 1
+
+def test_concurrent_searches_share_one_backend_call(workdir):
+    backend = FakeSearchBackend(latency=0.2)
+    search = web_search(workdir, backend)
+    futures = [search.submit(QUERY) for _ in range(5)]
+    assert all(len(future.result()) == 3 for future in futures)
+    assert backend.calls == 1
+
+def test_failing_backend_returns_no_results(workdir):
+    backend = FakeSearchBackend(fail=True)
+    search = web_search(workdir, backend)
+    assert search.search(QUERY) == []
+    assert search.stats()["errors"] == 1
+
+def test_cancelled_search_still_fills_the_cache(workdir):
+    backend = FakeSearchBackend(latency=0.3)
+    search = web_search(workdir, backend)
+    future = search.submit(QUERY)
+    wait_for(lambda: backend.calls == 1)
+    future.cancel()
+    with pytest.raises(CancelledError):
+        future.result()
+    wait_for(lambda: search.cache.get(QUERY, search.num_results) is not None)
+    assert search.search(QUERY) and backend.calls == 1
+
+def test_documents_are_web_sources(workdir):
+    search = web_search(workdir, FakeSearchBackend())
+    docs = search.documents(search.submit(QUERY))
+    assert len(docs) == 3
+    assert {doc.metadata["source_type"] for doc in docs} == {"web"}
+
+def test_one_off_search_leaves_no_loop_thread_behind(workdir, monkeypatch):
+    backend = FakeSearchBackend()
+    monkeypatch.setattr(web_search_module, "DdgrBackend", lambda: backend)
+    loops = lambda: sum(thread.name == "web-search" for thread in threading.enumerate())
+    running = loops()
+    for _ in range(3):
+        assert len(web_search_module.web_search(QUERY)) == 3
+    assert loops() == running
+    assert backend.calls == 1
+
+class FakeRetriever:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def search(self, question, filters=None):
+        if self.fail:
+            raise RuntimeError("retrieval failed")
+        return [Document(page_content="Custom modes live in .roomodes", metadata={"source_type": "github"})], {}
+
+def conversation(search, retriever):
+    return Converse(embedding_function=object(), vectorstore=object(), retriever=retriever, web_search=search)
+
+def test_converse_appends_web_results_to_retrieved_documents(workdir):
+    search = web_search(workdir, FakeSearchBackend())
+    docs = conversation(search, FakeRetriever()).retrieve(QUERY)
+    assert [doc.metadata["source_type"] for doc in docs] == ["github", "web", "web", "web"]
+
+def test_converse_skips_the_web_when_filtered_out(workdir):
+    backend = FakeSearchBackend()
+    docs = conversation(web_search(workdir, backend), FakeRetriever()).retrieve(QUERY, SearchFilters(sources=["github"]))
+    assert len(docs) == 1
+    assert backend.calls == 0
+
+def test_converse_cancels_the_search_when_retrieval_fails(workdir):
+    search = web_search(workdir, FakeSearchBackend(latency=0.3))
+    submitted = []
+    submit = search.submit
+    search.submit = lambda query: submitted.append(submit(query)) or submitted[-1]
+    with pytest.raises(RuntimeError):
+        conversation(search, FakeRetriever(fail=True)).retrieve(QUERY)
+    assert submitted[0].cancelled()
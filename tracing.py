@@ -0,0 +1,284 @@
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+import atexit, contextvars, json, logging, os, queue, random, threading, time
+
+TRACING_ENABLED = True
+# Traces at least this slow are always written to the trace log, with every span
+SLOW_QUERY_SECONDS = 10.0
+# Share of the other traces written to the trace log too, for a baseline to compare slow ones against
+TRACE_SAMPLE_RATE = 0.01
+TRACE_LOG_PATH = "./query_traces.jsonl"
+# Prometheus text-format metrics, rewritten every METRICS_WRITE_SECONDS (node_exporter textfile format)
+METRICS_PATH = "./metrics.prom"
+METRICS_WRITE_SECONDS = 15
+# Finished traces waiting for the writer; beyond this they are dropped (and counted) rather than block a query
+MAX_PENDING_TRACES = 10000
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Characters of the question kept in a trace
+MAX_QUESTION_CHARS = 200
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+class Trace:
+    """Timed spans of one query. Spans can be added from any thread the trace's context was copied to."""
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.spans = []
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.seconds = None
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter())
+
+    def add_span(self, name, start, end):
+        """Record a span from `time.perf_counter()` readings."""
+        self.spans.append((name, start - self._start, end - start))
+
+    def annotate(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "trace": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "total_ms": round(1000.0 * self.seconds, 2),
+            "attributes": self.attributes,
+            "spans": [{"name": name, "start_ms": round(1000.0 * offset, 2), "duration_ms": round(1000.0 * seconds, 2)} for name, offset, seconds in self.spans]
+        }
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the `fraction` quantile (None past the last bound)."""
+        target = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return BUCKETS[i] if i < len(BUCKETS) else None
+        return None
+
+class Tracer:
+    """Collects query traces and aggregates them off the query path.
+
+    `trace()` opens a trace and makes it current, and the module-level `span()`
+    times a stage of whatever trace is current (a no-op when there is none).
+    Finished traces go onto a bounded queue. A background thread folds every
+    span into per-stage histograms, writes slow traces (and a random sample of
+    the rest) to `trace_log_path` as JSON lines, and rewrites `metrics_path`
+    in Prometheus text format. A query never waits on disk.
+    """
+
+    def __init__(self, trace_log_path=TRACE_LOG_PATH, metrics_path=METRICS_PATH, slow_seconds=SLOW_QUERY_SECONDS, sample_rate=TRACE_SAMPLE_RATE, enabled=TRACING_ENABLED):
+        self.trace_log_path = trace_log_path
+        self.metrics_path = metrics_path
+        self.slow_seconds = slow_seconds
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self.dropped = 0
+        self.logged = 0
+        self._traces = {}
+        self._spans = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=MAX_PENDING_TRACES)
+        if enabled:
+            threading.Thread(target=self._run, name="trace-writer", daemon=True).start()
+
+    def start(self, name, **attributes):
+        """Open a trace without making it current; pair with `finish()`."""
+        if "question" in attributes:
+            attributes["question"] = attributes["question"][:MAX_QUESTION_CHARS]
+        return Trace(name, attributes)
+
+    def finish(self, trace):
+        if trace.seconds is not None:
+            return
+        trace.seconds = time.perf_counter() - trace._start
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """Open a trace, make it current for the block (and threads/tasks started from it), then finish it."""
+        trace = self.start(name, **attributes)
+        with use_trace(trace):
+            try:
+                yield trace
+            finally:
+                self.finish(trace)
+
+    def flush(self):
+        """Wait until every finished trace has been aggregated and logged, and rewrite the metrics file."""
+        self._queue.join()
+        self._write_metrics()
+
+    def stats(self):
+        """{span name: {count, mean_ms, p50_ms, p95_ms}}, p50/p95 as histogram bucket bounds."""
+        def ms(seconds):
+            return 1000.0 * seconds if seconds is not None else None
+
+        with self._lock:
+            return {
+                name: {
+                    "count": histogram.count,
+                    "mean_ms": ms(histogram.sum / histogram.count),
+                    "p50_ms": ms(histogram.quantile(0.5)),
+                    "p95_ms": ms(histogram.quantile(0.95))
+                }
+                for name, histogram in sorted(self._spans.items()) if histogram.count
+            }
+
+    def render_metrics(self):
+        """All histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for family, label, histograms in (
+                ("scraper2notebook_trace_seconds", "trace", self._traces),
+                ("scraper2notebook_span_seconds", "span", self._spans)
+            ):
+                lines.append(f"# TYPE {family} histogram")
+                for name, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{family}_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{family}_sum{{{label}="{name}"}} {histogram.sum:.6f}')
+                    lines.append(f'{family}_count{{{label}="{name}"}} {histogram.count}')
+        lines.append("# TYPE scraper2notebook_traces_dropped_total counter")
+        lines.append(f"scraper2notebook_traces_dropped_total {self.dropped}")
+        lines.append("# TYPE scraper2notebook_traces_logged_total counter")
+        lines.append(f"scraper2notebook_traces_logged_total {self.logged}")
+        return "\n".join(lines) + "\n"
+
+    def _run(self):
+        last_write = time.monotonic()
+        while True:
+            try:
+                trace = self._queue.get(timeout=METRICS_WRITE_SECONDS)
+            except queue.Empty:
+                trace = None
+            if trace is not None:
+                try:
+                    self._record(trace)
+                except Exception as e:
+                    logging.error(f"Tracing: could not record trace '{trace.name}': {e}")
+                finally:
+                    self._queue.task_done()
+            if time.monotonic() - last_write >= METRICS_WRITE_SECONDS:
+                self._write_metrics()
+                last_write = time.monotonic()
+
+    def _record(self, trace):
+        with self._lock:
+            self._traces.setdefault(trace.name, Histogram()).observe(trace.seconds)
+            for name, _, seconds in trace.spans:
+                self._spans.setdefault(name, Histogram()).observe(seconds)
+        slow = trace.seconds >= self.slow_seconds
+        if self.trace_log_path and (slow or random.random() < self.sample_rate):
+            record = trace.to_dict()
+            record["slow"] = slow
+            with open(self.trace_log_path, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+            self.logged += 1
+
+    def _write_metrics(self):
+        if not self.metrics_path:
+            return
+        try:
+            tmp_path = self.metrics_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.render_metrics())
+            os.replace(tmp_path, self.metrics_path)
+        except OSError as e:
+            logging.error(f"Tracing: could not write {self.metrics_path}: {e}")
+
+@contextmanager
+def use_trace(trace):
+    """Make `trace` current for the block, e.g. inside a streaming generator that outlives its request handler."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # an async generator closed from another task's context; that context ends with it anyway
+            pass
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def span(name):
+    """Time a stage of the current trace; does nothing outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+def annotate(**attributes):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.annotate(**attributes)
+
+def in_context(fn):
+    """Wrap `fn` to run in a copy of the caller's context, so a thread pool worker sees the current trace."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+_tracer = None
+_tracer_lock = threading.Lock()
+_query_log_listener = None
+
+def configure_query_log(path="query_log.txt"):
+    """Send `logging` records to `path` through a queue, so the query path never waits on the file.
+
+    Like `logging.basicConfig`, only the first call in a process does anything (Streamlit reruns the app script).
+    """
+    global _query_log_listener
+    with _tracer_lock:
+        if _query_log_listener is not None:
+            return _query_log_listener
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+        _query_log_listener = QueueListener(queue.Queue(-1), handler)
+        root = logging.getLogger()
+        root.setLevel(logging.INFO)
+        root.addHandler(QueueHandler(_query_log_listener.queue))
+        _query_log_listener.start()
+        # write out what is still queued when the process exits
+        atexit.register(_query_log_listener.stop)
+    return _query_log_listener
+
+def get_tracer():
+    """Return the process-wide `Tracer`, creating it on first use."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer()
+    return _tracer
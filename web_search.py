@@ -2,68 +2,256 @@
 """
 Web Search Function for Scraper2Notebook
 
-This script implements a simple web search function using DuckDuckGo's
-command-line tool 'ddgr'. It can be integrated with the RAG system
-to provide up-to-date information beyond the local knowledge base.
+Web search for the RAG system, to provide up-to-date information beyond the
+local knowledge base. Searches run asynchronously on a background event loop,
+so `Converse` can start one before the vector retrieval and collect it
+afterwards. A search gets at most `deadline_seconds` before its answer stops
+waiting for it. Results are cached on disk on the normalised query for
+`ttl_seconds`. A search that misses the deadline still finishes in the
+background and fills the cache.
+
+The default backend is DuckDuckGo's command-line tool 'ddgr'; pass any object
+with an async `search(query, num_results)` instead (see fake_web_search.py).
+
+Usage: python web_search.py <search query>
 """
 
-import subprocess
-import json
-import os
-import re
-import sys
+from langchain_core.documents import Document
+from query_cache import normalize_query
+import asyncio, json, logging, shutil, sqlite3, sys, threading, time
+
+WEB_SEARCH_CACHE_PATH = "./web_search_cache.sqlite3"
+DEFAULT_NUM_RESULTS = 3
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+# Most a web search may add to answer latency; it runs alongside retrieval, so usually it adds less
+DEFAULT_DEADLINE_SECONDS = 1.5
+# A ddgr process still running after this is killed
+DDGR_TIMEOUT_SECONDS = 20
+
+class DdgrBackend:
+    """Searches DuckDuckGo with the `ddgr` command-line tool, as a subprocess that doesn't block the event loop."""
+
+    def __init__(self, executable=None):
+        # looked up once instead of forking `which` on every search
+        self.executable = executable or shutil.which("ddgr")
+
+    @property
+    def available(self):
+        return self.executable is not None
+
+    async def search(self, query, num_results):
+        if self.executable is None:
+            raise RuntimeError("ddgr is not installed (macOS: brew install ddgr, Linux: sudo apt install ddgr)")
+        process = await asyncio.create_subprocess_exec(
+            self.executable, "--json", "--num", str(num_results), "--", query,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), DDGR_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise RuntimeError(f"ddgr exited with status {process.returncode}: {stderr.decode('utf-8', 'replace')[:200]}")
+        return json.loads(stdout) if stdout.strip() else []
+
+class WebSearchCache:
+    """Persistent search results keyed on (normalised query, number of results), expiring after `ttl_seconds`."""
+
+    def __init__(self, path=WEB_SEARCH_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS searches (key TEXT PRIMARY KEY, results TEXT, created_at REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS searches_created_at ON searches (created_at)")
+
+    def get(self, query, num_results):
+        """Return the cached result list, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT results, created_at FROM searches WHERE key = ?", (self._key(query, num_results),)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    def put(self, query, num_results, results):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO searches (key, results, created_at) VALUES (?, ?, ?)",
+                (self._key(query, num_results), json.dumps(results), now)
+            )
+            self._connection.execute("DELETE FROM searches WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._connection.execute(
+                "DELETE FROM searches WHERE key IN (SELECT key FROM searches ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM searches")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def _key(query, num_results):
+        return f"{num_results}:{normalize_query(query)}"
+
+class WebSearch:
+    """Cached web search with a hard deadline, run on its own event loop thread.
+
+    `submit()` returns a `concurrent.futures.Future` right away. The future
+    resolves to the result list within `deadline_seconds`: to [] if the backend
+    is slower or fails. Concurrent searches for the same query share one
+    backend call.
+    """
+
+    def __init__(self, backend=None, cache=None, num_results=DEFAULT_NUM_RESULTS, deadline_seconds=DEFAULT_DEADLINE_SECONDS):
+        self.backend = backend or DdgrBackend()
+        self.cache = cache if cache is not None else WebSearchCache()
+        self.num_results = num_results
+        self.deadline_seconds = deadline_seconds
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._pending = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="web-search", daemon=True)
+        self._thread.start()
+
+    def submit(self, query):
+        """Start searching for `query`; returns a Future for the result list."""
+        return asyncio.run_coroutine_threadsafe(self._search(query), self._loop)
 
-def web_search(query, num_results=3):
+    def search(self, query):
+        return self.submit(query).result()
+
+    def documents(self, future):
+        """Wait for a `submit()` future and return its results as `Document`s for the context packer."""
+        try:
+            # the deadline is enforced on the search loop; this only guards against a stalled loop
+            results = future.result(timeout=self.deadline_seconds + 1.0 if self.deadline_seconds is not None else None)
+        except Exception as e:
+            logging.error(f"Web search failed: {e}")
+            future.cancel()
+            return []
+        return to_documents(results)
+
+    def close(self):
+        """Stop the search loop and close the cache. Searches still running are abandoned."""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self.cache.close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "deadline_seconds": self.deadline_seconds
+        }
+
+    async def _search(self, query):
+        cached = await asyncio.to_thread(self.cache.get, query, self.num_results)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        key = normalize_query(query)
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.ensure_future(self._fetch(key, query))
+            # a search that outlives its deadline must not log "exception never retrieved"
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            # shielded, so a search past its deadline keeps running and still fills the cache
+            return await asyncio.wait_for(asyncio.shield(task), self.deadline_seconds)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logging.info(f"Web search: '{query}' missed the {self.deadline_seconds}s deadline")
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Web search for '{query}' failed: {e}")
+        return []
+
+    async def _fetch(self, key, query):
+        try:
+            results = await self.backend.search(query, self.num_results)
+            await asyncio.to_thread(self.cache.put, query, self.num_results, results)
+            return results
+        finally:
+            self._pending.pop(key, None)
+
+def to_documents(results):
+    return [
+        Document(
+            page_content=f"{result.get('title', '')}\n{result.get('abstract', '')}".strip(),
+            metadata={"source_type": "web", "collection": "web", "title": result.get("title", ""), "url": result.get("url", "")}
+        )
+        for result in results
+    ]
+
+_web_search = None
+_web_search_lock = threading.Lock()
+
+def get_web_search():
+    """Return the process-wide `WebSearch` with the ddgr backend, creating it on first use."""
+    global _web_search
+    if _web_search is None:
+        with _web_search_lock:
+            if _web_search is None:
+                _web_search = WebSearch()
+    return _web_search
+
+def web_search(query, num_results=DEFAULT_NUM_RESULTS):
     """
-    Perform a web search using DuckDuckGo via the ddgr command-line tool.
-    
+    Perform a web search through the cache, waiting for the backend as long as it takes.
+
     Args:
         query (str): The search query
         num_results (int): Number of results to return (default: 3)
-        
+
     Returns:
         list: A list of dictionaries containing search results
     """
+    # its own instance, as the shared one gives up at its deadline; closed so repeated calls leave no loop thread behind
+    search = WebSearch(num_results=num_results, deadline_seconds=None)
     try:
-        # Check if ddgr is installed
-        subprocess.run(["which", "ddgr"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError:
-        print("Error: ddgr is not installed. Please install it first:")
-        print("  macOS: brew install ddgr")
-        print("  Linux: sudo apt install ddgr (or equivalent)")
-        return []
-    
-    try:
-        # Run the ddgr command
-        cmd = ["ddgr", "--json", "--num", str(num_results), query]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        
-        # Parse the JSON output
-        if result.stdout:
-            try:
-                search_results = json.loads(result.stdout)
-                return search_results
-            except json.JSONDecodeError:
-                print(f"Error parsing search results: {result.stdout[:100]}...")
-                return []
-        else:
+        if not search.backend.available:
+            print("Error: ddgr is not installed. Please install it first:")
+            print("  macOS: brew install ddgr")
+            print("  Linux: sudo apt install ddgr (or equivalent)")
             return []
-    except subprocess.CalledProcessError as e:
-        print(f"Search error: {e}")
-        return []
+        return search.search(query)
+    finally:
+        search.close()
 
 def format_search_results(results):
     """Format search results into a readable string."""
     if not results:
         return "No search results found."
-    
+
     formatted = []
     for i, result in enumerate(results):
         formatted.append(f"{i+1}. {result.get('title', 'No title')}")
         formatted.append(f"   URL: {result.get('url', 'No URL')}")
         formatted.append(f"   {result.get('abstract', 'No description')}")
         formatted.append("")
-    
+
     return "\n".join(formatted)
 
 def main():
@@ -71,7 +259,7 @@ def main():
     if len(sys.argv) < 2:
         print("Usage: python web_search.py <search query>")
         sys.exit(1)
-    
+
     query = " ".join(sys.argv[1:])
     results = web_search(query)
     print(format_search_results(results))